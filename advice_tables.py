@@ -0,0 +1,272 @@
+"""
+Advice tables - pest advice and irrigation recommendations loaded from data/
+
+The tables are read once at import into immutable mappings. Every entry keeps
+its own JSON encoding, so a response that includes one has that text spliced
+in as-is instead of being rebuilt and re-serialized on every request.
+To add pests, crops or rules, edit the JSON files, or point the *_FILE
+environment variables at your own copies.
+"""
+
+import functools
+import json
+import math
+import os
+import threading
+import uuid
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+
+from flask.json.provider import DefaultJSONProvider
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Advice for the classes of the app.py pest model
+PEST_ADVICE_FILE = os.environ.get('PEST_ADVICE_FILE', os.path.join(DATA_DIR, 'pest_advice.json'))
+
+# Advice for the classes of the standalone pest_detection_api.py service
+PEST_API_ADVICE_FILE = os.environ.get('PEST_API_ADVICE_FILE', os.path.join(DATA_DIR, 'pest_detection_api_advice.json'))
+
+# Irrigation recommendation rules, crop tips and confidence notes
+IRRIGATION_RECOMMENDATIONS_FILE = os.environ.get('IRRIGATION_RECOMMENDATIONS_FILE',
+                                                 os.path.join(DATA_DIR, 'irrigation_recommendations.json'))
+
+# Marks where a fragment goes in the serialized output; includes a random part so request data cannot forge it
+_PLACEHOLDER = '\x00fragment-' + uuid.uuid4().hex + '-'
+
+
+def encode(value):
+    """Compact, key-sorted, ASCII-escaped JSON: the bytes Flask's jsonify produces"""
+    return json.dumps(value, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+
+
+class FrozenMapping(Mapping):
+    """Read-only dict with its JSON encoding precomputed"""
+
+    __slots__ = ('_data', 'json')
+
+    def __init__(self, value):
+        self._data = MappingProxyType({key: freeze(item) for key, item in value.items()})
+        self.json = encode(value)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'FrozenMapping({dict(self._data)!r})'
+
+
+class FrozenSequence(Sequence):
+    """Read-only list with its JSON encoding precomputed"""
+
+    __slots__ = ('_data', 'json')
+
+    def __init__(self, value):
+        self._data = tuple(freeze(item) for item in value)
+        self.json = encode(list(value))
+
+    def __getitem__(self, index):
+        return self._data[index]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, (str, bytes)):
+            return self._data == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'FrozenSequence({list(self._data)!r})'
+
+
+def freeze(value):
+    """Deep read-only copy of JSON data; dicts and lists carry their serialized form"""
+    if isinstance(value, Mapping):
+        return value if isinstance(value, FrozenMapping) else FrozenMapping(value)
+    if isinstance(value, (list, tuple, FrozenSequence)):
+        return value if isinstance(value, FrozenSequence) else FrozenSequence(value)
+    return value
+
+
+@functools.lru_cache(maxsize=None)
+def _placeholder(index):
+    """(placeholder string, its JSON encoding) for the index-th fragment of a response"""
+    placeholder = f'{_PLACEHOLDER}{index}'
+    return placeholder, json.dumps(placeholder)
+
+
+def dumps(obj, serialize=json.dumps, default=None, **kwargs):
+    """
+    Serialize obj with serialize(), splicing in the precomputed JSON of any
+    frozen values instead of encoding them again. default handles the other
+    types the encoder does not know.
+    """
+    fragments = {}
+
+    def encode_fragment(value):
+        if isinstance(value, (FrozenMapping, FrozenSequence)):
+            entry = fragments.get(id(value))
+            if entry is None:
+                entry = fragments[id(value)] = (_placeholder(len(fragments)), value)
+            return entry[0][0]
+        if default is not None:
+            return default(value)
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+    text = serialize(obj, default=encode_fragment, **kwargs)
+    for (_, encoded), fragment in fragments.values():
+        text = text.replace(encoded, fragment.json)
+    return text
+
+
+class FragmentJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that writes frozen table entries from their cached encoding"""
+
+    def dumps(self, obj, **kwargs):
+        default = kwargs.pop('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return dumps(obj, default=default, **kwargs)
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _format_template(value, **fields):
+    if isinstance(value, str):
+        return value.format(**fields)
+    if isinstance(value, dict):
+        return {key: _format_template(item, **fields) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_format_template(item, **fields) for item in value]
+    return value
+
+
+class AdviceTable:
+    """
+    Pest name (case-insensitive) -> frozen advice. The "fallback" in the file is
+    either the name of an entry or a template entry whose strings may use
+    {pest_name}.
+    """
+
+    def __init__(self, path):
+        data = _load(path)
+        self.path = path
+        self.entries = MappingProxyType({name.lower(): freeze(entry) for name, entry in data['pests'].items()})
+
+        fallback = data.get('fallback')
+        if isinstance(fallback, str):
+            self._fallback = self.entries[fallback.lower()]
+            self._template = None
+        else:
+            self._fallback = None
+            self._template = fallback
+        self._render_fallback = functools.lru_cache(maxsize=256)(self._render_fallback)
+
+    def _render_fallback(self, pest_name):
+        return freeze(_format_template(self._template, pest_name=pest_name))
+
+    def get(self, pest_name):
+        entry = self.entries.get(pest_name.lower())
+        if entry is not None:
+            return entry
+        if self._template is None:
+            return self._fallback
+        return self._render_fallback(pest_name)
+
+
+# Inputs the irrigation rules can test, in RecommendationTable.get() argument order
+RULE_FIELDS = ('soil_moisture', 'temperature', 'humidity', 'rainfall', 'confidence')
+
+
+def _compile_rule(rule):
+    """(value index, lower bound, upper bound, message); a rule without a field always matches"""
+    field = rule.get('field')
+    if field is None:
+        return len(RULE_FIELDS), -math.inf, math.inf, rule['message']
+    if field not in RULE_FIELDS:
+        raise ValueError(f"Unknown rule field {field!r}; expected one of {RULE_FIELDS}")
+    return RULE_FIELDS.index(field), rule.get('above', -math.inf), rule.get('below', math.inf), rule['message']
+
+
+class RecommendationTable:
+    """
+    Irrigation recommendation rules. Each branch (irrigation_needed /
+    no_irrigation) has a headline, groups of threshold rules where the first
+    match in a group is used, optional crop tips and closing lines; general
+    lines and a confidence group follow. The outcome of the rules selects a
+    message list that is built, frozen and serialized only the first time.
+    """
+
+    def __init__(self, path):
+        data = _load(path)
+        self.path = path
+        self.branches = {}
+        for needed, name in ((True, 'irrigation_needed'), (False, 'no_irrigation')):
+            branch = data[name]
+            self.branches[needed] = (
+                branch['headline'],
+                tuple(tuple(_compile_rule(rule) for rule in group) for group in branch.get('conditions', [])),
+                bool(branch.get('crop_advice', False)),
+                tuple(branch.get('closing', []))
+            )
+        self.crops = MappingProxyType(dict(data.get('crops', {})))
+        self.general = tuple(data.get('general', []))
+        self.confidence = tuple(_compile_rule(rule) for rule in data.get('confidence', []))
+        # Outcome key -> frozen list; bounded by the number of rule combinations in the table
+        self._lists = {}
+        self._rule_groups = {needed: (self.confidence,) + branch[1] for needed, branch in self.branches.items()}
+        self._lock = threading.Lock()
+
+    def get(self, crop_type, soil_moisture, temperature, humidity, rainfall, irrigation_needed, confidence):
+        values = (soil_moisture, temperature, humidity, rainfall, confidence, 0)
+        irrigation_needed = bool(irrigation_needed)
+        branch = self.branches[irrigation_needed]
+        crop = crop_type if branch[2] and crop_type in self.crops else None
+        key = [irrigation_needed, crop]
+        # First matching rule of each group (confidence first); -1 when none matches
+        for group in self._rule_groups[irrigation_needed]:
+            match = -1
+            for i, (field, above, below, _) in enumerate(group):
+                if above < values[field] < below:
+                    match = i
+                    break
+            key.append(match)
+        key = tuple(key)
+
+        recommendations = self._lists.get(key)
+        if recommendations is None:
+            recommendations = self._build(key, branch)
+        return recommendations
+
+    def _build(self, key, branch):
+        headline, groups, _, closing = branch
+        crop, confidence_match, matches = key[1], key[2], key[3:]
+
+        messages = [headline]
+        messages.extend(group[i][3] for group, i in zip(groups, matches) if i >= 0)
+        if crop is not None:
+            messages.append(self.crops[crop])
+        messages.extend(closing)
+        messages.extend(self.general)
+        if confidence_match >= 0:
+            messages.append(self.confidence[confidence_match][3])
+
+        with self._lock:
+            return self._lists.setdefault(key, FrozenSequence(messages))
+
+
+PEST_ADVICE = AdviceTable(PEST_ADVICE_FILE)
+PEST_API_ADVICE = AdviceTable(PEST_API_ADVICE_FILE)
+IRRIGATION_RECOMMENDATIONS = RecommendationTable(IRRIGATION_RECOMMENDATIONS_FILE)
@@ -1,42 +1,297 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 import joblib
 import numpy as np
-import pandas as pd
 import os
 import logging
 from datetime import datetime
 import traceback
-import tensorflow as tf
-from PIL import Image
-import base64
-from io import BytesIO
+import csv
+import io
+import json
+import math
+import pickle
+import threading
+import importlib
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from batching import MicroBatcher
+from coalescing import SingleFlight, array_key
+from tflite_backend import TFLITE_POOL_SIZE, TFLiteModel, load_interpreter_class, select_variant
+import image_preprocessing
+from result_cache import ResultCache, content_key
+from dense_inference import load_dense_network, max_abs_error
+from mapped_artifacts import load_artifact
+from compiled_model import CompiledKerasModel
+from feature_schema import FeatureSchema, FeatureError, is_records, predicts_by_max_probability
+from advice_tables import FragmentJSONProvider, PEST_ADVICE, IRRIGATION_RECOMMENDATIONS
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Static advice in responses is written from its pre-serialized JSON
+app.json = FragmentJSONProvider(app)
 CORS(app)
 
 # Global variable to store loaded models
 models = {}
 
+# Prometheus metrics served at /metrics
+REQUESTS = metrics.REGISTRY.counter('http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+REQUEST_ERRORS = metrics.REGISTRY.counter('http_request_errors_total', 'HTTP requests answered with a 4xx/5xx status', ('route', 'status'))
+REQUEST_LATENCY = metrics.REGISTRY.histogram('http_request_duration_seconds', 'End-to-end request latency', ('route', 'method'))
+STAGE_LATENCY = metrics.REGISTRY.histogram(
+    'inference_stage_duration_seconds',
+    'Latency of each request stage (body_parse, base64_decode, decode, resize, normalize, encode, model_predict, serialize)',
+    ('route', 'stage')
+)
+MODEL_LOADS = metrics.REGISTRY.counter('model_loads_total', 'Model load attempts by model and result', ('model', 'result'))
+MODEL_LOAD_LATENCY = metrics.REGISTRY.histogram('model_load_duration_seconds', 'Time to load and warm a model', ('model',),
+                                                buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+MODEL_PREDICTIONS = metrics.REGISTRY.counter('model_predictions_total', 'ModelManager.predict calls by model and result', ('model', 'result'))
+MODEL_PREDICT_LATENCY = metrics.REGISTRY.histogram('model_predict_duration_seconds', 'ModelManager.predict latency', ('model',))
+MODEL_COALESCED = metrics.REGISTRY.counter('model_predictions_coalesced_total', 'Predictions answered by an identical request already in flight', ('model',))
+
+def stage(name):
+    """Time one stage of the current request into inference_stage_duration_seconds"""
+    return STAGE_LATENCY.time(route=metrics.current_route.get(), stage=name)
+
+def record_stages(timings):
+    """Record the per-stage seconds collected by image_preprocessing"""
+    route = metrics.current_route.get()
+    for name, seconds in timings.items():
+        if seconds:
+            STAGE_LATENCY.observe(seconds, route=route, stage=name)
+
+def record_request(route, method, status, seconds):
+    REQUESTS.inc(route=route, method=method, status=status)
+    REQUEST_LATENCY.observe(seconds, route=route, method=method)
+    if status >= 400:
+        REQUEST_ERRORS.inc(route=route, status=status)
+
+# Models are registered from this manifest at startup and loaded on first use
+MODEL_MANIFEST = os.environ.get('MODEL_MANIFEST', os.path.join('models', 'manifest.json'))
+# Memory budget for loaded models; least recently used models are evicted above it (0 disables)
+MODEL_MEMORY_BUDGET_MB = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 1024))
+
+# Load registered models in the background at startup, this many at a time
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'true').lower() == 'true'
+MODEL_LOAD_WORKERS = int(os.environ.get('MODEL_LOAD_WORKERS', 4))
+
+# Wrap TensorFlow models in bucketed, pre-traced functions and warm every model when it loads
+TF_COMPILE_MODELS = os.environ.get('TF_COMPILE_MODELS', 'true').lower() == 'true'
+MODEL_WARMUP_ON_LOAD = os.environ.get('MODEL_WARMUP_ON_LOAD', 'true').lower() == 'true'
+
+# Budgets for choosing between the quantized variants of a tflite model (0 disables; see quantize_model.py)
+MODEL_LATENCY_BUDGET_MS = float(os.environ.get('MODEL_LATENCY_BUDGET_MS', 0))
+MODEL_VARIANT_MEMORY_MB = float(os.environ.get('MODEL_VARIANT_MEMORY_MB', 0))
+
+# Identical concurrent predictions run the model once and share the result
+PREDICT_COALESCING = os.environ.get('PREDICT_COALESCING', 'true').lower() == 'true'
+
+# Micro-batching settings for pest model inference. A request that arrives while no other is queued
+# runs at once; otherwise the batch waits up to PEST_BATCH_MAX_WAIT_MS to fill (more throughput, more latency)
+PEST_BATCH_MAX_SIZE = int(os.environ.get('PEST_BATCH_MAX_SIZE', 16))
+PEST_BATCH_MAX_WAIT_MS = float(os.environ.get('PEST_BATCH_MAX_WAIT_MS', 10))
+
+# Limits for the multi-image pest detection endpoint
+PEST_UPLOAD_MAX_IMAGES = int(os.environ.get('PEST_UPLOAD_MAX_IMAGES', 64))
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', min(8, os.cpu_count() or 1)))
+
+# Pest detection result cache (set PEST_CACHE_DB to an empty string to keep it in memory only)
+PEST_CACHE_MAX_ENTRIES = int(os.environ.get('PEST_CACHE_MAX_ENTRIES', 2048))
+PEST_CACHE_TTL_SECONDS = float(os.environ.get('PEST_CACHE_TTL_SECONDS', 3600))
+PEST_CACHE_DB = os.environ.get('PEST_CACHE_DB', os.path.join('cache', 'pest_results.sqlite3'))
+PEST_CACHE_DISK_MAX_ENTRIES = int(os.environ.get('PEST_CACHE_DISK_MAX_ENTRIES', 200000))
+PEST_CACHE_DISK_TTL_SECONDS = float(os.environ.get('PEST_CACHE_DISK_TTL_SECONDS', 30 * 24 * 3600))
+
+# Irrigation inference backend: 'numpy' runs the dense network as plain matmuls, 'keras' uses model.predict
+IRRIGATION_INFERENCE = os.environ.get('IRRIGATION_INFERENCE', 'numpy')
+IRRIGATION_NUMPY_TOLERANCE = float(os.environ.get('IRRIGATION_NUMPY_TOLERANCE', 1e-4))
+# Artifacts an irrigation prediction depends on
+IRRIGATION_MODELS = ('irrigation_label_encoder', 'irrigation_scaler', 'irrigation_model', 'irrigation_model_numpy')
+
+# Memoized /api/predict-irrigation results (0 entries disables). Readings are rounded to these
+# bucket widths before scoring, so nearby readings share one cached prediction
+IRRIGATION_CACHE_MAX_ENTRIES = int(os.environ.get('IRRIGATION_CACHE_MAX_ENTRIES', 8192))
+IRRIGATION_CACHE_TTL_SECONDS = float(os.environ.get('IRRIGATION_CACHE_TTL_SECONDS', 0))
+IRRIGATION_CACHE_DEFAULT_BUCKETS = {'soil_moisture': 1.0, 'temperature': 0.1, 'humidity': 1.0, 'rainfall': 0.1}
+
+# Valid ranges for irrigation sensor readings, in model feature order after crop_type
+IRRIGATION_FEATURE_RANGES = (
+    ('soil_moisture', 0, 100, 'Soil moisture'),
+    ('temperature', -10, 50, 'Temperature'),
+    ('humidity', 0, 100, 'Humidity'),
+    ('rainfall', 0, 500, 'Rainfall')
+)
+
+def parse_bucket_widths(spec):
+    """Bucket width per reading from "name=width,..."; the defaults, with a warning, if any entry is invalid"""
+    names = {name for name, _, _, _ in IRRIGATION_FEATURE_RANGES}
+    widths = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        name, separator, width = (part.strip() for part in item.partition('='))
+        try:
+            width = float(width)
+        except ValueError:
+            width = None
+        if not separator or name not in names or width is None or not np.isfinite(width) or width < 0:
+            logger.warning(f"Invalid IRRIGATION_CACHE_BUCKETS entry {item.strip()!r} (expected one of "
+                           f"{', '.join(sorted(names))} = a width >= 0); using the default bucket widths")
+            return dict(IRRIGATION_CACHE_DEFAULT_BUCKETS)
+        widths[name] = width
+    return widths
+
+IRRIGATION_CACHE_BUCKETS = parse_bucket_widths(os.environ.get(
+    'IRRIGATION_CACHE_BUCKETS', 'soil_moisture=1,temperature=0.1,humidity=1,rainfall=0.1'
+))
+IRRIGATION_BULK_MAX_ROWS = int(os.environ.get('IRRIGATION_BULK_MAX_ROWS', 50000))
+
+# Largest scenario grid /api/predict-irrigation/sweep scores in one request
+IRRIGATION_SWEEP_MAX_POINTS = int(os.environ.get('IRRIGATION_SWEEP_MAX_POINTS', 200000))
+
+# Content types accepted as a raw image request body
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'application/octet-stream')
+
+# Modules each model type needs. They are imported one at a time before models load in
+# parallel, because first imports of the same package from several threads can deadlock
+FRAMEWORK_IMPORTS = {
+    'tensorflow': ('tensorflow',),
+    'pytorch': ('torch',),
+    'sklearn': ('sklearn',),
+    'scaler': ('sklearn.preprocessing',),
+    'label_encoder': ('sklearn.preprocessing',),
+    'numpy': ('h5py',)
+}
+
 class ModelManager:
     """Manages loading and prediction of machine learning models"""
     
-    def __init__(self):
+    def __init__(self, memory_budget_bytes=None):
         self.models = {}
         self.model_info = {}
+        self.registry = {}
+        self.batchers = {}
+        self.schemas = {}
+        self.flights = SingleFlight()
+        self.memory_budget_bytes = memory_budget_bytes
+        self._last_used = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._unpickle_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.warmup_status = {'state': 'not_started', 'models': {}, 'seconds': None}
     
-    def load_model(self, model_name, model_path, model_type='sklearn'):
+    def register_model(self, model_name, model_path, model_type='sklearn', pinned=False, **options):
+        """Register a model so it is loaded on first use instead of at startup"""
+        with self._lock:
+            self.unload_model(model_name)
+            self.registry[model_name] = {'path': model_path, 'type': model_type, 'pinned': pinned, **options}
+            self.model_info[model_name] = {
+                'path': model_path,
+                'type': model_type,
+                'fingerprint': file_fingerprint(model_path),
+                'loaded': False,
+                'pinned': pinned,
+                'memory_bytes': None,
+                'loaded_at': None
+            }
+    
+    def load_manifest(self, manifest_path):
+        """Register every model listed in a JSON manifest (paths are relative to the manifest)"""
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        
+        base_dir = os.path.dirname(manifest_path)
+        for entry in manifest.get('models', []):
+            entry = dict(entry)
+            model_name = entry.pop('name')
+            model_path = entry.pop('path')
+            if not os.path.isabs(model_path):
+                model_path = os.path.join(base_dir, model_path)
+            if not os.path.exists(model_path):
+                logger.warning(f"Skipping {model_name}: file not found at {model_path}")
+                continue
+            if 'variants' in entry:
+                entry['variants'] = [
+                    dict(variant, path=os.path.join(base_dir, variant['path']) if not os.path.isabs(variant['path']) else variant['path'])
+                    for variant in entry['variants']
+                ]
+            self.register_model(model_name, model_path, entry.pop('type', 'sklearn'), **entry)
+        
+        logger.info(f"Registered {len(self.registry)} models from {manifest_path}")
+    
+    def has_model(self, model_name):
+        """True if a model is loaded or registered and loadable"""
+        if model_name in self.models:
+            return True
+        return model_name in self.registry and 'error' not in self.model_info.get(model_name, {})
+    
+    def get_model(self, model_name):
+        """Return a model, loading it on first use"""
+        model = self.models.get(model_name)
+        if model is None:
+            if model_name not in self.registry:
+                raise ValueError(f"Model {model_name} not loaded")
+            
+            with self._lock:
+                load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+            with load_lock:
+                model = self.models.get(model_name)
+                if model is None:
+                    model = self._load_registered(model_name)
+                    if model is None:
+                        raise ValueError(f"Model {model_name} could not be loaded")
+        
+        with self._lock:
+            if model_name in self._last_used:
+                self._last_used.move_to_end(model_name)
+        return model
+    
+    def load_model(self, model_name, model_path, model_type='sklearn', **options):
         """Load a machine learning model from file"""
+        self.register_model(model_name, model_path, model_type, **options)
+        return self._load_registered(model_name) is not None
+    
+    def _load_registered(self, model_name):
+        """Load a registered model and evict idle models if over the memory budget; returns the model or None"""
+        entry = self.registry[model_name]
+        model_path = entry['path']
+        model_type = entry['type']
+        info = self.model_info[model_name]
+        load_start = time.perf_counter()
+        
         try:
-            if model_type == 'sklearn':
-                model = joblib.load(model_path)
+            extra_info = {}
+            if model_type in ('sklearn', 'metadata', 'scaler', 'label_encoder'):
+                # Unpickling can import arbitrary modules, so keep it to one thread at a time
+                with self._unpickle_lock:
+                    model = joblib.load(model_path)
             elif model_type == 'tensorflow':
                 import tensorflow as tf
                 model = tf.keras.models.load_model(model_path)
+                if TF_COMPILE_MODELS and entry.get('compile', True):
+                    model = self._compile_keras_model(model_name, model)
+            elif model_type == 'tflite':
+                pool_size = self.tflite_pool_size(model_name)
+                if entry.get('variants'):
+                    model_path, extra_info = self._select_tflite_variant(model_name, entry, pool_size)
+                model = TFLiteModel(model_path, pool_size=pool_size)
+                extra_info['pool_size'] = pool_size
+            elif model_type == 'numpy':
+                model, extra_info = self._build_dense_model(model_name, entry)
+            elif model_type == 'mapped':
+                # Arrays exported by mapped_artifacts.py, mapped read-only and shared with every other worker
+                with self._unpickle_lock:
+                    model, mapped_bytes = load_artifact(model_path, entry)
+                extra_info = {'kind': entry.get('kind'), 'mapped_bytes': mapped_bytes, 'source': entry.get('source')}
             elif model_type == 'pytorch':
                 import torch
                 model = torch.load(model_path, map_location='cpu')
@@ -44,106 +299,408 @@ class ModelManager:
             else:
                 raise ValueError(f"Unsupported model type: {model_type}")
             
-            self.models[model_name] = model
-            self.model_info[model_name] = {
-                'path': model_path,
-                'type': model_type,
-                'loaded_at': datetime.now().isoformat()
-            }
+            # Column order for dict payloads, fixed once per load
+            schema = None
+            if serving_type(entry) == 'sklearn':
+                schema = FeatureSchema.for_model(entry, model)
+                extra_info['features'] = schema.columns if schema is not None else None
+                extra_info['single_pass'] = entry.get('single_pass', predicts_by_max_probability(model))
+            elif entry.get('features'):
+                schema = FeatureSchema(entry['features'])
+                extra_info['features'] = schema.columns
             
-            logger.info(f"Successfully loaded model: {model_name}")
-            return True
+            # Pay tracing and first-run setup now rather than on the first request
+            if MODEL_WARMUP_ON_LOAD and hasattr(model, 'warm_up'):
+                start = time.monotonic()
+                model.warm_up()
+                extra_info['warmup_seconds'] = round(time.monotonic() - start, 3)
+            
+            memory_bytes = extra_info.get('mapped_bytes') or estimate_model_memory(model, model_path)
+            with self._lock:
+                self.models[model_name] = model
+                if schema is not None:
+                    self.schemas[model_name] = schema
+                else:
+                    self.schemas.pop(model_name, None)
+                self._last_used[model_name] = time.monotonic()
+                self._last_used.move_to_end(model_name)
+                info.pop('error', None)
+                info.update(extra_info)
+                info.update({
+                    'loaded': True,
+                    'memory_bytes': memory_bytes,
+                    'loaded_at': datetime.now().isoformat()
+                })
+                self._enforce_memory_budget(keep=model_name)
+            
+            MODEL_LOADS.inc(model=model_name, result='success')
+            MODEL_LOAD_LATENCY.observe(time.perf_counter() - load_start, model=model_name)
+            logger.info(f"Successfully loaded model: {model_name} ({memory_bytes / 1e6:.1f} MB)")
+            return model
             
         except Exception as e:
+            MODEL_LOADS.inc(model=model_name, result='error')
+            info['error'] = str(e)
             logger.error(f"Error loading model {model_name}: {str(e)}")
-            return False
+            return None
+    
+    def tflite_pool_size(self, model_name):
+        """Interpreters to keep for a tflite model: a micro-batched model is only ever run by its batcher's one thread"""
+        return 1 if model_name in self.batchers else TFLITE_POOL_SIZE
+    
+    def _select_tflite_variant(self, model_name, entry, pool_size=TFLITE_POOL_SIZE):
+        """Path and info of the quantized variant that fits this machine's latency and memory budgets"""
+        candidates = list(entry['variants'])
+        if not any(variant['path'] == entry['path'] for variant in candidates):
+            candidates.append({'name': 'default', 'path': entry['path']})
+        
+        forced = entry.get('variant')
+        if forced:
+            candidates = [variant for variant in candidates if variant['name'] == forced]
+            if not candidates:
+                raise ValueError(f"Model {model_name} has no variant named {forced}")
+            chosen, reports = select_variant(candidates, pool_size=pool_size, runs=1)
+        else:
+            chosen, reports = select_variant(
+                candidates,
+                latency_budget_ms=entry.get('latency_budget_ms', MODEL_LATENCY_BUDGET_MS),
+                memory_budget_bytes=entry.get('memory_budget_mb', MODEL_VARIANT_MEMORY_MB) * 1024 * 1024,
+                max_accuracy_drop=entry.get('max_accuracy_drop'),
+                pool_size=pool_size
+            )
+        if chosen is None:
+            raise ValueError(f"No variant of {model_name} could be loaded")
+        
+        report = next(report for report in reports if report['name'] == chosen['name'])
+        logger.info(f"Serving {model_name} variant {chosen['name']} ({report.get('latency_ms')} ms per image)")
+        # The variant's path and fingerprint go into model_identity, so cached results never mix variants
+        return chosen['path'], {
+            'path': chosen['path'],
+            'fingerprint': file_fingerprint(chosen['path']),
+            'variant': chosen['name'],
+            'variant_latency_ms': report.get('latency_ms'),
+            'variants': reports
+        }
+    
+    def import_frameworks(self, model_types):
+        """Import the frameworks needed by the given model types, one after another"""
+        for model_type in sorted(set(model_types)):
+            try:
+                if model_type == 'tflite':
+                    load_interpreter_class()
+                for module_name in FRAMEWORK_IMPORTS.get(model_type, ()):
+                    importlib.import_module(module_name)
+            except ImportError as e:
+                logger.warning(f"Could not import framework for {model_type} models: {str(e)}")
+    
+    def warm_up(self, model_names=None, max_workers=4):
+        """Load registered models concurrently and mark the manager ready when done"""
+        if model_names is None:
+            model_names = [name for name, entry in self.registry.items() if entry.get('preload', True)]
+        
+        start = time.monotonic()
+        self.warmup_status = {'state': 'warming', 'models': {name: 'loading' for name in model_names}, 'seconds': None}
+        
+        # Only frameworks of registered model types are ever imported
+        self.import_frameworks(self.registry[name]['type'] for name in model_names if name in self.registry)
+        
+        def load(model_name):
+            try:
+                self.get_model(model_name)
+                self.warmup_status['models'][model_name] = 'loaded'
+            except Exception as e:
+                self.warmup_status['models'][model_name] = f'failed: {str(e)}'
+        
+        # Independent artifacts load in parallel; models that depend on each other wait on the per-model lock
+        if model_names:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(model_names))), thread_name_prefix='model-load') as executor:
+                list(executor.map(load, model_names))
+        
+        self.warmup_status['state'] = 'ready'
+        self.warmup_status['seconds'] = round(time.monotonic() - start, 3)
+        self.ready.set()
+        logger.info(f"Warmed up {len(model_names)} models in {self.warmup_status['seconds']}s")
+        return self.warmup_status
+    
+    def start_warm_up(self, model_names=None, max_workers=4):
+        """Warm models in a background thread so the server can accept connections immediately"""
+        thread = threading.Thread(target=self.warm_up, args=(model_names, max_workers), name='model-warmup', daemon=True)
+        thread.start()
+        return thread
+    
+    def after_fork(self):
+        """Reset locks and readiness inherited from the parent in a forked worker process"""
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._unpickle_lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.ready = threading.Event()
+        self.warmup_status = {'state': 'not_started', 'models': {}, 'seconds': None}
     
-    def predict(self, model_name, input_data):
-        """Make prediction using specified model"""
+    def _compile_keras_model(self, model_name, model):
+        """Trace a Keras model once per batch bucket; keep the plain model if it cannot be compiled"""
         try:
-            if model_name not in self.models:
-                raise ValueError(f"Model {model_name} not loaded")
-            
-            model = self.models[model_name]
-            model_type = self.model_info[model_name]['type']
-            
-            # Convert input to appropriate format
-            if isinstance(input_data, dict):
-                # Convert dict to numpy array or DataFrame
-                if model_type == 'sklearn':
-                    # For sklearn models, convert to 2D array
-                    input_array = np.array(list(input_data.values())).reshape(1, -1)
-                else:
-                    input_array = np.array(list(input_data.values()))
-            elif isinstance(input_data, list):
-                input_array = np.array(input_data)
+            compiled = CompiledKerasModel(model)
+            logger.info(f"Compiled {model_name} for batch sizes {list(compiled.buckets)}")
+            return compiled
+        except Exception as e:
+            logger.warning(f"Could not compile {model_name}, using model.predict: {str(e)}")
+            return model
+    
+    def unload_model(self, model_name):
+        """Drop a loaded model from memory; it stays registered and reloads on next use"""
+        with self._lock:
+            if self.models.pop(model_name, None) is None:
+                return False
+            self.schemas.pop(model_name, None)
+            self._last_used.pop(model_name, None)
+            info = self.model_info.get(model_name)
+            if info is not None:
+                info.update({'loaded': False, 'memory_bytes': None, 'loaded_at': None})
+        logger.info(f"Unloaded model: {model_name}")
+        return True
+    
+    def memory_usage(self):
+        """Estimated bytes held by all loaded models"""
+        return sum(self.model_info[name].get('memory_bytes') or 0 for name in list(self.models))
+    
+    def _enforce_memory_budget(self, keep=None):
+        """Evict least recently used, unpinned models until usage fits the budget"""
+        if not self.memory_budget_bytes:
+            return
+        
+        for model_name in list(self._last_used):
+            if self.memory_usage() <= self.memory_budget_bytes:
+                return
+            if model_name == keep or self.registry.get(model_name, {}).get('pinned'):
+                continue
+            if model_name in self.registry:
+                logger.info(f"Evicting idle model {model_name} to stay within the memory budget")
+                self.unload_model(model_name)
+        
+        if self.memory_usage() > self.memory_budget_bytes:
+            logger.warning(f"Loaded models use {self.memory_usage() / 1e6:.1f} MB, over the {self.memory_budget_bytes / 1e6:.1f} MB budget")
+    
+    def model_identity(self, model_name):
+        """Identify the artifact currently serving a model, for cache keys"""
+        info = self.model_info.get(model_name, {})
+        return (model_name, info.get('type'), info.get('path'), info.get('fingerprint'))
+    
+    def compile_dense_model(self, model_name, source_model_name, scaler_name=None, architecture=None,
+                            tolerance=1e-4):
+        """Build a NumPy forward pass for a Keras dense model and verify it against Keras"""
+        self.register_model(
+            model_name, self.model_info[source_model_name]['path'], 'numpy',
+            scaler=scaler_name, verify_against=source_model_name,
+            architecture=architecture, tolerance=tolerance
+        )
+        return self._load_registered(model_name) is not None
+    
+    def _build_dense_model(self, model_name, entry, num_samples=256):
+        """Load a NumPy forward pass from a .h5 artifact, folding in its scaler and checking it against Keras"""
+        scaler_name = entry.get('scaler')
+        scaler = self.get_model(scaler_name) if scaler_name else None
+        network = load_dense_network(entry['path'], scaler, entry.get('architecture'))
+        extra_info = {'scaler': scaler_name}
+        
+        source_model_name = entry.get('verify_against')
+        if source_model_name:
+            # Compare against Keras on synthetic inputs spread around the training distribution
+            source_model = self.get_model(source_model_name)
+            rng = np.random.default_rng(0)
+            if scaler is not None:
+                samples = scaler.mean_ + rng.standard_normal((num_samples, network.input_dim)) * scaler.scale_ * 2
+                reference = lambda x: source_model.predict(scaler.transform(x), verbose=0)
             else:
-                input_array = input_data
-            
-            # Make prediction based on model type
-            if model_type == 'sklearn':
-                prediction = model.predict(input_array)
-                if hasattr(model, 'predict_proba'):
-                    probabilities = model.predict_proba(input_array)
-                    return {
-                        'prediction': prediction.tolist(),
-                        'probabilities': probabilities.tolist()
-                    }
-                return {'prediction': prediction.tolist()}
+                samples = rng.standard_normal((num_samples, network.input_dim))
+                reference = lambda x: source_model.predict(x, verbose=0)
+            error = max_abs_error(network, reference, samples)
             
-            elif model_type == 'tensorflow':
-                prediction = model.predict(input_array)
-                return {'prediction': prediction.tolist()}
-            
-            elif model_type == 'pytorch':
-                import torch
-                with torch.no_grad():
-                    input_tensor = torch.FloatTensor(input_array)
-                    prediction = model(input_tensor)
-                    return {'prediction': prediction.tolist()}
+            tolerance = entry.get('tolerance', IRRIGATION_NUMPY_TOLERANCE)
+            if error > tolerance:
+                raise ValueError(f"NumPy forward pass differs from {source_model_name} by {error:.2e} (tolerance {tolerance:.0e})")
             
+            logger.info(f"Verified NumPy forward pass {model_name} against {source_model_name} (max abs error {error:.2e})")
+            extra_info.update({'source_model': source_model_name, 'max_abs_error': error})
+        
+        return network, extra_info
+    
+    def enable_batching(self, model_name, max_batch_size=32, max_wait_ms=5.0):
+        """Group concurrent predictions for a model into shared forward passes"""
+        if not self.has_model(model_name):
+            raise ValueError(f"Model {model_name} not loaded")
+        
+        old_batcher = self.batchers.get(model_name)
+        # Look the model up on every batch so reloads and evictions are picked up
+        self.batchers[model_name] = MicroBatcher(
+            lambda batch: self.get_model(model_name).predict(batch, verbose=0),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name=model_name
+        )
+        if old_batcher is not None:
+            old_batcher.stop()
+        
+        # Extra pooled interpreters would only hold tensor arenas; reload with the batcher's single one
+        model = self.models.get(model_name)
+        if isinstance(model, TFLiteModel) and model.pool_size > self.tflite_pool_size(model_name):
+            self.unload_model(model_name)
+        
+        logger.info(f"Micro-batching enabled for {model_name} (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+    
+    def predict(self, model_name, input_data, coalesce=False):
+        """Make prediction using specified model; coalesce=True shares the run with identical concurrent calls"""
+        start = time.perf_counter()
+        try:
+            result = self._predict(model_name, input_data, coalesce)
+            MODEL_PREDICTIONS.inc(model=model_name, result='success')
+            MODEL_PREDICT_LATENCY.observe(time.perf_counter() - start, model=model_name)
+            return result
+        except FeatureError as e:
+            # The client's payload, not the model, is at fault; routes answer 400
+            MODEL_PREDICTIONS.inc(model=model_name, result='invalid_input')
+            logger.info(f"Rejected input for {model_name}: {str(e)}")
+            raise
         except Exception as e:
+            MODEL_PREDICTIONS.inc(model=model_name, result='error')
             logger.error(f"Error making prediction with {model_name}: {str(e)}")
             raise e
     
-    def preprocess_image(self, image_data, target_size=(128, 128)):
-        """Preprocess image for pest detection"""
-        try:
-            # Handle base64 encoded image
-            if isinstance(image_data, str) and image_data.startswith('data:image'):
-                # Remove data URL prefix
-                image_data = image_data.split(',')[1]
-            
-            # Decode base64 image
-            if isinstance(image_data, str):
-                image_bytes = base64.b64decode(image_data)
+    def coalesce(self, model_name, key, fn):
+        """fn() run once for all concurrent callers with the same key; callers must not modify the shared result"""
+        if not PREDICT_COALESCING or key is None:
+            return fn()
+        result, shared = self.flights.run(key, fn)
+        if shared:
+            MODEL_COALESCED.inc(model=model_name)
+        return result
+    
+    def _predict(self, model_name, input_data, coalesce=False):
+        model = self.get_model(model_name)
+        info = self.model_info[model_name]
+        schema = self.schemas.get(model_name)
+        
+        # Convert input to appropriate format
+        if is_records(input_data) and schema is not None:
+            # Columns in the model's order, whatever order the client sent the keys in
+            input_array = schema.transform(input_data)
+        elif is_records(input_data) and serving_type(info) != 'sklearn' and isinstance(input_data, dict):
+            # No schema: the values in the order the client sent them
+            input_array = np.array(list(input_data.values()))
+        elif is_records(input_data):
+            raise FeatureError(f'{model_name} has no feature schema, so it cannot map named fields; '
+                               f'send input_data as an array of values in the model\'s column order '
+                               f'or add "features" to its manifest entry')
+        elif isinstance(input_data, list):
+            input_array = np.array(input_data)
+        else:
+            input_array = input_data
+        
+        if coalesce and PREDICT_COALESCING:
+            # The model input itself is the canonical form of the request: key order, number
+            # formatting and fields the schema ignores no longer matter
+            key = array_key(input_array, *self.model_identity(model_name))
+            return self.coalesce(model_name, key, lambda: self._run_model(model_name, model, info, input_array))
+        return self._run_model(model_name, model, info, input_array)
+    
+    def _run_model(self, model_name, model, info, input_array):
+        model_type = serving_type(info)
+        
+        # Make prediction based on model type
+        if model_type == 'sklearn':
+            if info.get('single_pass'):
+                # The predicted class is the most probable one, so a single pass gives both
+                probabilities = model.predict_proba(input_array)
+                return {
+                    'prediction': model.classes_[probabilities.argmax(axis=1)].tolist(),
+                    'probabilities': probabilities.tolist()
+                }
+            prediction = model.predict(input_array)
+            if hasattr(model, 'predict_proba'):
+                probabilities = model.predict_proba(input_array)
+                return {
+                    'prediction': prediction.tolist(),
+                    'probabilities': probabilities.tolist()
+                }
+            return {'prediction': prediction.tolist()}
+        
+        elif model_type in ('tensorflow', 'tflite', 'numpy'):
+            if model_name in self.batchers:
+                prediction = self.batchers[model_name].predict(input_array)
             else:
-                image_bytes = image_data
-            
-            # Open image with PIL
-            image = Image.open(BytesIO(image_bytes))
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize image
-            image = image.resize(target_size)
-            
-            # Convert to numpy array and normalize
-            image_array = np.array(image) / 255.0
-            
-            # Add batch dimension
-            image_array = np.expand_dims(image_array, axis=0)
-            
-            return image_array
-            
+                prediction = model.predict(input_array)
+            return {'prediction': prediction.tolist()}
+        
+        elif model_type == 'pytorch':
+            import torch
+            with torch.no_grad():
+                input_tensor = torch.FloatTensor(input_array)
+                prediction = model(input_tensor)
+                return {'prediction': prediction.tolist()}
+    
+    def preprocess_image(self, image_data, target_size=(128, 128), timings=None):
+        """Preprocess image for pest detection (base64 string, raw bytes or file-like object)"""
+        try:
+            return image_preprocessing.preprocess_image(image_data, target_size, timings)
         except Exception as e:
             logger.error(f"Error preprocessing image: {str(e)}")
             raise e
+    
+    def preprocess_images(self, images, target_size=(128, 128), executor=None, timings=None):
+        """Preprocess several images into one float32 batch, returning (batch, errors by index)"""
+        return image_preprocessing.preprocess_batch(images, target_size, executor, timings)
+
+def serving_type(entry):
+    """Model type a registry entry or model info predicts as; mapped artifacts run as what they were exported from"""
+    if entry.get('type') != 'mapped':
+        return entry.get('type')
+    if entry.get('kind') == 'dense':
+        return 'numpy'
+    return (entry.get('source') or {}).get('type')
+
+def estimate_model_memory(model, model_path=None):
+    """Approximate resident size of a loaded model in bytes"""
+    try:
+        if hasattr(model, 'nbytes'):
+            return int(model.nbytes)
+        if hasattr(model, 'weights') and hasattr(model, 'count_params'):
+            # Keras model: sum of its weight tensors
+            return int(sum(np.prod(w.shape) * np.dtype(getattr(w.dtype, 'as_numpy_dtype', w.dtype)).itemsize for w in model.weights))
+        if hasattr(model, 'parameters') and hasattr(model, 'state_dict'):
+            # PyTorch module
+            return int(sum(p.numel() * p.element_size() for p in model.parameters()))
+        return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return os.path.getsize(model_path) if model_path and os.path.exists(model_path) else 0
+
+def file_fingerprint(path):
+    """Size and modification time of a model artifact, changing whenever the file is replaced"""
+    try:
+        stat = os.stat(path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+    except OSError:
+        return None
 
 # Initialize model manager
-model_manager = ModelManager()
+model_manager = ModelManager(memory_budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024))
+
+# Cache of pest detection results keyed by image content and model identity
+pest_result_cache = ResultCache(
+    max_entries=PEST_CACHE_MAX_ENTRIES,
+    ttl_seconds=PEST_CACHE_TTL_SECONDS,
+    disk_path=PEST_CACHE_DB,
+    disk_max_entries=PEST_CACHE_DISK_MAX_ENTRIES,
+    disk_ttl_seconds=PEST_CACHE_DISK_TTL_SECONDS
+)
+
+# Irrigation predictions by crop type and bucketed readings; memory only, as recomputing is cheap
+irrigation_result_cache = ResultCache(
+    max_entries=IRRIGATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=IRRIGATION_CACHE_TTL_SECONDS or None
+) if IRRIGATION_CACHE_MAX_ENTRIES > 0 else None
+
+# Thread pool for decoding uploaded images in parallel (PIL releases the GIL while decoding)
+preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='preprocess')
 
 @app.route('/')
 def home():
@@ -155,10 +712,44 @@ def home():
             'load_model': 'POST /api/load-model',
             'predict': 'POST /api/predict',
             'models': 'GET /api/models',
-            'health': 'GET /api/health'
+            'pest_detection': 'POST /api/pest-detection',
+            'pest_detection_batch': 'POST /api/pest-detection/batch',
+            'cache_stats': 'GET /api/cache/stats',
+            'health': 'GET /api/health',
+            'ready': 'GET /api/ready',
+            'metrics': 'GET /metrics'
         }
     })
 
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_token = metrics.current_route.set(route)
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' in g:
+        record_request(metrics.current_route.get(), request.method, response.status_code,
+                       time.perf_counter() - g.metrics_start)
+    return response
+
+@app.teardown_request
+def reset_request_metrics(exc=None):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        metrics.current_route.reset(token)
+
+def respond(body, status=200):
+    """jsonify a (body, status) result, timing serialization as its own stage"""
+    with stage('serialize'):
+        return jsonify(body), status
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, stage and model metrics in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -168,6 +759,17 @@ def health_check():
         'loaded_models': list(model_manager.models.keys())
     })
 
+@app.route('/api/ready')
+def readiness_check():
+    """Readiness check: 200 once registered models are loaded, 503 while they are still warming up"""
+    ready = model_manager.ready.is_set()
+    return jsonify({
+        'status': 'ready' if ready else 'warming',
+        'warmup': model_manager.warmup_status,
+        'loaded_models': list(model_manager.models.keys()),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
 @app.route('/api/load-model', methods=['POST'])
 def load_model():
     """Load a machine learning model"""
@@ -187,7 +789,10 @@ def load_model():
         if not os.path.exists(model_path):
             return jsonify({'error': f'Model file not found: {model_path}'}), 404
         
-        success = model_manager.load_model(model_name, model_path, model_type)
+        # Optional feature schema for dict payloads (see feature_schema.py) and tflite variant selection
+        options = {key: data[key] for key in ('features', 'single_pass', 'variants', 'variant', 'latency_budget_ms',
+                                              'memory_budget_mb', 'max_accuracy_drop') if key in data}
+        success = model_manager.load_model(model_name, model_path, model_type, **options)
         
         if success:
             return jsonify({
@@ -206,38 +811,62 @@ def predict():
     """Make prediction using loaded model"""
     try:
         data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-        
-        model_name = data.get('model_name')
-        input_data = data.get('input_data')
-        
-        if not model_name or input_data is None:
-            return jsonify({'error': 'model_name and input_data are required'}), 400
-        
-        if model_name not in model_manager.models:
-            return jsonify({'error': f'Model {model_name} not loaded'}), 404
-        
-        prediction = model_manager.predict(model_name, input_data)
-        
-        return jsonify({
-            'model_name': model_name,
-            'input_data': input_data,
-            'prediction': prediction,
-            'timestamp': datetime.now().isoformat()
-        })
+        return respond(*predict_response(data))
         
     except Exception as e:
         logger.error(f"Error in predict: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def predict_response(data):
+    """Prediction from any registered model for already-parsed request data; returns (body, status)"""
+    if not data:
+        return {'error': 'No JSON data provided'}, 400
+    
+    model_name = data.get('model_name')
+    input_data = data.get('input_data')
+    
+    if not model_name or input_data is None:
+        return {'error': 'model_name and input_data are required'}, 400
+    
+    if not model_manager.has_model(model_name):
+        return {'error': f'Model {model_name} not loaded'}, 404
+    
+    try:
+        prediction = model_manager.predict(model_name, input_data)
+    except FeatureError as e:
+        return {'error': str(e)}, 400
+    
+    return {
+        'model_name': model_name,
+        'input_data': input_data,
+        'prediction': prediction,
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
 @app.route('/api/models')
 def list_models():
     """List all loaded models"""
-    return jsonify({
+    return respond(*models_response())
+
+def models_response():
+    """Loaded and registered models with their info and memory use; returns (body, status)"""
+    return {
         'loaded_models': list(model_manager.models.keys()),
-        'model_info': model_manager.model_info
+        'registered_models': list(model_manager.registry.keys()),
+        'model_info': model_manager.model_info,
+        'memory': {
+            'used_bytes': model_manager.memory_usage(),
+            'budget_bytes': model_manager.memory_budget_bytes or None
+        }
+    }, 200
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Hit/miss counters for the pest detection and irrigation result caches"""
+    return jsonify({
+        'pest_detection': pest_result_cache.stats(),
+        'irrigation': irrigation_result_cache.stats() if irrigation_result_cache is not None else None,
+        'timestamp': datetime.now().isoformat()
     })
 
 # Agricultural specific endpoints
@@ -245,7 +874,8 @@ def list_models():
 def crop_prediction():
     """Predict crop recommendation based on soil and weather data"""
     try:
-        data = request.get_json()
+        with stage('body_parse'):
+            data = request.get_json()
         
         # Example input format for crop prediction with NPK
         # {
@@ -259,532 +889,768 @@ def crop_prediction():
         #     "region": "tropical"
         # }
         
-        if 'crop_model' not in model_manager.models:
-            return jsonify({'error': 'Crop prediction model not loaded. Please load a model with name "crop_model"'}), 404
-        
-        prediction = model_manager.predict('crop_model', data)
-        
-        return jsonify({
-            'prediction': prediction,
-            'recommendation': 'Based on the provided NPK levels and conditions, the recommended crops are:',
-            'timestamp': datetime.now().isoformat()
-        })
+        return respond(*crop_prediction_response(data))
         
     except Exception as e:
         logger.error(f"Error in crop prediction: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def crop_prediction_response(data):
+    """Crop recommendation for already-parsed request data; returns (body, status)"""
+    if not model_manager.has_model('crop_model'):
+        return {'error': 'Crop prediction model not loaded. Please load a model with name "crop_model"'}, 404
+    
+    if not data:
+        return {'error': 'No JSON data provided'}, 400
+    
+    # A list of samples (or {"samples": [...]}) is scored in one batch
+    if isinstance(data, dict) and isinstance(data.get('samples'), list):
+        data = data['samples']
+    
+    try:
+        with stage('model_predict'):
+            prediction = model_manager.predict('crop_model', data, coalesce=True)
+    except FeatureError as e:
+        return {'error': str(e)}, 400
+    
+    return {
+        'prediction': prediction,
+        'recommendation': 'Based on the provided NPK levels and conditions, the recommended crops are:',
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
 @app.route('/api/pest-detection', methods=['POST'])
 def pest_detection():
     """Detect pests from uploaded image"""
     try:
-        # Check if model is loaded
-        if 'pest_model' not in model_manager.models:
-            return jsonify({'error': 'Pest detection model not loaded'}), 404
-        
-        # Get pest metadata
-        if 'pest_metadata' not in model_manager.models:
-            return jsonify({'error': 'Pest metadata not loaded'}), 404
-        
-        data = request.get_json()
-        
-        if not data or 'image' not in data:
-            return jsonify({'error': 'No image provided'}), 400
+        with stage('body_parse'):
+            image_data = get_uploaded_image()
+        return respond(*pest_detection_response(image_data))
         
+    except Exception as e:
+        logger.error(f"Error in pest detection: {str(e)}")
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def pest_detection_response(image_data):
+    """Classify one uploaded image (stream, bytes or base64 string); returns (body, status)"""
+    # Check if model is loaded
+    if not model_manager.has_model('pest_model'):
+        return {'error': 'Pest detection model not loaded'}, 404
+    
+    # Get pest metadata
+    if not model_manager.has_model('pest_metadata'):
+        return {'error': 'Pest metadata not loaded'}, 404
+    
+    if image_data is None:
+        return {'error': 'No image provided'}, 400
+    
+    # Repeat uploads of the same image are answered from the cache
+    timings = image_preprocessing.new_timings()
+    image_bytes = image_preprocessing.read_image_bytes(image_data, timings)
+    cache_key = content_key(
+        image_bytes,
+        *model_manager.model_identity('pest_model'),
+        *model_manager.model_identity('pest_metadata')
+    )
+    cached = pest_result_cache.get(cache_key)
+    
+    # Get class names from metadata
+    class_names = model_manager.get_model('pest_metadata')['class_names']
+    
+    if cached is not None:
+        result = dict(cached, advice=get_pest_advice(cached['predicted_pest']))
+    else:
         # Preprocess the image
-        image_array = model_manager.preprocess_image(data['image'])
+        image_array = model_manager.preprocess_image(image_bytes, timings=timings)
         
         # Make prediction
-        prediction = model_manager.predict('pest_model', image_array)
-        
-        # Get class names from metadata
-        class_names = model_manager.models['pest_metadata']['class_names']
-        
-        # Get the predicted class and confidence
-        predicted_class_idx = np.argmax(prediction['prediction'][0])
-        confidence = float(np.max(prediction['prediction'][0]))
-        predicted_class = class_names[predicted_class_idx]
-        
-        # Get top 3 predictions
-        top3_indices = np.argsort(prediction['prediction'][0])[-3:][::-1]
-        top3_predictions = []
-        for idx in top3_indices:
-            top3_predictions.append({
-                'class': class_names[idx],
-                'confidence': float(prediction['prediction'][0][idx])
-            })
+        with stage('model_predict'):
+            prediction = model_manager.predict('pest_model', image_array)
         
-        # Get pest prevention advice
-        pest_advice = get_pest_advice(predicted_class)
-        
-        return jsonify({
-            'success': True,
-            'predicted_pest': predicted_class,
-            'confidence': confidence,
-            'top3_predictions': top3_predictions,
-            'all_classes': class_names,
-            'advice': pest_advice,
-            'timestamp': datetime.now().isoformat()
+        result = build_pest_result(prediction['prediction'][0], class_names)
+        pest_result_cache.put(cache_key, {
+            'predicted_pest': result['predicted_pest'],
+            'confidence': result['confidence'],
+            'top3_predictions': result['top3_predictions']
         })
+    
+    record_stages(timings)
+    
+    return {
+        'success': True,
+        'predicted_pest': result['predicted_pest'],
+        'confidence': result['confidence'],
+        'top3_predictions': result['top3_predictions'],
+        'all_classes': class_names,
+        'advice': result['advice'],
+        'cached': cached is not None,
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+@app.route('/api/pest-detection/batch', methods=['POST'])
+def pest_detection_batch():
+    """Detect pests in several uploaded images with one forward pass"""
+    try:
+        if not model_manager.has_model('pest_model'):
+            return jsonify({'error': 'Pest detection model not loaded'}), 404
+        
+        if not model_manager.has_model('pest_metadata'):
+            return jsonify({'error': 'Pest metadata not loaded'}), 404
+        
+        # Accept either multipart file parts or a JSON array of base64 images
+        with stage('body_parse'):
+            if request.files:
+                parts = request.files.getlist('images') or [f for _, f in request.files.items(multi=True)]
+                images = [part.stream for part in parts]
+            else:
+                data = request.get_json(silent=True)
+                images = data.get('images') if isinstance(data, dict) else None
+        
+        return respond(*pest_detection_batch_response(images))
         
     except Exception as e:
-        logger.error(f"Error in pest detection: {str(e)}")
+        logger.error(f"Error in batch pest detection: {str(e)}")
         return jsonify({'error': str(e), 'success': False}), 500
 
-def get_pest_advice(pest_name):
-    """Get prevention and treatment advice for detected pest"""
-    advice_database = {
-        'bees': {
-            'description': 'Honey bees or other beneficial bees',
-            'prevention': [
-                'Plant bee-friendly flowers to attract beneficial bees',
-                'Avoid using pesticides during flowering season',
-                'Provide water sources for bees',
-                'Maintain diverse plant species'
-            ],
-            'treatment': [
-                'Bees are beneficial - no treatment needed',
-                'If aggressive, contact local beekeeper for relocation',
-                'Avoid disturbing bee hives'
-            ],
-            'severity': 'Beneficial'
-        },
-        'beetle': {
-            'description': 'Various beetle species that can damage crops',
-            'prevention': [
-                'Use crop rotation to break pest cycles',
-                'Remove crop debris after harvest',
-                'Use floating row covers',
-                'Plant trap crops to divert beetles'
-            ],
-            'treatment': [
-                'Hand-pick beetles in early morning',
-                'Apply neem oil spray',
-                'Use beneficial nematodes',
-                'Consider organic insecticides if severe'
-            ],
-            'severity': 'Moderate'
-        },
-        'catterpillar': {
-            'description': 'Caterpillar larvae that feed on plant leaves',
-            'prevention': [
-                'Use Bacillus thuringiensis (Bt) spray',
-                'Attract beneficial insects like parasitic wasps',
-                'Remove weeds that host caterpillars',
-                'Use pheromone traps'
-            ],
-            'treatment': [
-                'Hand-pick caterpillars when possible',
-                'Apply Bt spray every 7-10 days',
-                'Use spinosad for organic control',
-                'Introduce beneficial insects'
-            ],
-            'severity': 'High'
-        },
-        'earthworms': {
-            'description': 'Earthworms - beneficial for soil health',
-            'prevention': [
-                'Maintain organic matter in soil',
-                'Avoid excessive tillage',
-                'Keep soil moist but not waterlogged',
-                'Add compost regularly'
-            ],
-            'treatment': [
-                'Earthworms are beneficial - no treatment needed',
-                'Maintain healthy soil conditions',
-                'Avoid chemical fertilizers that harm earthworms'
-            ],
-            'severity': 'Beneficial'
-        },
-        'earwig': {
-            'description': 'Earwigs that can damage young plants',
-            'prevention': [
-                'Remove hiding places like mulch and debris',
-                'Use sticky traps',
-                'Keep garden clean and tidy',
-                'Plant resistant varieties'
-            ],
-            'treatment': [
-                'Hand-pick at night with flashlight',
-                'Use diatomaceous earth',
-                'Apply neem oil',
-                'Set up oil traps'
-            ],
-            'severity': 'Low'
-        },
-        'grasshopper': {
-            'description': 'Grasshoppers that consume plant foliage',
-            'prevention': [
-                'Use row covers for young plants',
-                'Plant trap crops',
-                'Maintain healthy soil',
-                'Attract birds and beneficial insects'
-            ],
-            'treatment': [
-                'Hand-pick when possible',
-                'Use Nosema locustae (grasshopper bait)',
-                'Apply neem oil spray',
-                'Use floating row covers'
-            ],
-            'severity': 'High'
-        },
-        'moth': {
-            'description': 'Adult moths that lay eggs on plants',
-            'prevention': [
-                'Use pheromone traps',
-                'Plant trap crops',
-                'Remove weeds and debris',
-                'Use row covers during peak moth season'
-            ],
-            'treatment': [
-                'Use pheromone traps to monitor',
-                'Apply Bt spray for larvae control',
-                'Introduce beneficial insects',
-                'Use light traps at night'
-            ],
-            'severity': 'Moderate'
-        },
-        'slug': {
-            'description': 'Slugs that feed on plant leaves and stems',
-            'prevention': [
-                'Remove hiding places and debris',
-                'Use copper barriers',
-                'Improve drainage',
-                'Plant slug-resistant varieties'
-            ],
-            'treatment': [
-                'Hand-pick at night with flashlight',
-                'Use beer traps',
-                'Apply diatomaceous earth',
-                'Use iron phosphate baits'
-            ],
-            'severity': 'Moderate'
-        },
-        'snail': {
-            'description': 'Snails that damage plant foliage',
-            'prevention': [
-                'Remove hiding places',
-                'Use copper barriers',
-                'Improve garden drainage',
-                'Plant resistant varieties'
-            ],
-            'treatment': [
-                'Hand-pick in early morning',
-                'Use beer traps',
-                'Apply diatomaceous earth',
-                'Use iron phosphate baits'
-            ],
-            'severity': 'Moderate'
-        },
-        'wasp': {
-            'description': 'Wasps - mostly beneficial for pest control',
-            'prevention': [
-                'Plant nectar-rich flowers',
-                'Provide water sources',
-                'Avoid disturbing nests',
-                'Maintain diverse plant species'
-            ],
-            'treatment': [
-                'Most wasps are beneficial - no treatment needed',
-                'If aggressive, contact pest control professional',
-                'Avoid swatting or disturbing nests'
-            ],
-            'severity': 'Beneficial'
-        },
-        'weevil': {
-            'description': 'Weevils that damage plant roots and foliage',
-            'prevention': [
-                'Use crop rotation',
-                'Remove crop debris',
-                'Use beneficial nematodes',
-                'Plant resistant varieties'
-            ],
-            'treatment': [
-                'Apply beneficial nematodes to soil',
-                'Use neem oil spray',
-                'Hand-pick adults when possible',
-                'Use diatomaceous earth'
-            ],
-            'severity': 'High'
-        }
-    }
+def pest_detection_batch_response(images):
+    """Classify a list of images (streams, bytes or base64 strings) in one forward pass; returns (body, status)"""
+    if not model_manager.has_model('pest_model'):
+        return {'error': 'Pest detection model not loaded'}, 404
     
-    return advice_database.get(pest_name.lower(), {
-        'description': f'Unknown pest: {pest_name}',
-        'prevention': ['Consult with local agricultural extension office', 'Monitor plant health regularly'],
-        'treatment': ['Identify the pest correctly', 'Consult with agricultural expert'],
-        'severity': 'Unknown'
-    })
+    if not model_manager.has_model('pest_metadata'):
+        return {'error': 'Pest metadata not loaded'}, 404
+    
+    if not images or not isinstance(images, list):
+        return {'error': 'No images provided. Send a JSON "images" array or multipart "images" parts'}, 400
+    
+    if len(images) > PEST_UPLOAD_MAX_IMAGES:
+        return {'error': f'Too many images: {len(images)} (maximum is {PEST_UPLOAD_MAX_IMAGES})'}, 400
+    
+    # Decode all images in parallel into one batch buffer, keeping failures per image
+    timings = image_preprocessing.new_timings()
+    batch, decode_errors = model_manager.preprocess_images(images, executor=preprocess_executor, timings=timings)
+    record_stages(timings)
+    errors = {i: f'Could not decode image: {error}' for i, error in decode_errors.items()}
+    
+    # One forward pass over every decodable image
+    valid_indices = [i for i in range(len(images)) if i not in errors]
+    probabilities = []
+    if valid_indices:
+        with stage('model_predict'):
+            probabilities = model_manager.predict('pest_model', batch)['prediction']
+    
+    class_names = model_manager.get_model('pest_metadata')['class_names']
+    results = [None] * len(images)
+    for i, row in zip(valid_indices, probabilities):
+        results[i] = {'index': i, 'success': True, **build_pest_result(row, class_names)}
+    for i, error in errors.items():
+        results[i] = {'index': i, 'success': False, 'error': error}
+    
+    return {
+        'success': True,
+        'count': len(results),
+        'results': results,
+        'all_classes': class_names,
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+def get_uploaded_image():
+    """Return the uploaded image from a raw body, multipart part or JSON base64 field"""
+    # Raw image/jpeg or image/png body: hand the request stream to the decoder
+    if request.mimetype in RAW_IMAGE_MIMETYPES:
+        return request.stream
+    
+    # multipart/form-data: prefer the "image" part, otherwise take the first file
+    if request.files:
+        part = request.files.get('image') or next(iter(request.files.values()))
+        return part.stream
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and data.get('image'):
+        return data['image']
+    
+    return None
+
+def build_pest_result(probabilities, class_names):
+    """Turn one row of class probabilities into the predicted pest, top 3 and advice"""
+    probabilities = np.asarray(probabilities)
+    
+    # Get top 3 predictions
+    top3_indices = np.argsort(probabilities)[-3:][::-1]
+    top3_predictions = []
+    for idx in top3_indices:
+        top3_predictions.append({
+            'class': class_names[idx],
+            'confidence': float(probabilities[idx])
+        })
+    
+    predicted_class = top3_predictions[0]['class']
+    
+    return {
+        'predicted_pest': predicted_class,
+        'confidence': top3_predictions[0]['confidence'],
+        'top3_predictions': top3_predictions,
+        'advice': get_pest_advice(predicted_class)
+    }
+
+def get_pest_advice(pest_name):
+    """Get prevention and treatment advice for detected pest (table in data/pest_advice.json)"""
+    return PEST_ADVICE.get(pest_name)
 
 @app.route('/api/yield-prediction', methods=['POST'])
 def yield_prediction():
     """Predict crop yield based on various factors"""
     try:
-        data = request.get_json()
-        
-        if 'yield_model' not in model_manager.models:
-            return jsonify({'error': 'Yield prediction model not loaded. Please load a model with name "yield_model"'}), 404
+        with stage('body_parse'):
+            data = request.get_json()
         
-        prediction = model_manager.predict('yield_model', data)
-        
-        return jsonify({
-            'prediction': prediction,
-            'recommendation': 'Based on the current conditions, the predicted yield is:',
-            'timestamp': datetime.now().isoformat()
-        })
+        return respond(*yield_prediction_response(data))
         
     except Exception as e:
         logger.error(f"Error in yield prediction: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def yield_prediction_response(data):
+    """Yield prediction for already-parsed request data; returns (body, status)"""
+    if not model_manager.has_model('yield_model'):
+        return {'error': 'Yield prediction model not loaded. Please load a model with name "yield_model"'}, 404
+    
+    if not data:
+        return {'error': 'No JSON data provided'}, 400
+    
+    try:
+        with stage('model_predict'):
+            prediction = model_manager.predict('yield_model', data)
+    except FeatureError as e:
+        return {'error': str(e)}, 400
+    
+    return {
+        'prediction': prediction,
+        'recommendation': 'Based on the current conditions, the predicted yield is:',
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
 @app.route('/api/predict-irrigation', methods=['POST'])
 def predict_irrigation():
     """Predict irrigation requirement using the trained neural network model"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-        
-        # Extract input parameters
-        crop_type = data.get('crop_type')
-        soil_moisture = data.get('soil_moisture')
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
-        rainfall = data.get('rainfall')
-        
-        # Validate required parameters
-        if None in [crop_type, soil_moisture, temperature, humidity, rainfall]:
-            return jsonify({'error': 'All parameters are required: crop_type, soil_moisture, temperature, humidity, rainfall'}), 400
-        
-        # Validate data types and ranges
-        try:
-            soil_moisture = float(soil_moisture)
-            temperature = float(temperature)
-            humidity = float(humidity)
-            rainfall = float(rainfall)
-        except (ValueError, TypeError):
-            return jsonify({'error': 'All numeric parameters must be valid numbers'}), 400
-        
-        # Validate ranges
-        if not (0 <= soil_moisture <= 100):
-            return jsonify({'error': 'Soil moisture must be between 0 and 100'}), 400
-        if not (-10 <= temperature <= 50):
-            return jsonify({'error': 'Temperature must be between -10 and 50'}), 400
-        if not (0 <= humidity <= 100):
-            return jsonify({'error': 'Humidity must be between 0 and 100'}), 400
-        if not (0 <= rainfall <= 500):
-            return jsonify({'error': 'Rainfall must be between 0 and 500'}), 400
-        
-        # Check if irrigation model is loaded
-        if 'irrigation_model' not in model_manager.models:
-            return jsonify({'error': 'Irrigation prediction model not loaded. Please load the model first.'}), 404
-        
-        # Check if scaler and label encoder are loaded
-        if 'irrigation_scaler' not in model_manager.models:
-            return jsonify({'error': 'Irrigation scaler not loaded. Please load the scaler first.'}), 404
-        
-        if 'irrigation_label_encoder' not in model_manager.models:
-            return jsonify({'error': 'Irrigation label encoder not loaded. Please load the label encoder first.'}), 404
+        with stage('body_parse'):
+            data = request.get_json()
+        return respond(*irrigation_prediction_response(data))
         
+    except Exception as e:
+        logger.error(f"Error in irrigation prediction: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def irrigation_prediction_response(data):
+    """Irrigation prediction for already-parsed request data; returns (body, status)"""
+    if not data:
+        return {'error': 'No JSON data provided'}, 400
+    
+    # Extract input parameters
+    crop_type = data.get('crop_type')
+    soil_moisture = data.get('soil_moisture')
+    temperature = data.get('temperature')
+    humidity = data.get('humidity')
+    rainfall = data.get('rainfall')
+    
+    # Validate required parameters
+    if None in [crop_type, soil_moisture, temperature, humidity, rainfall]:
+        return {'error': 'All parameters are required: crop_type, soil_moisture, temperature, humidity, rainfall'}, 400
+    
+    # Validate data types and ranges
+    try:
+        soil_moisture = float(soil_moisture)
+        temperature = float(temperature)
+        humidity = float(humidity)
+        rainfall = float(rainfall)
+    except (ValueError, TypeError):
+        return {'error': 'All numeric parameters must be valid numbers'}, 400
+    
+    # Validate ranges
+    if not (0 <= soil_moisture <= 100):
+        return {'error': 'Soil moisture must be between 0 and 100'}, 400
+    if not (-10 <= temperature <= 50):
+        return {'error': 'Temperature must be between -10 and 50'}, 400
+    if not (0 <= humidity <= 100):
+        return {'error': 'Humidity must be between 0 and 100'}, 400
+    if not (0 <= rainfall <= 500):
+        return {'error': 'Rainfall must be between 0 and 500'}, 400
+    
+    # Check if irrigation model is loaded
+    if not model_manager.has_model('irrigation_model'):
+        return {'error': 'Irrigation prediction model not loaded. Please load the model first.'}, 404
+    
+    # Check if scaler and label encoder are loaded
+    if not model_manager.has_model('irrigation_scaler'):
+        return {'error': 'Irrigation scaler not loaded. Please load the scaler first.'}, 404
+    
+    if not model_manager.has_model('irrigation_label_encoder'):
+        return {'error': 'Irrigation label encoder not loaded. Please load the label encoder first.'}, 404
+    
+    # With the cache on, the model scores the bucketed readings so a cached result
+    # is the same whichever reading in the bucket arrived first
+    readings = [soil_moisture, temperature, humidity, rainfall]
+    if irrigation_result_cache is not None:
+        buckets, readings = quantize_irrigation_readings(readings)
+    else:
+        buckets = readings
+    
+    def score():
         # Encode crop type
-        label_encoder = model_manager.models['irrigation_label_encoder']
-        try:
-            crop_encoded = label_encoder.transform([crop_type])[0]
-        except ValueError:
-            return jsonify({'error': f'Unknown crop type: {crop_type}. Please use a valid crop type.'}), 400
-        
-        # Prepare input data
-        input_data = np.array([[crop_encoded, soil_moisture, temperature, humidity, rainfall]])
-        
-        # Scale the input data
-        scaler = model_manager.models['irrigation_scaler']
-        input_scaled = scaler.transform(input_data)
-        
-        # Make prediction
-        model = model_manager.models['irrigation_model']
-        prediction_prob = model.predict(input_scaled, verbose=0)[0][0]
+        with stage('encode'):
+            label_encoder = model_manager.get_model('irrigation_label_encoder')
+            try:
+                crop_encoded = label_encoder.transform([crop_type])[0]
+            except ValueError:
+                return None
+            
+            # Prepare input data
+            input_data = np.array([[crop_encoded, *readings]])
         
-        # Determine if irrigation is needed (threshold = 0.5)
-        irrigation_needed = bool(prediction_prob > 0.5)
-        confidence = float(prediction_prob)
+        return float(score_irrigation(input_data)[0])
+    
+    # Keyed on the parsed values, so "30", 30 and 30.0 are the same request
+    key = content_key(
+        json.dumps([str(crop_type), *buckets]).encode('utf-8'),
+        IRRIGATION_INFERENCE,
+        *(model_manager.model_identity(name) for name in IRRIGATION_MODELS)
+    )
+    prediction_prob = irrigation_result_cache.get(key) if irrigation_result_cache is not None else None
+    cached = prediction_prob is not None
+    if not cached:
+        prediction_prob = model_manager.coalesce('irrigation_model', key, score)
+        if prediction_prob is None:
+            return {'error': f'Unknown crop type: {crop_type}. Please use a valid crop type.'}, 400
+        if irrigation_result_cache is not None:
+            irrigation_result_cache.put(key, prediction_prob)
+    
+    # Determine if irrigation is needed (threshold = 0.5)
+    irrigation_needed = bool(prediction_prob > 0.5)
+    confidence = float(prediction_prob)
+    
+    # Get recommendations based on prediction
+    recommendations = get_irrigation_recommendations(
+        crop_type, soil_moisture, temperature, humidity, rainfall, 
+        irrigation_needed, confidence
+    )
+    
+    return {
+        'success': True,
+        'irrigation_needed': irrigation_needed,
+        'confidence': confidence,
+        'probability': prediction_prob,
+        'input_data': {
+            'crop_type': crop_type,
+            'soil_moisture': soil_moisture,
+            'temperature': temperature,
+            'humidity': humidity,
+            'rainfall': rainfall
+        },
+        'recommendations': recommendations,
+        'cached': cached,
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+def quantize_irrigation_readings(readings):
+    """(bucket indexes, bucket values) for readings in IRRIGATION_FEATURE_RANGES order, by IRRIGATION_CACHE_BUCKETS width"""
+    buckets, values = [], []
+    for (name, low, high, _), value in zip(IRRIGATION_FEATURE_RANGES, readings):
+        width = IRRIGATION_CACHE_BUCKETS.get(name, 0)
+        if width <= 0:
+            buckets.append(value)
+            values.append(value)
+            continue
+        bucket = round(value / width)
+        buckets.append(bucket)
+        # Rounded again so 0.1-wide buckets give 28.3 rather than 28.300000000000004; a coarse
+        # width can put the bucket value past the valid range, so it is clamped back into it
+        values.append(min(max(round(bucket * width, 10), low), high))
+    return buckets, values
+
+@app.route('/api/predict-irrigation/bulk', methods=['POST'])
+def predict_irrigation_bulk():
+    """Score many irrigation readings (JSON array, NDJSON or CSV) in one vectorized pass"""
+    try:
+        for name, label in (('irrigation_model', 'Irrigation prediction model'),
+                            ('irrigation_scaler', 'Irrigation scaler'),
+                            ('irrigation_label_encoder', 'Irrigation label encoder')):
+            if not model_manager.has_model(name):
+                return jsonify({'error': f'{label} not loaded. Please load it first.'}), 404
         
-        # Get recommendations based on prediction
-        recommendations = get_irrigation_recommendations(
-            crop_type, soil_moisture, temperature, humidity, rainfall, 
-            irrigation_needed, confidence
-        )
+        try:
+            with stage('body_parse'):
+                columns = parse_irrigation_readings()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({
-            'success': True,
-            'irrigation_needed': irrigation_needed,
-            'confidence': confidence,
-            'probability': prediction_prob,
-            'input_data': {
-                'crop_type': crop_type,
-                'soil_moisture': soil_moisture,
-                'temperature': temperature,
-                'humidity': humidity,
-                'rainfall': rainfall
-            },
-            'recommendations': recommendations,
-            'timestamp': datetime.now().isoformat()
-        })
+        include_recommendations = request.args.get('recommendations', 'false').lower() == 'true'
+        return respond(*irrigation_bulk_response(columns, include_recommendations))
         
     except Exception as e:
-        logger.error(f"Error in irrigation prediction: {str(e)}")
+        logger.error(f"Error in bulk irrigation prediction: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e), 'success': False}), 500
 
-def get_irrigation_recommendations(crop_type, soil_moisture, temperature, humidity, rainfall, irrigation_needed, confidence):
-    """Generate irrigation recommendations based on prediction and conditions"""
-    recommendations = []
-    
-    if irrigation_needed:
-        recommendations.append("🌊 Irrigation is recommended for your crops")
-        
-        if soil_moisture < 30:
-            recommendations.append("💧 Soil moisture is critically low - immediate irrigation needed")
-        elif soil_moisture < 50:
-            recommendations.append("⚠️ Soil moisture is below optimal levels")
-        
-        if temperature > 35:
-            recommendations.append("🌡️ High temperature increases water demand - consider more frequent irrigation")
-        
-        if humidity < 40:
-            recommendations.append("💨 Low humidity increases evaporation - water early morning or evening")
-        
-        if rainfall < 10:
-            recommendations.append("🌧️ Limited rainfall - rely on irrigation for water supply")
-        
-        # Crop-specific recommendations
-        crop_recommendations = {
-            'Rice': "🌾 Rice requires consistent water - maintain 2-3 inches of standing water",
-            'Wheat': "🌾 Wheat needs moderate irrigation - avoid overwatering during grain filling",
-            'Tomato': "🍅 Tomatoes prefer deep, infrequent watering - avoid wetting leaves",
-            'Cotton': "🌿 Cotton needs careful water management - avoid water stress during flowering",
-            'Maize': "🌽 Maize needs regular watering during tasseling and silking stages",
-            'Sugarcane': "🎋 Sugarcane requires heavy irrigation - maintain consistent soil moisture",
-            'Potato': "🥔 Potatoes need consistent moisture - avoid water stress during tuber formation",
-            'Onion': "🧅 Onions need moderate irrigation - reduce watering as bulbs mature",
-            'Chili': "🌶️ Chili peppers need regular watering - avoid water stress during flowering",
-            'Cabbage': "🥬 Cabbage needs consistent moisture - avoid overwatering to prevent splitting"
+def irrigation_bulk_response(columns, include_recommendations=False):
+    """Score parsed readings (name -> list of values) in one vectorized pass; returns (body, status)"""
+    count = len(columns['crop_type'])
+    if count == 0:
+        return {'error': 'No readings provided'}, 400
+    if count > IRRIGATION_BULK_MAX_ROWS:
+        return {'error': f'Too many readings: {count} (maximum is {IRRIGATION_BULK_MAX_ROWS})'}, 400
+    
+    with stage('encode'):
+        features, errors, invalid = build_irrigation_features(columns)
+    valid = np.flatnonzero(~invalid)
+    
+    probabilities = score_irrigation(features[valid]) if len(valid) else np.empty(0)
+    
+    crop_types = columns['crop_type']
+    results = []
+    for i, probability in zip(valid.tolist(), probabilities.tolist()):
+        result = {
+            'index': i,
+            'crop_type': crop_types[i],
+            'irrigation_needed': probability > 0.5,
+            'probability': probability
         }
+        if include_recommendations:
+            result['recommendations'] = get_irrigation_recommendations(
+                crop_types[i], *features[i, 1:].tolist(), probability > 0.5, probability
+            )
+        results.append(result)
+    
+    return {
+        'success': True,
+        'count': count,
+        'scored': len(results),
+        'results': results,
+        'errors': [{'index': i, 'error': errors[i]} for i in np.flatnonzero(invalid).tolist()],
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+@app.route('/api/predict-irrigation/sweep', methods=['POST'])
+def predict_irrigation_sweep():
+    """Score a grid of what-if scenarios (forecast series and/or value ranges) around a base reading"""
+    try:
+        with stage('body_parse'):
+            data = request.get_json(silent=True)
+        return respond(*irrigation_sweep_response(data))
         
-        if crop_type in crop_recommendations:
-            recommendations.append(crop_recommendations[crop_type])
-        
-        recommendations.append("⏰ Best irrigation time: Early morning (6-8 AM) or evening (6-8 PM)")
-        recommendations.append("💧 Water deeply and slowly to encourage deep root growth")
-        
-    else:
-        recommendations.append("✅ No irrigation needed at this time")
-        
-        if soil_moisture > 70:
-            recommendations.append("💧 Soil moisture is adequate - avoid overwatering")
-        
-        if rainfall > 20:
-            recommendations.append("🌧️ Recent rainfall provides sufficient moisture")
-        
-        recommendations.append("👀 Monitor soil moisture regularly - check again in 2-3 days")
-        recommendations.append("🌱 Focus on other crop management practices like pest control and fertilization")
+    except Exception as e:
+        logger.error(f"Error in irrigation sweep: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({'error': str(e), 'success': False}), 500
+
+def parse_irrigation_readings():
+    """Read bulk irrigation readings from the request into columns (name -> list of values)"""
+    names = ['crop_type'] + [name for name, _, _, _ in IRRIGATION_FEATURE_RANGES]
+    mimetype = request.mimetype
     
-    # General recommendations
-    recommendations.append("📊 Check soil moisture 2-3 times per week")
-    recommendations.append("🌡️ Monitor weather forecasts for rain predictions")
-    recommendations.append("📈 Keep records of irrigation schedules and crop response")
+    if mimetype in ('text/csv', 'application/csv'):
+        reader = csv.reader(io.StringIO(request.get_data(as_text=True)))
+        header = [column.strip() for column in next(reader, [])]
+        missing = [name for name in names if name not in header]
+        if missing:
+            raise ValueError(f"CSV header is missing columns: {', '.join(missing)}")
+        rows = [row for row in reader if row]
+        return {name: [row[header.index(name)] if len(row) > header.index(name) else None for row in rows] for name in names}
     
-    # Confidence-based recommendations
-    if confidence > 0.8:
-        recommendations.append("🎯 High confidence prediction - follow recommendations closely")
-    elif confidence > 0.6:
-        recommendations.append("⚠️ Moderate confidence - monitor conditions and adjust as needed")
-    else:
-        recommendations.append("❓ Low confidence - consider additional soil testing or expert consultation")
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        readings = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if line.strip():
+                try:
+                    readings.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {line_number}: {str(e)}")
+        return readings_to_columns(readings)
     
-    return recommendations
+    return readings_to_columns(request.get_json(silent=True))
 
-if __name__ == '__main__':
-    # Create models directory if it doesn't exist
-    os.makedirs('models', exist_ok=True)
+def readings_to_columns(data):
+    """Columns (name -> list of values) from a list of readings, a {"readings": [...]} object or columnar data"""
+    names = ['crop_type'] + [name for name, _, _, _ in IRRIGATION_FEATURE_RANGES]
+    if isinstance(data, dict) and 'readings' in data:
+        data = data['readings']
+    if isinstance(data, dict):
+        # Columnar form: {"crop_type": [...], "soil_moisture": [...], ...}
+        lengths = {len(data.get(name) or []) for name in names}
+        if len(lengths) != 1:
+            raise ValueError('All columns must have the same length')
+        return {name: list(data.get(name) or []) for name in names}
+    if not isinstance(data, list):
+        raise ValueError('Send a JSON array of readings, a {"readings": [...]} object, NDJSON or CSV')
     
-    # Load pest recognition model on startup
+    return {name: [reading.get(name) if isinstance(reading, dict) else None for reading in data] for name in names}
+
+# Precomputed crop name -> encoded value tables, keyed by label encoder
+crop_lookups = {}
+
+def get_crop_lookup(label_encoder):
+    """Crop name -> encoded value, precomputed once per label encoder"""
+    cached = crop_lookups.get(id(label_encoder))
+    if cached is None or cached[0] is not label_encoder:
+        cached = (label_encoder, {crop: index for index, crop in enumerate(label_encoder.classes_.tolist())})
+        crop_lookups[id(label_encoder)] = cached
+    return cached[1]
+
+def to_float_column(values):
+    """Convert a column to float64, with NaN for anything that is not a number"""
     try:
-        # Load the pest model
-        pest_model_path = 'models/pest_model.h5'
-        if os.path.exists(pest_model_path):
-            model_manager.load_model('pest_model', pest_model_path, 'tensorflow')
-            logger.info("Pest recognition model loaded successfully")
-        else:
-            logger.warning("Pest model not found at models/pest_model.h5")
-        
-        # Load pest metadata
-        pest_metadata_path = 'models/pest_model_metadata.pkl'
-        if os.path.exists(pest_metadata_path):
-            pest_metadata = joblib.load(pest_metadata_path)
-            model_manager.models['pest_metadata'] = pest_metadata
-            model_manager.model_info['pest_metadata'] = {
-                'path': pest_metadata_path,
-                'type': 'metadata',
-                'loaded_at': datetime.now().isoformat()
-            }
-            logger.info("Pest metadata loaded successfully")
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                column[i] = np.nan
+        return column
+
+def build_irrigation_features(columns):
+    """
+    Vectorized validation and encoding of irrigation readings.
+    
+    Returns the (n, 5) model feature matrix, an object array holding the error
+    message for each invalid row (None for valid rows) and the invalid-row mask.
+    """
+    crop_types = columns['crop_type']
+    count = len(crop_types)
+    features = np.empty((count, 1 + len(IRRIGATION_FEATURE_RANGES)))
+    errors = np.full(count, None, dtype=object)
+    
+    lookup = get_crop_lookup(model_manager.get_model('irrigation_label_encoder'))
+    features[:, 0] = [lookup.get(crop, -1) if isinstance(crop, str) else -1 for crop in crop_types]
+    
+    # Check the rules in the same order as the single-reading endpoint, so the first failure wins
+    missing = np.array([crop is None for crop in crop_types])
+    not_numbers = np.zeros(count, dtype=bool)
+    out_of_range = []
+    for column, (name, low, high, label) in enumerate(IRRIGATION_FEATURE_RANGES, start=1):
+        values = to_float_column(columns[name])
+        features[:, column] = values
+        missing |= np.array([value is None for value in columns[name]])
+        not_numbers |= np.isnan(values)
+        out_of_range.append((~((values >= low) & (values <= high)), f'{label} must be between {low} and {high}'))
+    
+    checks = [(missing, 'All parameters are required: crop_type, soil_moisture, temperature, humidity, rainfall'),
+              (not_numbers, 'All numeric parameters must be valid numbers')]
+    checks += out_of_range
+    checks.append((features[:, 0] < 0, 'Unknown crop type. Please use a valid crop type.'))
+    
+    invalid = np.zeros(count, dtype=bool)
+    for mask, message in checks:
+        new_errors = mask & ~invalid
+        errors[new_errors] = message
+        invalid |= new_errors
+    
+    return features, errors, invalid
+
+def parse_sweep_values(name, spec):
+    """Values of one sweep axis: a list, {"start", "stop", "step"} (stop included) or {"start", "stop", "num"}"""
+    if isinstance(spec, dict):
+        try:
+            start, stop = float(spec['start']), float(spec['stop'])
+            if 'num' in spec:
+                count = int(spec['num'])
+                step = None
+            else:
+                step = float(spec.get('step', 1))
+                if step <= 0 or stop < start:
+                    raise ValueError
+                count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            if count < 1:
+                raise ValueError
+            if count > IRRIGATION_SWEEP_MAX_POINTS:
+                raise OverflowError
+            values = np.linspace(start, stop, count) if step is None else start + step * np.arange(count)
+        except OverflowError:
+            raise ValueError(f'{name} range has more than {IRRIGATION_SWEEP_MAX_POINTS} values')
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'{name} range needs numeric start <= stop and a positive step, or start, stop and num')
+        return values.tolist()
+    if isinstance(spec, list) and spec:
+        return spec
+    raise ValueError(f'{name} must be a non-empty list or a {{"start", "stop", "step"}} range')
+
+def build_sweep_features(data):
+    """
+    Expand a sweep request into the unscaled (n, 5) feature matrix.
+    
+    Every "forecast" series shares one time axis, and every "vary" entry adds
+    an axis of its own; each variable not on an axis keeps its "base" value.
+    Returns (features, axes, shape) with axes describing each dimension.
+    """
+    base = data.get('base') or {}
+    forecast = data.get('forecast') or {}
+    vary = data.get('vary') or {}
+    if not isinstance(base, dict) or not isinstance(forecast, dict) or not isinstance(vary, dict):
+        raise ValueError('base, forecast and vary must be JSON objects')
+    
+    names = ['crop_type'] + [name for name, _, _, _ in IRRIGATION_FEATURE_RANGES]
+    # "time" only labels the forecast steps; it is not a variable that can be varied
+    unknown = [name for name in forecast if name not in names and name != 'time'] + [name for name in vary if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown sweep variable {unknown[0]!r}; use one of {', '.join(names)}")
+    both = sorted(set(forecast) & set(vary))
+    if both:
+        raise ValueError(f"{', '.join(both)} cannot be both a forecast series and a vary range")
+    
+    # axis: (name, label values or None, {variable: values along the axis})
+    axes = []
+    series = {name: values for name, values in forecast.items() if name != 'time'}
+    if series:
+        lengths = {name: len(values) if isinstance(values, list) else -1 for name, values in series.items()}
+        if min(lengths.values()) < 1 or len(set(lengths.values())) != 1:
+            raise ValueError('Forecast series must be non-empty lists of the same length')
+        length = next(iter(lengths.values()))
+        labels = forecast.get('time')
+        if labels is not None and (not isinstance(labels, list) or len(labels) != length):
+            raise ValueError('forecast.time must list one label per forecast step')
+        axes.append(('forecast', labels, series))
+    elif 'time' in forecast:
+        raise ValueError('forecast.time labels need at least one forecast series')
+    for name, spec in vary.items():
+        values = parse_sweep_values(name, spec)
+        axes.append((name, values, {name: values}))
+    if not axes:
+        raise ValueError('Provide forecast series and/or vary ranges to sweep')
+    
+    shape = tuple(len(next(iter(variables.values()))) for _, _, variables in axes)
+    count = math.prod(shape)
+    if count > IRRIGATION_SWEEP_MAX_POINTS:
+        raise ValueError(f'Sweep has {count} scenarios (maximum is {IRRIGATION_SWEEP_MAX_POINTS})')
+    
+    swept = {name: (axis, values) for axis, (_, _, variables) in enumerate(axes) for name, values in variables.items()}
+    missing = [name for name in names if name not in swept and base.get(name) is None]
+    if missing:
+        raise ValueError(f"base is missing {', '.join(missing)}")
+    
+    lookup = get_crop_lookup(model_manager.get_model('irrigation_label_encoder'))
+    features = np.empty(shape + (len(names),))
+    for column, name in enumerate(names):
+        axis, values = swept.get(name, (None, [base.get(name)]))
+        if name == 'crop_type':
+            unknown = [crop for crop in values if not isinstance(crop, str) or crop not in lookup]
+            if unknown:
+                raise ValueError(f'Unknown crop type: {unknown[0]}. Please use a valid crop type.')
+            column_values = np.array([lookup[crop] for crop in values], dtype=np.float64)
         else:
-            logger.warning("Pest metadata not found at models/pest_model_metadata.pkl")
-            
-    except Exception as e:
-        logger.error(f"Error loading pest model: {str(e)}")
+            column_values = to_float_column(values)
+            _, low, high, label = IRRIGATION_FEATURE_RANGES[column - 1]
+            if np.isnan(column_values).any():
+                raise ValueError(f'{label} values must be valid numbers')
+            if ((column_values < low) | (column_values > high)).any():
+                raise ValueError(f'{label} must be between {low} and {high}')
+        
+        # Broadcast the values along their own axis of the grid
+        if axis is not None:
+            column_values = column_values.reshape([-1 if i == axis else 1 for i in range(len(shape))])
+        features[..., column] = column_values
+    
+    axes = [
+        {'name': name, 'length': shape[i], 'variables': sorted(variables), **({'values': labels} if labels is not None else {})}
+        for i, (name, labels, variables) in enumerate(axes)
+    ]
+    return features.reshape(count, len(names)), axes, shape
+
+def irrigation_sweep_response(data):
+    """Irrigation what-if sweep for already-parsed request data; returns (body, status)"""
+    if not isinstance(data, dict):
+        return {'error': 'No JSON data provided'}, 400
+    
+    for name, label in (('irrigation_model', 'Irrigation prediction model'),
+                        ('irrigation_scaler', 'Irrigation scaler'),
+                        ('irrigation_label_encoder', 'Irrigation label encoder')):
+        if not model_manager.has_model(name):
+            return {'error': f'{label} not loaded. Please load it first.'}, 404
     
-    # Load irrigation model and components on startup
     try:
-        # Load irrigation model
-        irrigation_model_path = 'models/irrigation_model_complete.h5'
-        if os.path.exists(irrigation_model_path):
-            model_manager.load_model('irrigation_model', irrigation_model_path, 'tensorflow')
-            logger.info("Irrigation model loaded successfully")
-        else:
-            logger.warning("Irrigation model not found at models/irrigation_model_complete.h5")
-        
-        # Load irrigation scaler
-        irrigation_scaler_path = 'models/scaler.pkl'
-        if os.path.exists(irrigation_scaler_path):
-            scaler = joblib.load(irrigation_scaler_path)
-            model_manager.models['irrigation_scaler'] = scaler
-            model_manager.model_info['irrigation_scaler'] = {
-                'path': irrigation_scaler_path,
-                'type': 'scaler',
-                'loaded_at': datetime.now().isoformat()
-            }
-            logger.info("Irrigation scaler loaded successfully")
-        else:
-            logger.warning("Irrigation scaler not found at models/scaler.pkl")
-        
-        # Load irrigation label encoder
-        irrigation_label_encoder_path = 'models/label_encoder.pkl'
-        if os.path.exists(irrigation_label_encoder_path):
-            label_encoder = joblib.load(irrigation_label_encoder_path)
-            model_manager.models['irrigation_label_encoder'] = label_encoder
-            model_manager.model_info['irrigation_label_encoder'] = {
-                'path': irrigation_label_encoder_path,
-                'type': 'label_encoder',
-                'loaded_at': datetime.now().isoformat()
-            }
-            logger.info("Irrigation label encoder loaded successfully")
+        precision = int(data.get('precision', 4))
+        with stage('encode'):
+            features, axes, shape = build_sweep_features(data)
+    except (TypeError, ValueError) as e:
+        return {'error': str(e)}, 400
+    
+    probabilities = score_irrigation(features).reshape(shape)
+    needed = probabilities > 0.5
+    
+    return {
+        'success': True,
+        'axes': axes,
+        'shape': list(shape),
+        # Rounded in float64: float32 values such as 0.0003 would serialize as 0.0003000000142492354
+        'probabilities': np.round(probabilities.astype(np.float64), precision).tolist(),
+        'summary': {
+            'scenarios': int(probabilities.size),
+            'irrigation_needed': int(needed.sum()),
+            'any_needed': bool(needed.any()),
+            'max_probability': float(probabilities.max()),
+            'min_probability': float(probabilities.min())
+        },
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+def score_irrigation(features):
+    """Irrigation probability for each row of an (n, 5) unscaled feature matrix"""
+    with stage('model_predict'):
+        if IRRIGATION_INFERENCE == 'numpy' and model_manager.has_model('irrigation_model_numpy'):
+            try:
+                # The scaler is folded into the first layer of the NumPy forward pass
+                return model_manager.get_model('irrigation_model_numpy').predict(features)[:, 0]
+            except ValueError as e:
+                logger.warning(f"Falling back to Keras for irrigation scoring: {str(e)}")
+        
+        # Scale the input data
+        scaler = model_manager.get_model('irrigation_scaler')
+        input_scaled = scaler.transform(features)
+        
+        # Make prediction
+        model = model_manager.get_model('irrigation_model')
+        return np.asarray(model.predict(input_scaled, verbose=0))[:, 0]
+
+def get_irrigation_recommendations(crop_type, soil_moisture, temperature, humidity, rainfall, irrigation_needed, confidence):
+    """Generate irrigation recommendations based on prediction and conditions (rules in data/irrigation_recommendations.json)"""
+    return IRRIGATION_RECOMMENDATIONS.get(
+        crop_type, soil_moisture, temperature, humidity, rainfall, irrigation_needed, confidence
+    )
+
+def init_models(warm_up=MODEL_WARMUP, background=True, model_types=None):
+    """Register the manifest models, enable batching and (optionally) warm them up"""
+    # Create models directory if it doesn't exist
+    os.makedirs('models', exist_ok=True)
+    
+    # Register models from the manifest; each one is loaded on first use
+    if not model_manager.registry:
+        if os.path.exists(MODEL_MANIFEST):
+            model_manager.load_manifest(MODEL_MANIFEST)
         else:
-            logger.warning("Irrigation label encoder not found at models/label_encoder.pkl")
-            
-    except Exception as e:
-        logger.error(f"Error loading irrigation model components: {str(e)}")
+            logger.warning(f"Model manifest not found at {MODEL_MANIFEST}")
     
-    # Load any other existing models on startup
-    models_dir = 'models'
-    if os.path.exists(models_dir):
-        for file in os.listdir(models_dir):
-            if file.endswith(('.pkl', '.joblib', '.h5', '.pth')) and file not in ['pest_model.h5', 'pest_model_metadata.pkl', 'irrigation_model_complete.h5', 'scaler.pkl', 'label_encoder.pkl']:
-                model_name = file.split('.')[0]
-                model_path = os.path.join(models_dir, file)
-                model_type = 'sklearn' if file.endswith(('.pkl', '.joblib')) else 'tensorflow' if file.endswith('.h5') else 'pytorch'
-                model_manager.load_model(model_name, model_path, model_type)
+    if model_manager.has_model('pest_model') and 'pest_model' not in model_manager.batchers:
+        model_manager.enable_batching('pest_model', PEST_BATCH_MAX_SIZE, PEST_BATCH_MAX_WAIT_MS)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # /api/health answers as soon as the process is up; /api/ready waits for the models
+    if not warm_up:
+        model_manager.ready.set()
+        return None
+    
+    model_names = None
+    if model_types is not None:
+        model_names = [name for name, entry in model_manager.registry.items()
+                       if entry['type'] in model_types and entry.get('preload', True)]
+    if background:
+        return model_manager.start_warm_up(model_names, max_workers=MODEL_LOAD_WORKERS)
+    return model_manager.warm_up(model_names, max_workers=MODEL_LOAD_WORKERS)
 
+if __name__ == '__main__':
+    # Development server; use serve.py for multi-worker production serving
+    init_models()
+    if os.environ.get('ML_RPC_SOCKET'):
+        # The same endpoints over a Unix socket for local callers such as server.js (see rpc_server.py)
+        import rpc_server
+        rpc_server.start_for(sys.modules[__name__], path=os.environ['ML_RPC_SOCKET'])
+    app.run(debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true', host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,238 @@
+"""
+ASGI app - asyncio variant of the app.py prediction routes
+
+Request bodies are received and parsed on the event loop, so a slow mobile
+upload only holds a coroutine, not a worker thread. Image decoding and model
+inference are handed to a bounded thread pool; the route logic itself is the
+same *_response() functions the Flask app uses.
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    python serve.py --service async --workers 4
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import advice_tables
+import app as flask_app
+import metrics
+from app import (model_manager, crop_prediction_response, yield_prediction_response,
+                 pest_detection_response, irrigation_prediction_response, irrigation_sweep_response, RAW_IMAGE_MIMETYPES,
+                 stage, record_request)
+
+logger = logging.getLogger(__name__)
+
+# Threads running decode and inference; NumPy, PIL, TFLite and TF release the GIL while they work
+ASYNC_INFERENCE_WORKERS = int(os.environ.get('ASYNC_INFERENCE_WORKERS', min(8, os.cpu_count() or 1)))
+
+# Requests allowed to wait for an inference thread before new ones are turned away with 503
+ASYNC_MAX_PENDING = int(os.environ.get('ASYNC_MAX_PENDING', 256))
+
+# Largest request body accepted (bytes)
+ASYNC_MAX_BODY_BYTES = int(os.environ.get('ASYNC_MAX_BODY_BYTES', 32 * 1024 * 1024))
+
+# Created per process in lifespan(), after any fork
+inference_executor = None
+_pending = None
+
+
+class RequestError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+async def offload(func, *args):
+    """Run a blocking (body, status) handler on the inference pool"""
+    if _pending.locked():
+        return {'error': 'Server busy, please retry', 'success': False}, 503
+    # Carry the route label over to the pool thread so stage timings are attributed to it
+    context = contextvars.copy_context()
+    async with _pending:
+        return await asyncio.get_running_loop().run_in_executor(inference_executor, context.run, func, *args)
+
+
+class FragmentJSONResponse(JSONResponse):
+    """JSONResponse that writes static advice from its pre-serialized JSON"""
+
+    def render(self, content):
+        return advice_tables.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def respond(body, status, started):
+    with stage('serialize'):
+        response = FragmentJSONResponse(body, status_code=status)
+    record_request(metrics.current_route.get(), 'POST', status, time.perf_counter() - started)
+    return response
+
+
+async def read_body(request):
+    """Receive the whole request body without blocking the loop, enforcing the size limit"""
+    length = request.headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > ASYNC_MAX_BODY_BYTES:
+        raise RequestError(f'Request body too large (maximum is {ASYNC_MAX_BODY_BYTES} bytes)', 413)
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > ASYNC_MAX_BODY_BYTES:
+            raise RequestError(f'Request body too large (maximum is {ASYNC_MAX_BODY_BYTES} bytes)', 413)
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def read_json(request):
+    body = await read_body(request)
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise RequestError('Request body is not valid JSON')
+
+
+async def read_uploaded_image(request):
+    """
+    Receive the uploaded image: returns (image bytes, None) for a raw body or
+    multipart part, or (None, JSON body bytes) for a base64 JSON upload.
+    """
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip().lower()
+
+    if mimetype in RAW_IMAGE_MIMETYPES:
+        return await read_body(request), None
+
+    if mimetype == 'multipart/form-data':
+        # Received through the same size check as raw bodies, then parsed from memory
+        body = await read_body(request)
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async with Request(request.scope, receive).form(max_files=1) as form:
+            part = form.get('image') or next((value for value in form.values() if hasattr(value, 'read')), None)
+            return (await part.read() if part is not None else None), None
+
+    # The JSON body is mostly base64, so it is parsed on the pool together with the image
+    return None, await read_body(request)
+
+
+def pest_detection_from_upload(image, json_body):
+    if json_body is not None:
+        try:
+            data = json.loads(json_body) if json_body else None
+        except ValueError:
+            return {'error': 'Request body is not valid JSON', 'success': False}, 400
+        image = data.get('image') if isinstance(data, dict) else None
+    return pest_detection_response(image or None)
+
+
+def json_route(handler, label, with_traceback=False):
+    """Wrap a blocking (body, status) handler taking parsed JSON as an async Starlette endpoint"""
+    async def endpoint(request):
+        started = time.perf_counter()
+        metrics.current_route.set(request.url.path)
+        try:
+            with stage('body_parse'):
+                data = await read_json(request)
+            body, status = await offload(handler, data)
+        except RequestError as e:
+            body, status = {'error': str(e), 'success': False}, e.status
+        except Exception as e:
+            logger.error(f"Error in {label}: {str(e)}")
+            if with_traceback:
+                logger.error(f"Traceback: {traceback.format_exc()}")
+            body, status = {'error': str(e), 'success': False}, 500
+        return respond(body, status, started)
+    return endpoint
+
+
+async def pest_detection(request):
+    """Detect pests from uploaded image"""
+    started = time.perf_counter()
+    metrics.current_route.set(request.url.path)
+    try:
+        with stage('body_parse'):
+            image, json_body = await read_uploaded_image(request)
+        body, status = await offload(pest_detection_from_upload, image, json_body)
+    except RequestError as e:
+        body, status = {'error': str(e), 'success': False}, e.status
+    except Exception as e:
+        logger.error(f"Error in pest detection: {str(e)}")
+        body, status = {'error': str(e), 'success': False}, 500
+    return respond(body, status, started)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'loaded_models': list(model_manager.models.keys())
+    })
+
+
+async def readiness_check(request):
+    """Readiness check: 200 once registered models are loaded, 503 while they are still warming up"""
+    ready = model_manager.ready.is_set()
+    return JSONResponse({
+        'status': 'ready' if ready else 'warming',
+        'warmup': model_manager.warmup_status,
+        'loaded_models': list(model_manager.models.keys()),
+        'timestamp': datetime.now().isoformat()
+    }, status_code=200 if ready else 503)
+
+
+async def prometheus_metrics(request):
+    """Request, stage and model metrics in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), headers={'content-type': metrics.CONTENT_TYPE})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global inference_executor, _pending
+    inference_executor = ThreadPoolExecutor(max_workers=ASYNC_INFERENCE_WORKERS, thread_name_prefix='async-inference')
+    _pending = asyncio.Semaphore(ASYNC_MAX_PENDING)
+    # Models warm up in the background; /api/ready reports when they are loaded
+    flask_app.init_models()
+    yield
+    inference_executor.shutdown(wait=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/health', health_check),
+        Route('/api/ready', readiness_check),
+        Route('/metrics', prometheus_metrics),
+        Route('/api/pest-detection', pest_detection, methods=['POST']),
+        Route('/api/predict-irrigation',
+              json_route(irrigation_prediction_response, 'irrigation prediction', with_traceback=True), methods=['POST']),
+        Route('/api/predict-irrigation/sweep',
+              json_route(irrigation_sweep_response, 'irrigation sweep', with_traceback=True), methods=['POST']),
+        Route('/api/crop-prediction', json_route(crop_prediction_response, 'crop prediction'), methods=['POST']),
+        Route('/api/yield-prediction', json_route(yield_prediction_response, 'yield prediction'), methods=['POST'])
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
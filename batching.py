@@ -0,0 +1,117 @@
+"""
+Micro-batching - groups concurrent inference requests into one forward pass
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Collects concurrent predict calls and runs them through the model as a single batch"""
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, name='batcher'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._reset()
+
+    def _reset(self):
+        self._pending = deque()
+        self._pending_rows = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._pid = os.getpid()
+
+    def submit(self, batch):
+        """Queue a batch of rows and return a Future resolving to its prediction rows"""
+        batch = np.asarray(batch)
+        future = Future()
+        # A forked worker inherits the parent's queue and lock but not its worker thread
+        if self._pid != os.getpid():
+            self._reset()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"Batcher {self.name} is stopped")
+            self._ensure_worker()
+            self._pending.append((batch, future))
+            self._pending_rows += len(batch)
+            self._cond.notify()
+        return future
+
+    def predict(self, batch):
+        """Blocking helper: submit a batch and wait for its own rows"""
+        return self.submit(batch).result()
+
+    def stop(self):
+        """Stop the worker thread once the queue has drained"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        """Wait for the first request, then, if others are already queued with it, up to max_wait for the batch to fill"""
+        with self._cond:
+            while not self._pending and not self._stopped:
+                self._cond.wait()
+            if not self._pending:
+                return []
+
+            # A lone request runs at once; under load, requests queue up while the previous
+            # batch runs, and only then is waiting for a fuller batch worth its latency
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) > 1 and self._pending_rows < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Always take at least one request, even if it alone exceeds the batch size
+            items = [self._pending.popleft()]
+            rows = len(items[0][0])
+            while self._pending and rows + len(self._pending[0][0]) <= self.max_batch_size:
+                item = self._pending.popleft()
+                rows += len(item[0])
+                items.append(item)
+            self._pending_rows -= rows
+            return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if not items:
+                return
+
+            try:
+                if len(items) == 1:
+                    batch = items[0][0]
+                else:
+                    batch = np.concatenate([item[0] for item in items], axis=0)
+                predictions = np.asarray(self.predict_fn(batch))
+            except Exception as e:
+                logger.error(f"Error running batch in {self.name}: {str(e)}")
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            # Hand each caller back its own rows
+            offset = 0
+            for rows, future in items:
+                future.set_result(predictions[offset:offset + len(rows)])
+                offset += len(rows)
@@ -0,0 +1,68 @@
+"""
+Single-flight coalescing - identical concurrent predictions share one model run
+
+When many clients send the same payload at once (a dashboard refresh), the first
+request for a key runs the model and every request that arrives with the same
+key before it finishes waits for that result instead of running it again.
+Nothing is kept once the run completes; caching results is a separate concern.
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from result_cache import content_key
+
+
+def array_key(array, *identity):
+    """Canonical key for a numeric model input: its dtype, shape and bytes plus the model identity.
+    None for arrays whose bytes do not describe their values (object dtype)"""
+    array = np.asarray(array)
+    if array.dtype.kind not in 'biuf':
+        return None
+    array = np.ascontiguousarray(array)
+    return content_key(array.tobytes(), *identity, array.dtype.str, array.shape)
+
+
+class SingleFlight:
+    """Runs fn once per key among concurrent callers and hands every caller its result"""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def run(self, key, fn):
+        """(result, shared) where shared is True when another caller's run produced the result.
+        An exception raised by fn is raised in every caller waiting on it"""
+        # A forked worker must not wait on flights that belong to the parent's threads
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def __len__(self):
+        return len(self._flights)
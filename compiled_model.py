@@ -0,0 +1,88 @@
+"""
+Compiled model - Keras models traced once per bucketed batch size and warmed at load time
+"""
+
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Batch sizes a compiled model is traced for; other sizes are padded up to the next bucket
+BATCH_BUCKETS = tuple(int(b) for b in os.environ.get('TF_BATCH_BUCKETS', '1,2,4,8,16,32').split(','))
+
+
+def bucket_for(batch_size, buckets=BATCH_BUCKETS):
+    """Smallest bucket that fits batch_size (the largest bucket if none does)"""
+    for bucket in buckets:
+        if batch_size <= bucket:
+            return bucket
+    return buckets[-1]
+
+
+class CompiledKerasModel:
+    """
+    Keras-compatible predict() backed by one concrete tf.function per batch bucket.
+
+    Every bucket is traced with a fully static input signature at load time, so
+    no request ever triggers tracing. Batches are zero-padded up to their bucket
+    and anything larger than the biggest bucket is run in bucket-sized chunks.
+    Unknown attributes fall through to the wrapped Keras model.
+    """
+
+    def __init__(self, model, buckets=BATCH_BUCKETS):
+        import tensorflow as tf
+
+        if len(model.inputs) != 1:
+            raise ValueError('Only single-input models can be compiled')
+
+        self.model = model
+        self.buckets = tuple(sorted(set(buckets)))
+        self.sample_shape = tuple(model.inputs[0].shape[1:])
+        self.input_dtype = np.dtype(tf.as_dtype(model.inputs[0].dtype).as_numpy_dtype)
+
+        function = tf.function(lambda x: model(x, training=False))
+        self._functions = {
+            bucket: function.get_concrete_function(tf.TensorSpec((bucket,) + self.sample_shape, self.input_dtype))
+            for bucket in self.buckets
+        }
+        self._tf = tf
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def warm_up(self):
+        """Run every bucket once with synthetic input; returns seconds spent per bucket"""
+        timings = {}
+        for bucket in self.buckets:
+            start = time.perf_counter()
+            self._run(np.zeros((bucket,) + self.sample_shape, dtype=self.input_dtype))
+            timings[bucket] = time.perf_counter() - start
+        return timings
+
+    def _run(self, batch):
+        output = self._functions[len(batch)](self._tf.constant(batch))
+        return output.numpy()
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=self.input_dtype)
+        count = len(batch)
+        largest = self.buckets[-1]
+        if count == 0:
+            return np.zeros((0,) + tuple(self.model.output_shape[1:]), dtype=np.float32)
+
+        outputs = []
+        for start in range(0, count, largest):
+            chunk = batch[start:start + largest]
+            bucket = bucket_for(len(chunk), self.buckets)
+            if bucket != len(chunk):
+                padded = np.zeros((bucket,) + self.sample_shape, dtype=self.input_dtype)
+                padded[:len(chunk)] = chunk
+                chunk = padded
+            outputs.append(self._run(chunk)[:min(largest, count - start)])
+
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
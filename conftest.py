@@ -0,0 +1,20 @@
+"""
+Shared pytest fixtures
+"""
+
+import joblib
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+import app
+
+
+@pytest.fixture
+def crop_encoder(tmp_path, monkeypatch):
+    """Serve a label encoder for rice and wheat as irrigation_label_encoder"""
+    path = str(tmp_path / 'label_encoder.pkl')
+    joblib.dump(LabelEncoder().fit(['rice', 'wheat']), path)
+    manager = app.ModelManager()
+    manager.register_model('irrigation_label_encoder', path, 'label_encoder')
+    monkeypatch.setattr(app, 'model_manager', manager)
+    return manager
@@ -0,0 +1,210 @@
+"""
+Dense inference - runs small Keras Sequential models as plain NumPy matmuls
+
+Weights are read straight from the .h5 artifact with h5py (no TensorFlow import),
+BatchNormalization layers are folded into the following Dense layer, Dropout is
+dropped, and an optional StandardScaler is folded into the first layer, so a
+prediction is just a few matmuls and activations.
+"""
+
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+def _tanh(x):
+    return np.tanh(x, out=x)
+
+
+def _softmax(x):
+    x -= x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def _linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    None: _linear,
+    'linear': _linear,
+    'relu': _relu,
+    'sigmoid': _sigmoid,
+    'tanh': _tanh,
+    'softmax': _softmax
+}
+
+
+class DenseNetwork:
+    """A stack of (kernel, bias, activation) layers evaluated with NumPy"""
+
+    def __init__(self, layers, dtype=np.float32):
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.dtype = dtype
+        self.layers = [
+            (np.ascontiguousarray(kernel, dtype=dtype), np.asarray(bias, dtype=dtype), activation)
+            for kernel, bias, activation in layers
+        ]
+        self.input_dim = self.layers[0][0].shape[0]
+        self.output_dim = self.layers[-1][0].shape[1]
+
+    def predict(self, inputs, verbose=0):
+        """Keras-compatible predict: (n, input_dim) -> (n, output_dim)"""
+        x = np.asarray(inputs, dtype=self.dtype)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        for kernel, bias, activation in self.layers:
+            x = x @ kernel
+            x += bias
+            x = ACTIVATIONS[activation](x)
+        return x
+
+    __call__ = predict
+
+    @property
+    def nbytes(self):
+        return sum(kernel.nbytes + bias.nbytes for kernel, bias, _ in self.layers)
+
+
+def fold_layers(layer_specs, input_mean=None, input_scale=None):
+    """
+    Collapse Dense/BatchNormalization/Dropout specs into (kernel, bias, activation) layers.
+
+    Every BatchNormalization (and the optional input standardization) is an
+    elementwise affine transform a * x + c, which is folded into the kernel and
+    bias of the next Dense layer: (a * x + c) @ W + b == x @ (a[:, None] * W) + (c @ W + b).
+    """
+    layers = []
+    scale = None
+    shift = None
+
+    if input_scale is not None:
+        scale = 1.0 / np.asarray(input_scale, dtype=np.float64)
+        shift = -np.asarray(input_mean, dtype=np.float64) * scale
+
+    for spec in layer_specs:
+        layer_type = spec['type']
+        if layer_type == 'Dense':
+            kernel = np.asarray(spec['kernel'], dtype=np.float64)
+            bias = np.asarray(spec['bias'], dtype=np.float64) if spec.get('bias') is not None else np.zeros(kernel.shape[1])
+            if scale is not None:
+                bias = shift @ kernel + bias
+                kernel = scale[:, np.newaxis] * kernel
+                scale = shift = None
+            layers.append((kernel, bias, spec.get('activation')))
+        elif layer_type == 'BatchNormalization':
+            size = len(spec['moving_mean'])
+            gamma = np.asarray(spec['gamma'], dtype=np.float64) if spec.get('gamma') is not None else np.ones(size)
+            beta = np.asarray(spec['beta'], dtype=np.float64) if spec.get('beta') is not None else np.zeros(size)
+            bn_scale = gamma / np.sqrt(np.asarray(spec['moving_variance'], dtype=np.float64) + spec.get('epsilon', 1e-3))
+            bn_shift = beta - np.asarray(spec['moving_mean'], dtype=np.float64) * bn_scale
+            if scale is None:
+                scale, shift = bn_scale, bn_shift
+            else:
+                scale, shift = scale * bn_scale, shift * bn_scale + bn_shift
+        elif layer_type in ('Dropout', 'InputLayer', 'GaussianNoise', 'GaussianDropout'):
+            # Identity at inference time
+            continue
+        else:
+            raise ValueError(f"Unsupported layer type: {layer_type}")
+
+    if scale is not None:
+        # Trailing affine transform with no Dense after it: apply it as a diagonal layer
+        layers.append((np.diag(scale), shift, None))
+
+    return layers
+
+
+def _read_weight_group(group, names):
+    return [group[name][()] for name in names]
+
+
+def read_h5_layer_specs(path, architecture=None):
+    """
+    Read Dense/BatchNormalization/Dropout specs from a Keras .h5 file.
+
+    Full-model files carry their own architecture in model_config. Weights-only
+    Keras 3 files (*.weights.h5) do not, so the layer list (type, activation,
+    epsilon...) has to be passed as architecture, e.g. the 'layers' entry of
+    model_metadata.pkl.
+    """
+    import h5py
+
+    specs = []
+    with h5py.File(path, 'r') as f:
+        if 'model_config' in f.attrs:
+            config = json.loads(f.attrs['model_config'])
+            weights_root = f['model_weights'] if 'model_weights' in f else f
+            for layer in config['config']['layers']:
+                layer_type = layer['class_name']
+                layer_config = layer['config']
+                spec = {'type': layer_type, 'activation': layer_config.get('activation')}
+                if layer_type in ('Dense', 'BatchNormalization'):
+                    group = weights_root[layer_config['name']]
+                    names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names']]
+                    values = {name.split('/')[-1].split(':')[0]: group[name][()] for name in names}
+                    spec.update(values)
+                    spec['epsilon'] = layer_config.get('epsilon', 1e-3)
+                specs.append(spec)
+        else:
+            if architecture is None:
+                raise ValueError(f"{path} has no model config; pass the layer architecture explicitly")
+            counts = {}
+            for layer in architecture:
+                layer_type = layer['type']
+                spec = {'type': layer_type, 'activation': layer.get('activation')}
+                if layer_type in ('Dense', 'BatchNormalization'):
+                    prefix = 'dense' if layer_type == 'Dense' else 'batch_normalization'
+                    index = counts.get(prefix, 0)
+                    counts[prefix] = index + 1
+                    group = f['layers'][prefix if index == 0 else f"{prefix}_{index}"]['vars']
+                    values = _read_weight_group(group, sorted(group.keys(), key=int))
+                    if layer_type == 'Dense':
+                        spec['kernel'], spec['bias'] = values[0], values[1] if len(values) > 1 else None
+                    else:
+                        # Keras 3 order: gamma, beta, moving_mean, moving_variance (gamma/beta optional)
+                        if len(values) == 4:
+                            spec['gamma'], spec['beta'] = values[0], values[1]
+                        spec['moving_mean'], spec['moving_variance'] = values[-2], values[-1]
+                        spec['epsilon'] = layer.get('epsilon', 1e-3)
+                specs.append(spec)
+    return specs
+
+
+def load_dense_network(path, scaler=None, architecture=None):
+    """Build a DenseNetwork from a .h5 artifact, folding an optional fitted StandardScaler into it"""
+    specs = read_h5_layer_specs(path, architecture)
+    if scaler is not None:
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        if mean is None:
+            mean = np.zeros(scaler.n_features_in_)
+        if scale is None:
+            scale = np.ones(scaler.n_features_in_)
+        return DenseNetwork(fold_layers(specs, mean, scale))
+    return DenseNetwork(fold_layers(specs))
+
+
+def max_abs_error(network, reference_predict, samples):
+    """Largest absolute difference between the NumPy network and a reference predict function"""
+    expected = np.asarray(reference_predict(samples), dtype=np.float64)
+    actual = network.predict(samples).astype(np.float64)
+    return float(np.max(np.abs(expected - actual)))
@@ -0,0 +1,119 @@
+"""
+Feature schema - maps request dicts onto a model's input columns in a fixed order
+
+A schema is compiled once when a model loads, from the "features" list of its
+manifest entry or from the feature names the model was fitted with. Request
+payloads are then written straight into a float64 array in the model's column
+order, whatever order the client sent the keys in; fields the model does not
+use are ignored and categorical strings are encoded instead of passed through.
+
+Manifest example:
+    {"name": "crop_model", "path": "crop_model.pkl", "type": "sklearn",
+     "features": ["soil_ph", "nitrogen", "phosphorus", "potassium",
+                  {"name": "rainfall", "default": 1000},
+                  {"name": "region", "categories": ["arid", "temperate", "tropical"], "encoding": "onehot"}]}
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class FeatureError(ValueError):
+    """A request payload does not fit the model's feature schema"""
+
+
+def is_records(input_data):
+    """True for a dict or a non-empty list of dicts, the payloads a schema can map"""
+    if isinstance(input_data, Mapping):
+        return True
+    return isinstance(input_data, list) and bool(input_data) and all(isinstance(row, Mapping) for row in input_data)
+
+
+def predicts_by_max_probability(model):
+    """True when predict() returns the most probable class, so one predict_proba() pass gives both"""
+    classes = getattr(model, 'classes_', None)
+    if not hasattr(model, 'predict_proba') or not isinstance(classes, np.ndarray) or classes.ndim != 1:
+        return False
+    # SVC-style models calibrate their probabilities separately from the decision function predict() uses
+    estimator = getattr(model, '_final_estimator', model)
+    return not getattr(estimator, 'probability', False)
+
+
+class FeatureSchema:
+    """Compiled column layout for one model"""
+
+    def __init__(self, features):
+        # Each field: (name, first column, category -> offset or None, categories, onehot, default)
+        self.fields = []
+        self.columns = []
+        for spec in features:
+            if isinstance(spec, str):
+                spec = {'name': spec}
+            name = spec['name']
+            categories = spec.get('categories')
+            encoding = spec.get('encoding', 'onehot' if categories else None)
+            if encoding not in (None, 'onehot', 'ordinal'):
+                raise ValueError(f"Unknown encoding {encoding!r} for feature {name}")
+            if encoding and not categories:
+                raise ValueError(f"Feature {name} needs categories for {encoding} encoding")
+
+            lookup = None
+            if categories:
+                # Exact match first, then case-insensitive
+                lookup = {str(category).lower(): i for i, category in enumerate(categories)}
+                lookup.update({str(category): i for i, category in enumerate(categories)})
+            self.fields.append((name, len(self.columns), lookup, categories, encoding == 'onehot', spec.get('default')))
+            if encoding == 'onehot':
+                self.columns.extend(f'{name}={category}' for category in categories)
+            else:
+                self.columns.append(name)
+        self.width = len(self.columns)
+        self.names = [field[0] for field in self.fields]
+
+    @classmethod
+    def for_model(cls, entry, model):
+        """Schema from the manifest entry's "features", else the model's fitted feature names, else None"""
+        if entry.get('features'):
+            return cls(entry['features'])
+        names = getattr(model, 'feature_names_in_', None)
+        if names is not None:
+            return cls([str(name) for name in names])
+        return None
+
+    def transform(self, records):
+        """(n, width) float64 array for one dict or a list of dicts; raises FeatureError naming the bad field"""
+        if isinstance(records, Mapping):
+            records = [records]
+        out = np.zeros((len(records), self.width))
+
+        for row, record in enumerate(records):
+            if not isinstance(record, Mapping):
+                raise FeatureError(f'Row {row} must be an object with fields {", ".join(self.names)}')
+            for name, column, lookup, categories, onehot, default in self.fields:
+                value = record.get(name)
+                if value is None:
+                    value = default
+                    if value is None:
+                        raise FeatureError(f'Missing required field: {name}')
+
+                if lookup is None:
+                    try:
+                        out[row, column] = float(value)
+                    except (TypeError, ValueError):
+                        raise FeatureError(f'{name} must be a number, got {value!r}')
+                    continue
+
+                offset = lookup.get(str(value))
+                if offset is None:
+                    offset = lookup.get(str(value).lower())
+                if offset is None:
+                    raise FeatureError(f"Unknown {name} {value!r}; expected one of {', '.join(map(str, categories))}")
+                if onehot:
+                    out[row, column + offset] = 1.0
+                else:
+                    out[row, column] = offset
+        return out
+
+    def describe(self):
+        return {'fields': self.names, 'columns': self.columns}
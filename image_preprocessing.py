@@ -0,0 +1,141 @@
+"""
+Image preprocessing - shared decode/resize/normalize pipeline for pest detection
+
+Images are decoded at reduced size through JPEG DCT scaling (Image.draft) and
+written straight into a preallocated float32 batch buffer, so no full-resolution
+RGB copy or float64 intermediate is ever created.
+"""
+
+import base64
+import io
+import time
+
+import numpy as np
+
+# Default model input size
+DEFAULT_TARGET_SIZE = (128, 128)
+
+# Stage names reported in timings
+STAGES = ('base64_decode', 'decode', 'resize', 'normalize')
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def new_timings():
+    """Return an empty per-stage timing dict (seconds)"""
+    return {stage: 0.0 for stage in STAGES}
+
+
+def read_image_bytes(source, timings=None):
+    """Return the encoded image bytes from a base64 string, data URL, raw bytes or file-like object"""
+    if hasattr(source, 'read'):
+        return source.read()
+
+    if isinstance(source, str):
+        start = time.perf_counter()
+        # Remove data URL prefix if present
+        if source.startswith('data:'):
+            source = source[source.index(',') + 1:]
+        source = base64.b64decode(source)
+        if timings is not None:
+            timings['base64_decode'] += time.perf_counter() - start
+
+    return source
+
+
+def open_image(source, timings=None):
+    """Open a base64 string, data URL, raw bytes or file-like object as a lazy PIL image"""
+    # PIL is only imported once an image actually needs decoding
+    from PIL import Image
+
+    if hasattr(source, 'read'):
+        return Image.open(source)
+    return Image.open(io.BytesIO(read_image_bytes(source, timings)))
+
+
+def _decode_resized(source, target_size, timings=None):
+    """Decode one image to an RGB PIL image of target_size"""
+    base64_before = timings['base64_decode'] if timings is not None else 0.0
+    start = time.perf_counter()
+    image = open_image(source, timings)
+
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    image.draft('RGB', target_size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.load()
+    decoded = time.perf_counter()
+
+    if image.size != tuple(target_size):
+        image = image.resize(target_size)
+
+    if timings is not None:
+        timings['decode'] += decoded - start - (timings['base64_decode'] - base64_before)
+        timings['resize'] += time.perf_counter() - decoded
+    return image
+
+
+def decode_pixels(source, target_size=DEFAULT_TARGET_SIZE):
+    """Decode one image into a (H, W, 3) uint8 array; a quarter of the float32 size to pass between processes"""
+    return np.asarray(_decode_resized(source, target_size), dtype=np.uint8)
+
+
+def normalize_into(pixels, out):
+    """Scale uint8 pixels to [0, 1] into a float32 buffer of the same shape"""
+    return np.multiply(pixels, _SCALE, out=out)
+
+
+def decode_into(source, out, target_size=DEFAULT_TARGET_SIZE, timings=None):
+    """Decode one image and write it, normalized to [0, 1], into a (H, W, 3) float32 view"""
+    image = _decode_resized(source, target_size, timings)
+    start = time.perf_counter()
+    normalize_into(np.asarray(image, dtype=np.uint8), out)
+    if timings is not None:
+        timings['normalize'] += time.perf_counter() - start
+    return out
+
+
+def allocate_batch(batch_size, target_size=DEFAULT_TARGET_SIZE):
+    """Allocate a float32 NHWC batch buffer for the given model input size"""
+    width, height = target_size
+    return np.empty((batch_size, height, width, 3), dtype=np.float32)
+
+
+def preprocess_image(source, target_size=DEFAULT_TARGET_SIZE, timings=None):
+    """Preprocess a single image into a (1, H, W, 3) float32 batch"""
+    batch = allocate_batch(1, target_size)
+    decode_into(source, batch[0], target_size, timings)
+    return batch
+
+
+def preprocess_batch(sources, target_size=DEFAULT_TARGET_SIZE, executor=None, timings=None):
+    """
+    Preprocess several images into one float32 batch buffer.
+
+    Returns (batch, errors) where errors maps the index of each image that could
+    not be decoded to its error message; the batch holds only the decoded images,
+    in their original order.
+    """
+    batch = allocate_batch(len(sources), target_size)
+    errors = {}
+
+    def decode_row(i):
+        row_timings = new_timings() if timings is not None else None
+        try:
+            decode_into(sources[i], batch[i], target_size, row_timings)
+        except Exception as e:
+            errors[i] = str(e)
+        return row_timings
+
+    if executor is not None and len(sources) > 1:
+        row_timings = list(executor.map(decode_row, range(len(sources))))
+    else:
+        row_timings = [decode_row(i) for i in range(len(sources))]
+
+    if timings is not None:
+        for stage in STAGES:
+            timings[stage] += sum(t[stage] for t in row_timings)
+
+    if errors:
+        batch = batch[[i for i in range(len(sources)) if i not in errors]]
+    return batch, errors
@@ -0,0 +1,426 @@
+"""
+Load Benchmark - drives app.py and pest_detection_api.py with synthetic traffic
+
+Each scenario sends a fixed number of requests at a given concurrency, either
+through the Flask test client (no network), through an in-process HTTP server
+on a local socket, or against an already running server (--url). Throughput,
+latency percentiles and peak RSS are printed and written as JSON so runs can
+be compared over time (--compare).
+
+Usage:
+    python load_benchmark.py
+    python load_benchmark.py --target app --scenarios pest,irrigation --concurrency 1,8,32
+    python load_benchmark.py --mode socket --resolutions 640x480,4000x3000
+    python load_benchmark.py --url http://localhost:5000 --server-pid 1234
+    python load_benchmark.py --compare benchmarks/load_20250101T120000.json
+"""
+
+import argparse
+import base64
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Crops known to the shipped irrigation label encoder
+IRRIGATION_CROPS = ['Coffee', 'Garden Flowers', 'Groundnuts', 'Maize', 'Paddy', 'Potato', 'Pulse', 'Sugarcane', 'Wheat']
+
+# Scenarios each target can run
+TARGET_SCENARIOS = {
+    'app': ('pest', 'pest-batch', 'irrigation', 'irrigation-bulk', 'crop'),
+    'pest': ('pest',)
+}
+
+# Fields of the crop scenario's payload, in the column order of the synthetic crop model
+CROP_FEATURES = ['soil_ph', 'nitrogen', 'phosphorus', 'potassium', 'rainfall', 'temperature', 'humidity']
+
+# Scenarios whose payload is an image (run once per resolution)
+IMAGE_SCENARIOS = ('pest', 'pest-batch')
+
+DEFAULT_OUTPUT_DIR = 'benchmarks'
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def synthetic_jpeg(width, height, seed):
+    """Smooth random colour field encoded as JPEG, roughly the size of a real photo"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, size=(max(2, height // 32), max(2, width // 32), 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize((width, height), Image.BILINEAR)
+    noise = rng.integers(-12, 13, size=(height, width, 3))
+    pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class PayloadFactory:
+    """Builds request payloads; images get random trailing bytes so the result cache never hits"""
+
+    def __init__(self, resolution, pool_size=8, cache_hits=False, bulk_rows=1000, batch_images=8, seed=0):
+        self.cache_hits = cache_hits
+        self.bulk_rows = bulk_rows
+        self.batch_images = batch_images
+        self.rng = random.Random(seed)
+        self.images = [synthetic_jpeg(*resolution, seed + i) for i in range(pool_size)] if resolution else []
+
+    def image(self):
+        image = self.rng.choice(self.images)
+        if self.cache_hits:
+            return image
+        # Bytes after the JPEG end-of-image marker are ignored by the decoder but change the content hash
+        return image + os.urandom(16)
+
+    def irrigation_reading(self):
+        return {
+            'crop_type': self.rng.choice(IRRIGATION_CROPS),
+            'soil_moisture': round(self.rng.uniform(0, 100), 2),
+            'temperature': round(self.rng.uniform(-10, 50), 2),
+            'humidity': round(self.rng.uniform(0, 100), 2),
+            'rainfall': round(self.rng.uniform(0, 500), 2)
+        }
+
+    def request(self, scenario):
+        """(method, path, body bytes, content type) for one request"""
+        if scenario == 'pest':
+            body = {'image': base64.b64encode(self.image()).decode('ascii')}
+            return 'POST', '/api/pest-detection', json.dumps(body).encode(), 'application/json'
+        if scenario == 'pest-batch':
+            body = {'images': [base64.b64encode(self.image()).decode('ascii') for _ in range(self.batch_images)]}
+            return 'POST', '/api/pest-detection/batch', json.dumps(body).encode(), 'application/json'
+        if scenario == 'irrigation':
+            return 'POST', '/api/predict-irrigation', json.dumps(self.irrigation_reading()).encode(), 'application/json'
+        if scenario == 'irrigation-bulk':
+            body = [self.irrigation_reading() for _ in range(self.bulk_rows)]
+            return 'POST', '/api/predict-irrigation/bulk', json.dumps(body).encode(), 'application/json'
+        if scenario == 'crop':
+            body = {
+                'soil_ph': round(self.rng.uniform(4.5, 8.5), 2),
+                'nitrogen': self.rng.randint(0, 140),
+                'phosphorus': self.rng.randint(5, 145),
+                'potassium': self.rng.randint(5, 205),
+                'rainfall': round(self.rng.uniform(20, 3000), 1),
+                'temperature': round(self.rng.uniform(8, 44), 1),
+                'humidity': round(self.rng.uniform(14, 100), 1)
+            }
+            return 'POST', '/api/crop-prediction', json.dumps(body).encode(), 'application/json'
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+class TestClientTransport:
+    """Calls the Flask app in-process; one test client per thread"""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.local = threading.local()
+
+    def send(self, method, path, body, content_type):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, content_type=content_type)
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Sends real HTTP requests over a keep-alive connection per thread"""
+
+    def __init__(self, base_url, server=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.server = server
+        self.local = threading.local()
+
+    def send(self, method, path, body, content_type):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            connection.request(method, path, body=body, headers={'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            # The server may close idle or HTTP/1.0 connections; retry once on a fresh one
+            connection.close()
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            connection.request(method, path, body=body, headers={'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            connection.close()
+            self.local.connection = None
+        return response.status
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def start_local_server(flask_app):
+    """Serve the Flask app from a thread on an ephemeral local port"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def load_target(target):
+    """Import the real app module and load its models the way its __main__ does"""
+    if target == 'pest':
+        import pest_detection_api
+        if not pest_detection_api.load_model():
+            raise RuntimeError('pest_detection_api could not load its model')
+        return pest_detection_api.app
+
+    import app
+    app.init_models(background=False)
+    if not app.model_manager.has_model('crop_model'):
+        register_synthetic_crop_model(app.model_manager)
+    return app.app
+
+
+def register_synthetic_crop_model(manager):
+    """No crop model ships with the repo; a small random classifier keeps the crop scenario on the success path"""
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 100, size=(400, len(CROP_FEATURES)))
+    labels = np.array(['rice', 'maize', 'chickpea', 'cotton'])[rng.integers(0, 4, size=400)]
+    path = os.path.join(tempfile.mkdtemp(prefix='load_benchmark_'), 'crop_model.pkl')
+    joblib.dump(LogisticRegression(max_iter=500).fit(features, labels), path)
+    manager.register_model('crop_model', path, 'sklearn', features=CROP_FEATURES)
+    print("ℹ️  No crop_model registered; benchmarking a synthetic one")
+
+
+def rss_mb(pid=None):
+    """(current, peak) resident set size in MB for a process (default: this one)"""
+    status_path = f'/proc/{pid or "self"}/status'
+    if os.path.exists(status_path):
+        values = {}
+        with open(status_path) as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    values[key] = int(value.split()[0]) / 1024
+        return round(values.get('VmRSS', 0), 1), round(values.get('VmHWM', 0), 1)
+    if pid is None:
+        # macOS reports ru_maxrss in bytes, Linux in kilobytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak /= 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return None, round(peak, 1)
+    return None, None
+
+
+def run_scenario(transport, factory, scenario, concurrency, num_requests, warmup, rss_pid=None):
+    """Send num_requests requests from concurrency threads; returns the result record"""
+    payloads = [factory.request(scenario) for _ in range(num_requests + warmup)]
+    for payload in payloads[:warmup]:
+        transport.send(*payload)
+
+    latencies = np.zeros(num_requests)
+    statuses = [None] * num_requests
+    next_index = iter(range(num_requests))
+    index_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with index_lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                statuses[i] = transport.send(*payloads[warmup + i])
+            except Exception as e:
+                statuses[i] = type(e).__name__
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    status_counts = Counter(str(status) for status in statuses)
+    errors = sum(count for status, count in status_counts.items() if not status.startswith(('2', '3')))
+    current_rss, peak_rss = rss_mb(rss_pid)
+    milliseconds = latencies * 1000
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'errors': errors,
+        # Throughput of nothing but error responses says nothing about the scenario
+        'failed': errors == num_requests,
+        'status_counts': dict(status_counts),
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(num_requests / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(float(milliseconds.mean()), 3),
+            'p50': round(float(np.percentile(milliseconds, 50)), 3),
+            'p95': round(float(np.percentile(milliseconds, 95)), 3),
+            'p99': round(float(np.percentile(milliseconds, 99)), 3),
+            'max': round(float(milliseconds.max()), 3)
+        },
+        'rss_mb': current_rss,
+        'peak_rss_mb': peak_rss
+    }
+
+
+def result_key(result):
+    return (result['target'], result['scenario'], result.get('resolution'), result['concurrency'])
+
+
+def compare(results, baseline_path):
+    """Print throughput and p95 changes against an earlier results file"""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)['results']}
+
+    print(f"\n📊 Compared with {baseline_path}")
+    matched = 0
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None or result['failed'] or before.get('failed'):
+            continue
+        matched += 1
+        name = '/'.join(str(part) for part in result_key(result) if part is not None)
+        throughput = (result['throughput_rps'] / before['throughput_rps'] - 1) * 100 if before['throughput_rps'] else 0
+        p95 = (result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100 if before['latency_ms']['p95'] else 0
+        print(f"  {name:<45} throughput {throughput:+7.1f}%   p95 {p95:+7.1f}%")
+    if not matched:
+        print("  No scenario/resolution/concurrency combination in common")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark for the Flask APIs')
+    parser.add_argument('--target', choices=('app', 'pest', 'both'), default='both')
+    parser.add_argument('--mode', choices=('client', 'socket'), default='client',
+                        help='Flask test client (in-process) or HTTP over a local socket')
+    parser.add_argument('--url', help='benchmark an already running server instead of importing the app')
+    parser.add_argument('--server-pid', type=int, help='report RSS of this server process (with --url)')
+    parser.add_argument('--scenarios', default='pest,pest-batch,irrigation,irrigation-bulk,crop')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests sent first')
+    parser.add_argument('--resolutions', default='128x128,640x480,1920x1080,4000x3000',
+                        help='synthetic image sizes for the pest scenarios')
+    parser.add_argument('--batch-images', type=int, default=8, help='images per pest-batch request')
+    parser.add_argument('--bulk-rows', type=int, default=1000, help='readings per irrigation-bulk request')
+    parser.add_argument('--cache-hits', action='store_true', help='reuse identical images so the result cache answers')
+    parser.add_argument('--output', help=f'results file (default: {DEFAULT_OUTPUT_DIR}/load_<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    targets = ['app', 'pest'] if args.target == 'both' else [args.target]
+    if args.url and len(targets) > 1:
+        targets = ['app']
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    concurrency_levels = [int(c) for c in args.concurrency.split(',')]
+    resolutions = [parse_resolution(r) for r in args.resolutions.split(',')]
+
+    print("🏋️ Load Benchmark")
+    print("=" * 40)
+
+    results = []
+    for target in targets:
+        if args.url:
+            transport = HTTPTransport(args.url)
+        else:
+            flask_app = load_target(target)
+            if args.mode == 'socket':
+                server, base_url = start_local_server(flask_app)
+                transport = HTTPTransport(base_url, server)
+            else:
+                transport = TestClientTransport(flask_app)
+
+        try:
+            for scenario in scenarios:
+                if scenario not in TARGET_SCENARIOS[target]:
+                    continue
+                for resolution in (resolutions if scenario in IMAGE_SCENARIOS else [None]):
+                    factory = PayloadFactory(resolution, cache_hits=args.cache_hits, bulk_rows=args.bulk_rows,
+                                             batch_images=args.batch_images, seed=args.seed)
+                    for concurrency in concurrency_levels:
+                        result = run_scenario(transport, factory, scenario, concurrency, args.requests,
+                                              args.warmup, args.server_pid)
+                        result['target'] = target
+                        result['resolution'] = f'{resolution[0]}x{resolution[1]}' if resolution else None
+                        results.append(result)
+
+                        label = f"{target} {scenario}" + (f" {result['resolution']}" if resolution else '')
+                        latency = result['latency_ms']
+                        if result['failed']:
+                            print(f"❌ {label:<31} c={concurrency:<3} all {result['requests']} requests failed: "
+                                  f"{result['status_counts']}")
+                            continue
+                        print(f"  {label:<32} c={concurrency:<3} {result['throughput_rps']:>9.1f} req/s  "
+                              f"p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms  "
+                              f"errors {result['errors']}  peak RSS {result['peak_rss_mb']} MB")
+        finally:
+            transport.close()
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': vars(args),
+        'results': results
+    }
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"load_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    failed = [result for result in results if result['failed']]
+    if failed:
+        print(f"❌ {len(failed)} run(s) failed on every request")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
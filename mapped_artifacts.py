@@ -0,0 +1,228 @@
+"""
+Mapped artifacts - model state as read-only memory-mapped .npy files
+
+Pickles and .h5 weights are copied into each process's private heap when they
+load, so every server worker holds its own copy. The export step writes the
+same state as plain .npy files, one directory per artifact, and a models
+manifest whose entries have type "mapped". Loading one maps the files
+read-only: workers share a single page-cache copy, and the load only parses
+the .npy headers.
+
+Exported kinds:
+    estimator  scikit-learn objects whose fitted state is arrays and scalars
+               (StandardScaler, LabelEncoder, linear models...), rebuilt around the mapped arrays
+    dense      the NumPy forward pass of a dense Keras model (type "numpy"), scaler already folded in
+    json       plain metadata dicts
+Other artifacts (tflite files, which the interpreter already maps; Keras and
+PyTorch models; tree ensembles) keep their original manifest entry.
+
+Usage:
+    python mapped_artifacts.py --output models/mapped
+    MODEL_MANIFEST=models/mapped/manifest.json python serve.py --workers 8
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from dense_inference import DenseNetwork
+
+logger = logging.getLogger(__name__)
+
+# Classes an "estimator" entry may name; the loader imports nothing else
+ESTIMATOR_MODULE_PREFIXES = ('sklearn.',)
+
+# Model types loaded from their own files, which are copied into the new manifest without loading them
+PASSTHROUGH_TYPES = ('tflite', 'tensorflow', 'pytorch')
+
+# Manifest options that only matter when the artifact is built from its source
+SOURCE_OPTIONS = ('scaler', 'verify_against', 'architecture', 'tolerance', 'compile')
+
+
+class NotExportable(ValueError):
+    """An artifact has state that cannot be stored as flat arrays"""
+
+
+def _flat_array(value):
+    """Numeric arrays as they are; object arrays of strings as fixed-width unicode, which can be mapped"""
+    if value.dtype != object:
+        return value
+    if all(isinstance(item, str) for item in value.flat):
+        return value.astype(str)
+    raise NotExportable('object array with non-string items')
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {key: _json_value(item) for key, item in value.items()}
+    raise NotExportable(f'{type(value).__name__} value')
+
+
+def flatten(model, model_type):
+    """(kind, arrays by name, JSON attributes) for a loaded artifact; raises NotExportable"""
+    if isinstance(model, DenseNetwork):
+        arrays = {}
+        for i, (kernel, bias, _) in enumerate(model.layers):
+            arrays[f'{i}.kernel'], arrays[f'{i}.bias'] = kernel, bias
+        return 'dense', arrays, {'activations': [activation for _, _, activation in model.layers],
+                                 'dtype': np.dtype(model.dtype).name}
+
+    if isinstance(model, dict) and model_type == 'metadata':
+        return 'json', {}, {'value': _json_value(model)}
+
+    cls = type(model)
+    if not cls.__module__.startswith(ESTIMATOR_MODULE_PREFIXES):
+        raise NotExportable(f'{cls.__module__}.{cls.__qualname__} is not a scikit-learn object')
+    arrays, attributes = {}, {}
+    for name, value in vars(model).items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = _flat_array(value)
+        else:
+            try:
+                attributes[name] = _json_value(value)
+            except NotExportable as e:
+                raise NotExportable(f'{name} is a {e}')
+    return 'estimator', arrays, {'class': f'{cls.__module__}.{cls.__qualname__}', 'state': attributes}
+
+
+def _save_array(path, array):
+    # Written under a new name and renamed over the old file, so a worker mapping the old file never sees a partial write
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npy.tmp')
+    with os.fdopen(handle, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(temporary, path)
+
+
+def export_artifact(model, model_type, directory):
+    """Write one artifact's arrays under directory; returns the manifest fields describing it"""
+    kind, arrays, attributes = flatten(model, model_type)
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        _save_array(os.path.join(directory, f'{name}.npy'), array)
+    # Arrays left over from an earlier export of a different artifact
+    for name in os.listdir(directory):
+        if name.endswith('.npy') and name[:-4] not in arrays:
+            os.remove(os.path.join(directory, name))
+    return {'kind': kind, **attributes}
+
+
+def map_arrays(directory):
+    """Every .npy file in directory, mapped read-only, by file stem"""
+    return {
+        name[:-4]: np.load(os.path.join(directory, name), mmap_mode='r', allow_pickle=False)
+        for name in sorted(os.listdir(directory)) if name.endswith('.npy')
+    }
+
+
+def load_artifact(directory, entry):
+    """Rebuild an exported artifact around read-only mappings of its arrays; returns (model, mapped bytes)"""
+    kind = entry.get('kind')
+    arrays = map_arrays(directory)
+    mapped_bytes = sum(array.nbytes for array in arrays.values())
+
+    if kind == 'dense':
+        activations = entry['activations']
+        layers = [(arrays[f'{i}.kernel'], arrays[f'{i}.bias'], activation) for i, activation in enumerate(activations)]
+        # DenseNetwork keeps contiguous arrays of its dtype as they are, so the mappings are not copied
+        return DenseNetwork(layers, dtype=np.dtype(entry.get('dtype', 'float32')).type), mapped_bytes
+
+    if kind == 'json':
+        return entry['value'], mapped_bytes
+
+    if kind == 'estimator':
+        module_name, _, class_name = entry['class'].rpartition('.')
+        if not module_name.startswith(ESTIMATOR_MODULE_PREFIXES):
+            raise ValueError(f"Refusing to load {entry['class']}: only scikit-learn classes can be mapped")
+        cls = getattr(importlib.import_module(module_name), class_name)
+        model = cls.__new__(cls)
+        model.__dict__.update(entry.get('state', {}))
+        model.__dict__.update(arrays)
+        return model, mapped_bytes
+
+    raise ValueError(f"Unknown mapped artifact kind: {kind}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Export model artifacts as memory-mappable .npy files')
+    parser.add_argument('--manifest', default=os.environ.get('MODEL_MANIFEST', os.path.join('models', 'manifest.json')))
+    parser.add_argument('--output', default=os.path.join('models', 'mapped'),
+                        help='directory for the arrays and the new manifest.json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Imported here so loading mapped artifacts does not pull in the Flask app
+    import app
+
+    manager = app.ModelManager()
+    manager.load_manifest(args.manifest)
+    with open(args.manifest) as f:
+        entries = json.load(f).get('models', [])
+
+    source_dir = os.path.dirname(os.path.abspath(args.manifest))
+    output = os.path.abspath(args.output)
+    os.makedirs(output, exist_ok=True)
+    manifest_path = os.path.join(output, 'manifest.json')
+    previous = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = [entry['path'] for entry in json.load(f).get('models', []) if entry.get('type') == 'mapped']
+    exported = []
+    manifest = []
+    for entry in entries:
+        entry = dict(entry)
+        name = entry['name']
+        source_path = entry['path'] if os.path.isabs(entry['path']) else os.path.join(source_dir, entry['path'])
+        try:
+            if entry.get('type', 'sklearn') in PASSTHROUGH_TYPES:
+                raise NotExportable('not a flat-array artifact')
+            if not manager.has_model(name):
+                raise NotExportable(manager.model_info.get(name, {}).get('error', 'not registered'))
+            model = manager.get_model(name)
+            fields = export_artifact(model, entry.get('type', 'sklearn'), os.path.join(output, name))
+        except ValueError as e:
+            print(f"↪️  {name}: kept as {entry.get('type', 'sklearn')} ({e})")
+            entry['path'] = os.path.relpath(source_path, output)
+            manifest.append(entry)
+            continue
+
+        info = manager.model_info[name]
+        options = {key: value for key, value in entry.items() if key not in SOURCE_OPTIONS + ('name', 'path', 'type')}
+        manifest.append({
+            'name': name, 'path': name, 'type': 'mapped', **options, **fields,
+            'source': {'path': os.path.relpath(source_path, output), 'type': entry.get('type', 'sklearn'),
+                       'fingerprint': info.get('fingerprint'),
+                       **({'max_abs_error': info['max_abs_error']} if 'max_abs_error' in info else {})}
+        })
+        exported.append(name)
+        print(f"🗺️  {name}: {fields['kind']} -> {os.path.join(output, name)}")
+
+    # Artifacts an earlier export mapped that are no longer exported
+    for name in previous:
+        if name not in exported and os.path.isdir(os.path.join(output, name)):
+            shutil.rmtree(os.path.join(output, name))
+
+    handle, temporary = tempfile.mkstemp(dir=output, suffix='.json.tmp')
+    with os.fdopen(handle, 'w') as f:
+        json.dump({'models': manifest}, f, indent=2)
+    os.replace(temporary, manifest_path)
+    print(f"📋 {len(exported)} of {len(entries)} artifacts mapped; serve them with MODEL_MANIFEST={manifest_path}")
+    return manifest_path
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
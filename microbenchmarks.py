@@ -0,0 +1,313 @@
+"""
+Microbenchmarks - timings for the per-request hot paths, with a regression gate
+
+Every benchmark is timed with timeit (best of several repeats, per call) and
+checked against benchmarks/microbench_baseline.json. The run exits non-zero
+when a benchmark is slower than its baseline by more than the threshold.
+
+Usage:
+    python microbenchmarks.py                      # run and check against the baseline
+    python microbenchmarks.py --filter preprocess  # only benchmarks whose name contains this
+    python microbenchmarks.py --update-baseline    # record the current timings as the baseline
+    python microbenchmarks.py --quick              # fewer repeats, for a rough look
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'microbench_baseline.json')
+
+# Relative slowdown that fails the gate, unless the baseline entry sets its own 'threshold'
+DEFAULT_THRESHOLD = 0.30
+
+# Slowdowns smaller than this (microseconds per call) are treated as timer noise
+DEFAULT_MIN_DELTA_US = 1.0
+
+# Name of the fixed workload used to correct for the machine running faster or slower than at baseline time
+CALIBRATION = 'calibration'
+
+IMAGE_SIZES = ((128, 128), (640, 480), (1920, 1080), (4000, 3000))
+IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def encode_image(width, height, image_format):
+    """Synthetic photo-like image encoded in the given format"""
+    from PIL import Image
+    from load_benchmark import synthetic_jpeg
+
+    data = synthetic_jpeg(width, height, seed=width + height)
+    if image_format == 'JPEG':
+        return data
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def preprocess_benchmarks():
+    import app
+    import image_preprocessing
+    import pest_detection_api
+
+    manager = app.ModelManager()
+    benchmarks = []
+    for width, height in IMAGE_SIZES:
+        for image_format in IMAGE_FORMATS:
+            # Lossless 12 MP encodes take long to build and are not what phones upload
+            if image_format != 'JPEG' and width * height > 2_500_000:
+                continue
+            data = encode_image(width, height, image_format)
+            label = f'{image_format.lower()}_{width}x{height}'
+            benchmarks.append((f'preprocess_image/{label}', lambda data=data: image_preprocessing.preprocess_image(data)))
+        encoded = base64.b64encode(encode_image(width, height, 'JPEG')).decode('ascii')
+        benchmarks.append((f'ModelManager.preprocess_image/base64_jpeg_{width}x{height}',
+                           lambda encoded=encoded: manager.preprocess_image(encoded)))
+        benchmarks.append((f'pest_detection_api.preprocess_image/base64_jpeg_{width}x{height}',
+                           lambda encoded=encoded: pest_detection_api.preprocess_image(encoded)))
+    return benchmarks
+
+
+def predict_benchmarks(workdir):
+    import joblib
+    import app
+
+    # A fresh manager: no micro-batching wait, no shared result cache
+    manager = app.ModelManager()
+    if os.path.exists(app.MODEL_MANIFEST):
+        manager.load_manifest(app.MODEL_MANIFEST)
+
+    # Small in-memory sklearn classifier so the sklearn path is covered without a shipped artifact
+    from sklearn.linear_model import LogisticRegression
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(200, 7))
+    classifier = LogisticRegression(max_iter=200).fit(features, (features[:, 0] > 0).astype(int))
+    sklearn_path = os.path.join(workdir, 'bench_sklearn.pkl')
+    joblib.dump(classifier, sklearn_path)
+    manager.register_model('bench_sklearn', sklearn_path, 'sklearn', features=[f'f{i}' for i in range(features.shape[1])])
+
+    reading = np.array([[7.0, 30.0, 25.0, 60.0, 5.0]])
+    cases = [
+        ('sklearn', 'bench_sklearn', {f'f{i}': float(v) for i, v in enumerate(features[0])}),
+        ('tflite', 'pest_model', rng.random((1, 128, 128, 3), dtype=np.float32)),
+        ('tensorflow', 'irrigation_model', reading),
+        ('numpy', 'irrigation_model_numpy', reading)
+    ]
+
+    benchmarks = []
+    for model_type, model_name, input_data in cases:
+        if not manager.has_model(model_name):
+            continue
+        try:
+            manager.get_model(model_name)
+        except Exception as e:
+            print(f"⚠️ Skipping ModelManager.predict/{model_type}: {e}")
+            continue
+        benchmarks.append((f'ModelManager.predict/{model_type}',
+                           lambda model_name=model_name, input_data=input_data: manager.predict(model_name, input_data)))
+    return benchmarks
+
+
+def advice_benchmarks():
+    import app
+    import pest_detection_api
+
+    probabilities = np.random.default_rng(0).random(10)
+    probabilities /= probabilities.sum()
+    class_names = [f'class_{i}' for i in range(10)]
+    large = np.random.default_rng(1).random(1000)
+
+    # Response bodies as the pest routes build them, serialized the way jsonify does
+    pest_body = {'success': True, **app.build_pest_result(probabilities, class_names), 'all_classes': class_names}
+    batch_body = {'success': True, 'results': [dict(pest_body, index=i) for i in range(32)]}
+
+    return [
+        ('get_pest_advice/app_known', lambda: app.get_pest_advice('weevil')),
+        ('get_pest_advice/app_unknown', lambda: app.get_pest_advice('unknown pest')),
+        ('get_pest_advice/pest_detection_api', lambda: pest_detection_api.get_pest_advice('aphid')),
+        ('get_irrigation_recommendations/needed',
+         lambda: app.get_irrigation_recommendations('Wheat', 25.0, 38.0, 30.0, 5.0, True, 0.9)),
+        ('get_irrigation_recommendations/not_needed',
+         lambda: app.get_irrigation_recommendations('Paddy', 80.0, 24.0, 70.0, 40.0, False, 0.7)),
+        ('argsort_top3/10_classes', lambda: np.argsort(probabilities)[-3:][::-1]),
+        ('argsort_top3/1000_classes', lambda: np.argsort(large)[-3:][::-1]),
+        ('build_pest_result/10_classes', lambda: app.build_pest_result(probabilities, class_names)),
+        ('serialize/pest_response', lambda: app.app.json.dumps(pest_body, separators=(',', ':'))),
+        ('serialize/pest_batch_32', lambda: app.app.json.dumps(batch_body, separators=(',', ':')))
+    ]
+
+
+def calibration_workload(data=np.random.default_rng(2).random((256, 256))):
+    """Fixed mix of interpreter and NumPy work that no code change in this repo affects"""
+    total = 0
+    for i in range(2000):
+        total += i * i
+    return float((data @ data).sum()) + total
+
+
+def collect_benchmarks(workdir):
+    benchmarks = []
+    for group in (preprocess_benchmarks, lambda: predict_benchmarks(workdir), advice_benchmarks):
+        benchmarks.extend(group())
+    return benchmarks
+
+
+def measure(func, repeat, min_time):
+    """Best per-call time over repeat runs, each long enough to be above timer resolution"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)) + 1)
+    timings = [elapsed / number] + [t / number for t in timer.repeat(repeat - 1, number)]
+    return {'seconds': min(timings), 'median_seconds': float(np.median(timings)), 'loops': number}
+
+
+def check(results, baseline, threshold, min_delta_us, speed=1.0):
+    """
+    Return the names of benchmarks slower than their baseline by more than the allowed margin.
+    
+    speed is how much slower the machine is than when the baseline was recorded
+    (from the calibration workload); baseline timings are scaled by it first.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            result['status'] = 'new'
+            continue
+        limit = reference.get('threshold', threshold)
+        expected = reference['seconds'] * speed
+        change = result['seconds'] / expected - 1
+        delta_us = (result['seconds'] - expected) * 1e6
+        result['change'] = round(change, 4)
+        if change > limit and delta_us > min_delta_us:
+            result['status'] = 'regressed'
+            regressions.append(name)
+        else:
+            result['status'] = 'ok'
+    return regressions
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:9.2f} µs'
+    return f'{seconds * 1e3:9.2f} ms'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks with a regression gate')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='write the current timings as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative slowdown (0.30 = 30%%) for entries without their own threshold')
+    parser.add_argument('--min-delta-us', type=float, default=DEFAULT_MIN_DELTA_US)
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.1, help='seconds per timing run')
+    parser.add_argument('--quick', action='store_true', help='3 repeats of 0.02 s each')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='re-measure apparent regressions this many times before failing (keeps the best run)')
+    parser.add_argument('--output', help='also write this run as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.quick:
+        args.repeat, args.min_time = 3, 0.02
+
+    baseline = {}
+    baseline_info = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline_info = json.load(f)
+        baseline = baseline_info.get('benchmarks', {})
+        if baseline_info.get('machine') != platform.machine() or baseline_info.get('cpu_count') != os.cpu_count():
+            print("⚠️ Baseline was recorded on a different machine; timings may not be comparable")
+
+    print("⏱️ Microbenchmarks")
+    print("=" * 40)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        funcs = {name: func for name, func in collect_benchmarks(workdir) if not args.filter or args.filter in name}
+        calibration = measure(calibration_workload, args.repeat, args.min_time)
+        for name, func in funcs.items():
+            func()
+            results[name] = measure(func, args.repeat, args.min_time)
+        # Measured before and after; the faster of the two is the machine's current speed
+        retry = measure(calibration_workload, args.repeat, args.min_time)
+        if retry['seconds'] < calibration['seconds']:
+            calibration = retry
+
+        speed = 1.0
+        if CALIBRATION in baseline:
+            speed = calibration['seconds'] / baseline[CALIBRATION]['seconds']
+            print(f"Machine speed vs baseline: {1 / speed:.2f}x (timings are compared after scaling by this)")
+
+        regressions = check(results, baseline, args.threshold, args.min_delta_us, speed)
+        # A noisy neighbour can slow any single run; only a slowdown that persists fails the gate
+        for _ in range(args.retries if not args.update_baseline else 0):
+            if not regressions:
+                break
+            for name in regressions:
+                retry = measure(funcs[name], args.repeat, args.min_time)
+                if retry['seconds'] < results[name]['seconds']:
+                    results[name] = retry
+            regressions = check(results, baseline, args.threshold, args.min_delta_us, speed)
+    for name, result in results.items():
+        change = f"{result['change'] * 100:+7.1f}%" if 'change' in result else '    new'
+        marker = '❌' if result['status'] == 'regressed' else '  '
+        print(f"{marker} {name:<62} {format_time(result['seconds'])}  {change}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'benchmarks': {
+            name: {
+                'seconds': result['seconds'],
+                'median_seconds': result['median_seconds'],
+                **({'threshold': baseline[name]['threshold']} if 'threshold' in baseline.get(name, {}) else {})
+            }
+            for name, result in results.items()
+        }
+    }
+    report['benchmarks'][CALIBRATION] = {'seconds': calibration['seconds'], 'median_seconds': calibration['median_seconds']}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({**report, 'results': results}, f, indent=2)
+
+    if args.update_baseline:
+        if args.filter and baseline:
+            # Keep the entries that were not re-run
+            report['benchmarks'] = {**baseline, **report['benchmarks']}
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\n✅ Baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed beyond the threshold: {', '.join(regressions)}")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+// ml_rpc.js
+// Client for the ML service's Unix socket RPC (rpc_server.py).
+// Frames are a 4-byte big-endian length followed by msgpack:
+//   request  [id, method, params]
+//   response [id, status, body]
+// Requests are pipelined over a small pool of persistent connections and
+// responses are matched back by id, so they may arrive in any order.
+import net from "net";
+import { encode, decode } from "@msgpack/msgpack";
+
+export class MLRpcError extends Error {}
+
+class Connection {
+  constructor(client) {
+    this.client = client;
+    this.pending = new Map();
+    this.socket = null;
+    this.buffer = Buffer.alloc(0);
+    this.connecting = null;
+    this.retryAt = 0;
+    this.failures = 0;
+  }
+
+  open() {
+    if (this.socket) return Promise.resolve();
+    if (this.connecting) return this.connecting;
+    if (Date.now() < this.retryAt) {
+      return Promise.reject(new MLRpcError(`ML RPC socket unavailable: ${this.lastError}`));
+    }
+
+    this.connecting = new Promise((resolve, reject) => {
+      const socket = net.createConnection(this.client.socketPath);
+      socket.once("connect", () => {
+        this.socket = socket;
+        this.connecting = null;
+        this.failures = 0;
+        resolve();
+      });
+      socket.on("data", chunk => this.receive(chunk));
+      socket.on("error", err => {
+        this.lastError = err.message;
+        if (this.connecting) {
+          this.connecting = null;
+          this.backOff();
+          reject(new MLRpcError(`ML RPC connect failed: ${err.message}`));
+        }
+      });
+      socket.on("close", () => {
+        if (this.socket === socket) this.reset(new MLRpcError("ML RPC connection closed"));
+      });
+    });
+    return this.connecting;
+  }
+
+  backOff() {
+    // 100 ms, doubling up to 5 s, while the ML service is down
+    this.failures += 1;
+    this.retryAt = Date.now() + Math.min(5000, 100 * 2 ** (this.failures - 1));
+  }
+
+  reset(err) {
+    if (this.socket) this.socket.destroy();
+    this.socket = null;
+    this.buffer = Buffer.alloc(0);
+    for (const { reject, timer } of this.pending.values()) {
+      clearTimeout(timer);
+      reject(err);
+    }
+    this.pending.clear();
+  }
+
+  receive(chunk) {
+    this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < 4 + length) break;
+      const frame = this.buffer.subarray(4, 4 + length);
+      this.buffer = this.buffer.subarray(4 + length);
+
+      let message;
+      try {
+        message = decode(frame);
+      } catch (err) {
+        this.reset(new MLRpcError(`Bad ML RPC frame: ${err.message}`));
+        return;
+      }
+      const [id, status, body] = message;
+      const call = this.pending.get(id);
+      if (!call) {
+        // A server-side error for the whole connection, e.g. an oversized frame
+        if (id === null) this.reset(new MLRpcError(body?.error || `ML RPC error ${status}`));
+        continue;
+      }
+      this.pending.delete(id);
+      clearTimeout(call.timer);
+      call.resolve({ status, body });
+    }
+  }
+
+  async call(id, method, params, timeoutMs) {
+    await this.open();
+    // Fields set to undefined are left out, as JSON.stringify does for the HTTP path
+    const payload = encode([id, method, params], { ignoreUndefined: true });
+    const header = Buffer.alloc(4);
+    header.writeUInt32BE(payload.length, 0);
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        // A late response for this id is dropped when it arrives
+        this.pending.delete(id);
+        reject(Object.assign(new MLRpcError(`ML RPC ${method} timed out after ${timeoutMs} ms`), { code: "ETIMEDOUT" }));
+      }, timeoutMs);
+      this.pending.set(id, { resolve, reject, timer });
+      this.socket.write(Buffer.concat([header, payload]));
+    });
+  }
+}
+
+export class MLRpcClient {
+  constructor({ socketPath, poolSize = 2, timeoutMs = 10000 } = {}) {
+    if (!socketPath) throw new Error("MLRpcClient needs a socketPath");
+    this.socketPath = socketPath;
+    this.timeoutMs = timeoutMs;
+    this.connections = Array.from({ length: Math.max(1, poolSize) }, () => new Connection(this));
+    this.nextId = 1;
+  }
+
+  // Resolves to { status, body } exactly as the matching HTTP route would answer;
+  // rejects with MLRpcError when the socket cannot be reached or the call times out.
+  call(method, params = null, { timeoutMs = this.timeoutMs } = {}) {
+    const connection = this.connections.reduce((best, c) => (c.pending.size < best.pending.size ? c : best));
+    const id = this.nextId;
+    this.nextId = this.nextId >= 0x7fffffff ? 1 : this.nextId + 1;
+    return connection.call(id, method, params, timeoutMs);
+  }
+
+  close() {
+    for (const connection of this.connections) connection.reset(new MLRpcError("ML RPC client closed"));
+  }
+}
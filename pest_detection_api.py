@@ -1,14 +1,14 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import tensorflow as tf
 import numpy as np
-import base64
-from PIL import Image
-import io
 import pickle
 import os
+from tflite_backend import TFLiteModel
+import image_preprocessing
+from advice_tables import FragmentJSONProvider, PEST_API_ADVICE
 
 app = Flask(__name__)
+app.json = FragmentJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Load the pest detection model and metadata
@@ -19,11 +19,16 @@ def load_model():
     global model, class_names
     
     try:
-        # Load the TensorFlow model
+        # Load the TensorFlow model, falling back to the shipped TFLite build
         model_path = 'models/pest_model.h5'
+        tflite_model_path = 'models/pest_model.tflite'
         if os.path.exists(model_path):
+            import tensorflow as tf
             model = tf.keras.models.load_model(model_path)
             print("✅ Pest detection model loaded successfully")
+        elif os.path.exists(tflite_model_path):
+            model = TFLiteModel(tflite_model_path)
+            print("✅ Pest detection TFLite model loaded successfully")
         else:
             print("❌ Model file not found")
             return False
@@ -51,208 +56,43 @@ def load_model():
         print(f"❌ Error loading model: {e}")
         return False
 
-def preprocess_image(base64_image):
-    """Preprocess the base64 image for the model"""
+# Content types accepted as a raw image request body
+RAW_IMAGE_MIMETYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def get_uploaded_image():
+    """Return the uploaded image from a raw body, multipart part or JSON base64 field"""
+    if request.mimetype in RAW_IMAGE_MIMETYPES:
+        return request.stream
+    
+    if request.files:
+        part = request.files.get('image') or next(iter(request.files.values()))
+        return part.stream
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and data.get('image'):
+        return data['image']
+    
+    return None
+
+def preprocess_image(image_source):
+    """Preprocess a base64 string, raw bytes or file-like image for the model"""
     try:
-        # Remove data URL prefix if present
-        if ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
-        
-        # Decode base64 image
-        image_data = base64.b64decode(base64_image)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Resize to 128x128 (model input size)
-        image = image.resize((128, 128))
-        
-        # Convert to numpy array and normalize
-        image_array = np.array(image) / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        return image_array
+        # Resize to 128x128 (model input size) and normalize into a float32 batch
+        return image_preprocessing.preprocess_image(image_source, (128, 128))
     except Exception as e:
         print(f"Error preprocessing image: {e}")
         raise e
 
 def get_pest_advice(pest_name):
-    """Get advice based on detected pest"""
-    advice_database = {
-        'aphid': {
-            'severity': 'moderate',
-            'description': 'Small, soft-bodied insects that feed on plant sap, causing yellowing and stunted growth.',
-            'prevention': [
-                'Use reflective mulches to deter aphids',
-                'Introduce beneficial insects like ladybugs',
-                'Keep plants healthy with proper watering',
-                'Remove weeds that can harbor aphids'
-            ],
-            'treatment': [
-                'Spray with neem oil solution',
-                'Use insecticidal soap',
-                'Apply diatomaceous earth around plants',
-                'Remove heavily infested plant parts'
-            ]
-        },
-        'armyworm': {
-            'severity': 'high',
-            'description': 'Caterpillar larvae that can quickly defoliate crops, especially grasses and grains.',
-            'prevention': [
-                'Monitor fields regularly for eggs and larvae',
-                'Use pheromone traps to detect adults',
-                'Practice crop rotation',
-                'Maintain field hygiene'
-            ],
-            'treatment': [
-                'Apply Bacillus thuringiensis (Bt)',
-                'Use spinosad-based insecticides',
-                'Hand-pick larvae when possible',
-                'Apply neem oil as a deterrent'
-            ]
-        },
-        'beetle': {
-            'severity': 'moderate',
-            'description': 'Hard-shelled insects that feed on leaves, flowers, and fruits.',
-            'prevention': [
-                'Use floating row covers',
-                'Plant trap crops to divert beetles',
-                'Maintain good garden hygiene',
-                'Use companion planting'
-            ],
-            'treatment': [
-                'Hand-pick beetles in early morning',
-                'Apply neem oil or pyrethrin',
-                'Use diatomaceous earth',
-                'Introduce beneficial nematodes'
-            ]
-        },
-        'caterpillar': {
-            'severity': 'moderate',
-            'description': 'Larval stage of moths and butterflies that feed on leaves and stems.',
-            'prevention': [
-                'Use floating row covers',
-                'Plant trap crops',
-                'Encourage natural predators',
-                'Practice crop rotation'
-            ],
-            'treatment': [
-                'Apply Bacillus thuringiensis (Bt)',
-                'Hand-pick caterpillars',
-                'Use spinosad-based products',
-                'Apply neem oil'
-            ]
-        },
-        'grasshopper': {
-            'severity': 'high',
-            'description': 'Large jumping insects that can cause significant defoliation.',
-            'prevention': [
-                'Maintain healthy soil with good drainage',
-                'Use trap crops',
-                'Keep vegetation short around crops',
-                'Encourage natural predators'
-            ],
-            'treatment': [
-                'Apply carbaryl or malathion',
-                'Use neem oil as deterrent',
-                'Hand-pick when numbers are low',
-                'Apply diatomaceous earth'
-            ]
-        },
-        'leafhopper': {
-            'severity': 'low',
-            'description': 'Small, wedge-shaped insects that feed on plant sap and can transmit diseases.',
-            'prevention': [
-                'Use reflective mulches',
-                'Maintain good air circulation',
-                'Remove weeds and debris',
-                'Use resistant varieties when available'
-            ],
-            'treatment': [
-                'Spray with insecticidal soap',
-                'Apply neem oil',
-                'Use pyrethrin-based products',
-                'Introduce beneficial insects'
-            ]
-        },
-        'mite': {
-            'severity': 'moderate',
-            'description': 'Tiny arachnids that feed on plant cells, causing stippling and webbing.',
-            'prevention': [
-                'Maintain proper humidity levels',
-                'Avoid over-fertilizing with nitrogen',
-                'Use reflective mulches',
-                'Keep plants well-watered'
-            ],
-            'treatment': [
-                'Spray with water to dislodge mites',
-                'Apply neem oil or insecticidal soap',
-                'Use predatory mites',
-                'Apply sulfur-based products'
-            ]
-        },
-        'thrips': {
-            'severity': 'moderate',
-            'description': 'Tiny, slender insects that feed on plant cells, causing silvering and distortion.',
-            'prevention': [
-                'Use reflective mulches',
-                'Maintain good air circulation',
-                'Remove weeds and debris',
-                'Use sticky traps for monitoring'
-            ],
-            'treatment': [
-                'Apply neem oil or insecticidal soap',
-                'Use spinosad-based products',
-                'Introduce beneficial insects',
-                'Apply diatomaceous earth'
-            ]
-        },
-        'whitefly': {
-            'severity': 'moderate',
-            'description': 'Small, white-winged insects that feed on plant sap and excrete honeydew.',
-            'prevention': [
-                'Use yellow sticky traps',
-                'Maintain good air circulation',
-                'Remove weeds and debris',
-                'Use reflective mulches'
-            ],
-            'treatment': [
-                'Spray with insecticidal soap',
-                'Apply neem oil',
-                'Use pyrethrin-based products',
-                'Introduce beneficial insects like Encarsia'
-            ]
-        },
-        'healthy': {
-            'severity': 'beneficial',
-            'description': 'No significant pest damage detected. Plant appears healthy.',
-            'prevention': [
-                'Continue current care practices',
-                'Monitor regularly for early signs of problems',
-                'Maintain proper watering and fertilization',
-                'Practice good garden hygiene'
-            ],
-            'treatment': [
-                'No treatment needed',
-                'Continue preventive measures',
-                'Monitor for any changes',
-                'Maintain optimal growing conditions'
-            ]
-        }
-    }
-    
-    return advice_database.get(pest_name.lower(), advice_database['healthy'])
+    """Get advice based on detected pest (table in data/pest_detection_api_advice.json)"""
+    return PEST_API_ADVICE.get(pest_name)
 
 @app.route('/api/pest-detection', methods=['POST'])
 def detect_pest():
     try:
-        data = request.get_json()
+        image_source = get_uploaded_image()
         
-        if not data or 'image' not in data:
+        if image_source is None:
             return jsonify({
                 'success': False,
                 'error': 'No image provided'
@@ -265,7 +105,7 @@ def detect_pest():
             }), 500
         
         # Preprocess the image
-        processed_image = preprocess_image(data['image'])
+        processed_image = preprocess_image(image_source)
         
         # Make prediction
         predictions = model.predict(processed_image)
@@ -313,6 +153,7 @@ if __name__ == '__main__':
     print("🚀 Starting Pest Detection API...")
     if load_model():
         print("✅ Model loaded successfully!")
-        app.run(host='0.0.0.0', port=5000, debug=True)
+        # Development server; use serve.py --service pest for multi-worker serving
+        app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true', threaded=True)
     else:
         print("❌ Failed to load model. Exiting...")
@@ -0,0 +1,371 @@
+"""
+Pest scan - classify every image under a directory tree with the pest model
+
+Images are decoded by a pool of worker processes and scored in batches through
+the same ModelManager and models/manifest.json the API uses. Results stream to
+JSON Lines, or to a directory of Parquet part files. A checkpoint next to the
+output records the last image written; running the same command again after an
+interruption resumes from there.
+
+Usage:
+    python pest_scan.py surveys/2024 --output scans/2024.jsonl
+    python pest_scan.py surveys/2024 --output scans/2024.parquet --decode-workers 8 --batch-size 128
+    python pest_scan.py surveys/2024 --output scans/2024.jsonl --restart
+"""
+
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import image_preprocessing
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+# Written next to the output; holds the resume position
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+CHECKPOINT_VERSION = 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Classify every image under a directory with the pest model')
+    parser.add_argument('root', help='directory of field images (searched recursively)')
+    parser.add_argument('--output', required=True, help='results file: .jsonl, or .parquet for a directory of Parquet parts')
+    parser.add_argument('--format', choices=('jsonl', 'parquet'), default=None,
+                        help='output format (default: from the --output extension)')
+    parser.add_argument('--manifest', default=os.environ.get('MODEL_MANIFEST', os.path.join('models', 'manifest.json')))
+    parser.add_argument('--decode-workers', type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help='processes decoding images (0 decodes in the main process)')
+    parser.add_argument('--batch-size', type=int, default=64, help='images per decode task and per model call')
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help='decoded batches allowed to queue ahead of inference (default: 2 per worker)')
+    parser.add_argument('--top-k', type=int, default=3, help='classes reported per image')
+    parser.add_argument('--checkpoint-every', type=int, default=2048, help='images between checkpoints')
+    parser.add_argument('--extensions', default=','.join(IMAGE_EXTENSIONS),
+                        help='comma-separated image file extensions to scan')
+    parser.add_argument('--restart', action='store_true', help='discard existing output and checkpoint and start over')
+    return parser.parse_args(argv)
+
+
+def find_images(root, extensions=IMAGE_EXTENSIONS):
+    """Relative paths ('/'-separated) of every image under root, sorted so a scan can resume by position"""
+    extensions = tuple(ext.lower() for ext in extensions)
+    paths = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        relative = os.path.relpath(directory, root)
+        for name in files:
+            if name.lower().endswith(extensions):
+                path = name if relative == '.' else os.path.join(relative, name)
+                paths.append(path.replace(os.sep, '/'))
+    paths.sort()
+    return paths
+
+
+def _watch_parent(parent):
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(1)
+
+
+def _init_worker():
+    # Ctrl+C is handled by the main process, which checkpoints and shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # If the main process is killed outright, exit instead of waiting for work forever
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), daemon=True).start()
+
+
+def decode_chunk(root, paths, target_size):
+    """
+    Decode a chunk of images in a worker process. Returns (uint8 pixels of the
+    decodable images, their indices in paths, error message by index).
+    """
+    width, height = target_size
+    pixels = np.empty((len(paths), height, width, 3), dtype=np.uint8)
+    decoded = []
+    errors = {}
+    for i, path in enumerate(paths):
+        try:
+            with open(os.path.join(root, path), 'rb') as f:
+                pixels[len(decoded)] = image_preprocessing.decode_pixels(f, target_size)
+            decoded.append(i)
+        except Exception as e:
+            errors[i] = f'Could not decode image: {e}'
+    return pixels[:len(decoded)], decoded, errors
+
+
+class JSONLWriter:
+    """Appends one JSON object per line; resuming truncates anything written after the last checkpoint"""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        offset = (state or {}).get('offset', 0)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'r+b' if offset else 'wb')
+        self._file.truncate(offset)
+        self._file.seek(offset)
+
+    def write(self, records):
+        self._file.write(''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+
+    def flush(self):
+        """Make everything written so far durable and return the state to checkpoint"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {'offset': self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Buffers records and writes them as numbered part files in a directory, one per checkpoint"""
+
+    def __init__(self, path, state=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError('Parquet output needs pyarrow (pip install pyarrow), or use a .jsonl output')
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.part = (state or {}).get('parts', 0)
+        self.schema = pa.schema([
+            ('path', pa.string()),
+            ('predicted_pest', pa.string()),
+            ('confidence', pa.float64()),
+            ('top_predictions', pa.list_(pa.struct([('class', pa.string()), ('confidence', pa.float64())]))),
+            ('error', pa.string())
+        ])
+        self._buffer = []
+
+        os.makedirs(path, exist_ok=True)
+        # Parts past the checkpoint were written after it and will be scored again
+        for name in os.listdir(path):
+            if name.startswith('part-') and (not name.endswith('.parquet') or int(name[5:10]) >= self.part):
+                os.remove(os.path.join(path, name))
+
+    def write(self, records):
+        self._buffer.extend(records)
+
+    def flush(self):
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+            final = os.path.join(self.path, f'part-{self.part:05d}.parquet')
+            self._pq.write_table(table, final + '.tmp')
+            os.replace(final + '.tmp', final)
+            self.part += 1
+            self._buffer = []
+        return {'parts': self.part}
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    checkpoint['updated'] = datetime.now().isoformat()
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_pest_model(manifest):
+    """(ModelManager, class names, model identity) for the manifest's pest model"""
+    # Imported here so decode workers, which re-import this module, stay light
+    import app
+
+    manager = app.ModelManager()
+    manager.load_manifest(manifest)
+    if not manager.has_model('pest_model') or not manager.has_model('pest_metadata'):
+        raise RuntimeError(f'{manifest} does not register pest_model and pest_metadata')
+    class_names = list(manager.get_model('pest_metadata')['class_names'])
+    manager.get_model('pest_model')
+    return manager, class_names, list(manager.model_identity('pest_model'))
+
+
+def score_chunk(manager, class_names, paths, pixels, decoded, errors, top_k, target_size):
+    """Run one decoded chunk through the model; returns one record per path, in order"""
+    records = [None] * len(paths)
+    if decoded:
+        batch = image_preprocessing.allocate_batch(len(decoded), target_size)
+        image_preprocessing.normalize_into(pixels, batch)
+        probabilities = np.asarray(manager.predict('pest_model', batch)['prediction'])
+        # Same ordering as build_pest_result(): highest probability first
+        top = np.argsort(probabilities, axis=1)[:, -top_k:][:, ::-1]
+        for row, i in enumerate(decoded):
+            predictions = [{'class': class_names[idx], 'confidence': float(probabilities[row, idx])} for idx in top[row]]
+            records[i] = {
+                'path': paths[i],
+                'predicted_pest': predictions[0]['class'],
+                'confidence': predictions[0]['confidence'],
+                'top_predictions': predictions
+            }
+    for i, error in errors.items():
+        records[i] = {'path': paths[i], 'error': error}
+    return records
+
+
+def remove_output(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def run(args):
+    root = os.path.abspath(args.root)
+    if not os.path.isdir(root):
+        print(f"❌ Not a directory: {args.root}")
+        return 1
+
+    output_format = args.format or ('parquet' if args.output.lower().endswith('.parquet') else 'jsonl')
+    checkpoint_path = args.output.rstrip('/\\') + CHECKPOINT_SUFFIX
+    target_size = image_preprocessing.DEFAULT_TARGET_SIZE
+
+    if args.restart:
+        remove_output(args.output)
+        remove_output(checkpoint_path)
+
+    manager, class_names, identity = load_pest_model(args.manifest)
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    job = {'root': root, 'format': output_format, 'model': identity, 'top_k': args.top_k}
+    if checkpoint is None:
+        if os.path.exists(args.output):
+            print(f"❌ {args.output} already exists without a checkpoint; use --restart to overwrite it")
+            return 1
+        checkpoint = dict(job, version=CHECKPOINT_VERSION, last_path=None, processed=0, errors=0,
+                          writer={}, complete=False, started=datetime.now().isoformat())
+    else:
+        changed = [key for key, value in job.items() if checkpoint.get(key) != value]
+        if checkpoint.get('version') != CHECKPOINT_VERSION or changed:
+            print(f"❌ {checkpoint_path} belongs to a different scan ({', '.join(changed) or 'version'} changed); "
+                  f"use --restart to start over")
+            return 1
+        if checkpoint['complete']:
+            print(f"✅ Scan already complete: {checkpoint['processed']} images in {args.output}")
+            return 0
+
+    extensions = tuple(ext if ext.startswith('.') else '.' + ext for ext in args.extensions.split(',') if ext)
+    paths = find_images(root, extensions)
+    start = bisect.bisect_right(paths, checkpoint['last_path']) if checkpoint['last_path'] is not None else 0
+    remaining = paths[start:]
+    if start:
+        print(f"↩️  Resuming after {checkpoint['last_path']} ({checkpoint['processed']} images already scored)")
+    print(f"🔍 {len(remaining)} of {len(paths)} images to scan with {args.decode_workers} decode workers, "
+          f"batches of {args.batch_size}")
+
+    if output_format == 'parquet':
+        writer = ParquetWriter(args.output, checkpoint['writer'])
+    else:
+        writer = JSONLWriter(args.output, checkpoint['writer'])
+    # Written before any results, so even a scan killed before its first checkpoint can resume
+    checkpoint['writer'] = writer.flush()
+    save_checkpoint(checkpoint_path, checkpoint)
+
+    chunks = (remaining[i:i + args.batch_size] for i in range(0, len(remaining), args.batch_size))
+    pool = None
+    if args.decode_workers > 0:
+        # spawn: the workers only need PIL and NumPy, not a fork of the loaded model runtime
+        pool = ProcessPoolExecutor(max_workers=args.decode_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker)
+    prefetch = args.prefetch or 2 * max(1, args.decode_workers)
+
+    def decode(chunk):
+        if pool is None:
+            return chunk, decode_chunk(root, chunk, target_size)
+        return chunk, pool.submit(decode_chunk, root, chunk, target_size)
+
+    # Ctrl+C stops the scan between chunks, so the checkpoint always matches what was written
+    interrupted = []
+
+    def interrupt(signum, frame):
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted.append(signum)
+        print("\n⏸️  Stopping after the current batch (Ctrl+C again to abort without a checkpoint)")
+
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    started = time.perf_counter()
+    scanned = 0
+    since_checkpoint = 0
+    try:
+        pending = deque(decode(chunk) for _, chunk in zip(range(prefetch), chunks))
+        while pending and not interrupted:
+            chunk, result = pending.popleft()
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                pending.append(decode(next_chunk))
+
+            pixels, decoded, errors = result.result() if pool is not None else result
+            writer.write(score_chunk(manager, class_names, chunk, pixels, decoded, errors, args.top_k, target_size))
+
+            checkpoint['last_path'] = chunk[-1]
+            checkpoint['processed'] += len(chunk)
+            checkpoint['errors'] += len(errors)
+            scanned += len(chunk)
+            since_checkpoint += len(chunk)
+            if since_checkpoint >= args.checkpoint_every:
+                checkpoint['writer'] = writer.flush()
+                save_checkpoint(checkpoint_path, checkpoint)
+                since_checkpoint = 0
+                elapsed = time.perf_counter() - started
+                print(f"📦 {checkpoint['processed']}/{len(paths)} images ({scanned / elapsed:.1f} images/s, "
+                      f"{checkpoint['errors']} errors)")
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if pool is not None:
+            pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    if interrupted:
+        checkpoint['writer'] = writer.flush()
+        save_checkpoint(checkpoint_path, checkpoint)
+        writer.close()
+        print(f"⏸️  Interrupted after {checkpoint['processed']} images; run the same command again to resume")
+        return 130
+
+    checkpoint['writer'] = writer.flush()
+    checkpoint['complete'] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    writer.close()
+
+    elapsed = time.perf_counter() - started
+    rate = scanned / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Scanned {scanned} images in {elapsed:.1f}s ({rate:.1f} images/s); "
+          f"{checkpoint['errors']} could not be decoded. Results: {args.output}")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        return run(args)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Quantize model - build float32, float16 and int8 variants of the pest model
+
+The shipped pest_model.tflite stores its weights as int8 but computes in float
+(dynamic-range quantization), so it is first expanded into a plain float32
+reference. From that reference:
+    float16  weights stored as float16 and expanded at load (half the file size)
+    int8     weights and activations in int8, calibrated on sample images
+The int8 variant is converted from the Keras model (or SavedModel) the .tflite was
+exported from, with the sample images as the converter's representative dataset;
+it is skipped when that source is not available. Every variant, and the source model, is then scored on the sample images against
+the float32 reference and timed on this machine. The accuracy of each class is
+reported next to the reference's, and the variants are written beside the source
+model with a manifest entry ModelManager can choose from (see models/README.md),
+its paths relative to the manifest the entry is meant for.
+
+Images in sub-directories named after a class (e.g. samples/beetle/0001.jpg) are
+scored against that label; otherwise the reference's predictions are the labels
+and the report shows how often each variant agrees with it.
+
+Usage:
+    python quantize_model.py samples/
+    python quantize_model.py samples/ --variants int8 --calibration-samples 300
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+import image_preprocessing
+from pest_scan import IMAGE_EXTENSIONS, find_images
+from tflite_backend import TFLITE_NUM_THREADS, TFLiteModel, measure_latency
+
+VARIANTS = ('float32', 'float16', 'int8')
+
+# Float constants smaller than this stay float32 in the float16 variant (biases, scales)
+FLOAT16_MIN_ELEMENTS = 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build quantized variants of a tflite model and report their accuracy')
+    parser.add_argument('images', help='directory of sample images for calibration and scoring (searched recursively)')
+    parser.add_argument('--model', default=os.path.join('models', 'pest_model.tflite'))
+    parser.add_argument('--metadata', default=os.path.join('models', 'pest_model_metadata.pkl'),
+                        help='pickle with class_names and img_size')
+    parser.add_argument('--source', default=os.path.join('models', 'pest_model.h5'),
+                        help='Keras model or SavedModel directory --model was converted from, needed for int8')
+    parser.add_argument('--output-dir', default=None, help='where variants are written (default: next to --model)')
+    parser.add_argument('--manifest', default=os.environ.get('MODEL_MANIFEST', os.path.join('models', 'manifest.json')),
+                        help='manifest the printed entry is for; its paths are relative to this file')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help=f'comma-separated subset of {",".join(VARIANTS)}')
+    parser.add_argument('--calibration-samples', type=int, default=200,
+                        help='images used to calibrate int8 ranges; the rest are used for scoring')
+    parser.add_argument('--latency-runs', type=int, default=50, help='single-image invocations timed per model')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0, help='shuffles which images are used for calibration')
+    return parser.parse_args(argv)
+
+
+def _schema():
+    from tensorflow.lite.python import schema_py_generated as schema
+    return schema
+
+
+def read_model(path):
+    from tensorflow.lite.tools import flatbuffer_utils
+    return flatbuffer_utils.read_model(path)
+
+
+def write_model(model, path):
+    from tensorflow.lite.tools import flatbuffer_utils
+    content = bytes(flatbuffer_utils.convert_object_to_bytearray(model))
+    with open(path, 'wb') as f:
+        f.write(content)
+    return content
+
+
+def dequantize_weights(model):
+    """Replace int8 weight tensors of a dynamic-range model with their float32 values; returns how many changed"""
+    schema = _schema()
+    changed = 0
+    for subgraph in model.subgraphs:
+        for tensor in subgraph.tensors:
+            data = model.buffers[tensor.buffer].data
+            if tensor.type != schema.TensorType.INT8 or data is None or len(data) == 0:
+                continue
+            quantization = tensor.quantization
+            values = np.frombuffer(bytes(data), dtype=np.int8).reshape(tensor.shape).astype(np.float32)
+            scale = np.asarray(quantization.scale, dtype=np.float32)
+            zero_point = np.asarray(quantization.zeroPoint, dtype=np.float32)
+
+            # Per-channel scales apply along quantizedDimension
+            shape = [1] * values.ndim
+            if scale.size > 1:
+                shape[quantization.quantizedDimension] = -1
+            values = (values - zero_point.reshape(shape)) * scale.reshape(shape)
+
+            model.buffers[tensor.buffer].data = np.frombuffer(values.astype('<f4').tobytes(), dtype=np.uint8)
+            tensor.type = schema.TensorType.FLOAT32
+            tensor.quantization = None
+            changed += 1
+    return changed
+
+
+def float16_weights(model):
+    """Store large float32 constants as float16 behind DEQUANTIZE ops, as the TFLite converter does"""
+    schema = _schema()
+    opcode = next((i for i, code in enumerate(model.operatorCodes)
+                   if max(code.builtinCode, code.deprecatedBuiltinCode) == schema.BuiltinOperator.DEQUANTIZE), None)
+    if opcode is None:
+        code = schema.OperatorCodeT()
+        code.builtinCode = code.deprecatedBuiltinCode = schema.BuiltinOperator.DEQUANTIZE
+        code.version = 3
+        model.operatorCodes.append(code)
+        opcode = len(model.operatorCodes) - 1
+
+    changed = 0
+    for subgraph in model.subgraphs:
+        dequantize_ops = []
+        for index, tensor in enumerate(list(subgraph.tensors)):
+            buffer = model.buffers[tensor.buffer]
+            if tensor.type != schema.TensorType.FLOAT32 or buffer.data is None:
+                continue
+            values = np.frombuffer(bytes(buffer.data), dtype='<f4')
+            if values.size < FLOAT16_MIN_ELEMENTS:
+                continue
+
+            half = schema.BufferT()
+            half.data = np.frombuffer(values.astype('<f2').tobytes(), dtype=np.uint8)
+            model.buffers.append(half)
+            half_tensor = schema.TensorT()
+            half_tensor.name = (tensor.name.decode() if isinstance(tensor.name, bytes) else tensor.name) + '/float16'
+            half_tensor.shape = tensor.shape
+            half_tensor.type = schema.TensorType.FLOAT16
+            half_tensor.buffer = len(model.buffers) - 1
+            subgraph.tensors.append(half_tensor)
+
+            # The float32 tensor becomes the DEQUANTIZE output, filled in when the interpreter prepares
+            buffer.data = None
+            op = schema.OperatorT()
+            op.opcodeIndex = opcode
+            op.inputs = [len(subgraph.tensors) - 1]
+            op.outputs = [index]
+            dequantize_ops.append(op)
+            changed += 1
+        subgraph.operators = dequantize_ops + subgraph.operators
+    return changed
+
+
+def int8_calibrated(source, calibration):
+    """Full-integer model converted from a Keras model or SavedModel and calibrated on the given
+    float32 images through the converter's representative dataset; inputs and outputs stay float32"""
+    import tensorflow as tf
+
+    if os.path.isdir(source):
+        converter = tf.lite.TFLiteConverter.from_saved_model(source)
+    else:
+        converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(source, compile=False))
+
+    def samples():
+        for image in calibration:
+            yield [image[np.newaxis, ...]]
+
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = samples
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.float32
+    converter.inference_output_type = tf.float32
+    return converter.convert()
+
+
+def load_images(root, paths, target_size, class_names):
+    """Float32 images and label indices (-1 when the parent directory is not a class name)"""
+    lookup = {name.lower(): i for i, name in enumerate(class_names)}
+    width, height = target_size
+    images = np.empty((len(paths), height, width, 3), dtype=np.float32)
+    labels = []
+    kept = 0
+    for path in paths:
+        try:
+            with open(os.path.join(root, path), 'rb') as f:
+                pixels = image_preprocessing.decode_pixels(f, target_size)
+        except Exception as e:
+            print(f"⚠️  Skipping {path}: {e}", file=sys.stderr)
+            continue
+        image_preprocessing.normalize_into(pixels, images[kept])
+        parent = path.rsplit('/', 2)[-2] if '/' in path else ''
+        labels.append(lookup.get(parent.lower(), -1))
+        kept += 1
+    return images[:kept], np.array(labels, dtype=np.int64)
+
+
+def predict_classes(path, images, batch_size):
+    model = TFLiteModel(path, pool_size=1)
+    return np.concatenate([
+        model.predict(images[start:start + batch_size]).argmax(axis=1)
+        for start in range(0, len(images), batch_size)
+    ])
+
+
+def class_accuracy(labels, predictions, num_classes):
+    """Accuracy per class (None for classes without samples)"""
+    accuracy = []
+    for cls in range(num_classes):
+        mask = labels == cls
+        accuracy.append(round(float((predictions[mask] == cls).mean()), 4) if mask.any() else None)
+    return accuracy
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    requested = [name.strip() for name in args.variants.split(',') if name.strip()]
+    unknown = sorted(set(requested) - set(VARIANTS))
+    if unknown:
+        sys.exit(f"Unknown variants: {', '.join(unknown)} (choose from {', '.join(VARIANTS)})")
+    if 'int8' in requested and not os.path.exists(args.source):
+        print(f"⚠️  Skipping int8: no Keras model or SavedModel at {args.source} (set --source)", file=sys.stderr)
+        requested.remove('int8')
+
+    metadata = joblib.load(args.metadata)
+    class_names = list(metadata['class_names'])
+    target_size = tuple(metadata.get('img_size', (128, 128)))
+    output_dir = args.output_dir or os.path.dirname(os.path.abspath(args.model))
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.model))[0]
+    variant_path = lambda name: os.path.join(output_dir, f'{stem}.{name}.tflite')
+
+    paths = find_images(args.images, IMAGE_EXTENSIONS)
+    if not paths:
+        sys.exit(f"No images found under {args.images}")
+    random.Random(args.seed).shuffle(paths)
+    images, labels = load_images(args.images, paths, target_size, class_names)
+    calibration = images[:args.calibration_samples]
+    evaluation, eval_labels = images[args.calibration_samples:], labels[args.calibration_samples:]
+    if len(evaluation) == 0:
+        print("⚠️  Every image was used for calibration; scoring on the same images", file=sys.stderr)
+        evaluation, eval_labels = images, labels
+    print(f"📷 {len(images)} images: {len(calibration)} for calibration, {len(evaluation)} for scoring")
+
+    # float32 reference: the source model with any int8 weights expanded
+    model = read_model(args.model)
+    expanded = dequantize_weights(model)
+    reference_path = variant_path('float32')
+    write_model(model, reference_path)
+    print(f"🔧 float32 reference: expanded {expanded} int8 weight tensors -> {reference_path}")
+
+    if 'float16' in requested:
+        model = read_model(reference_path)
+        converted = float16_weights(model)
+        write_model(model, variant_path('float16'))
+        print(f"🔧 float16: {converted} weight tensors stored as float16")
+    if 'int8' in requested:
+        with open(variant_path('int8'), 'wb') as f:
+            f.write(int8_calibrated(args.source, calibration))
+        print(f"🔧 int8: converted from {args.source}, calibrated on {len(calibration)} images")
+
+    reference = predict_classes(reference_path, evaluation, args.batch_size)
+    labelled = eval_labels >= 0
+    if labelled.all():
+        truth, label_source = eval_labels, 'directory names'
+    else:
+        if labelled.any():
+            print(f"⚠️  {int((~labelled).sum())} images are not in a class directory; scoring against the float32 reference", file=sys.stderr)
+        truth, label_source = reference, 'float32 reference predictions'
+
+    models = [('source', args.model)] + [(name, variant_path(name)) for name in VARIANTS if name in requested or name == 'float32']
+    reference_accuracy = class_accuracy(truth, reference, len(class_names))
+    report = {
+        'source': args.model,
+        'created_at': datetime.now().isoformat(),
+        'images': args.images,
+        'calibration_samples': len(calibration),
+        'evaluation_samples': len(evaluation),
+        'labels': label_source,
+        'num_threads': TFLITE_NUM_THREADS,
+        'classes': class_names,
+        'models': {}
+    }
+    for name, path in models:
+        predictions = reference if name == 'float32' else predict_classes(path, evaluation, args.batch_size)
+        accuracy = class_accuracy(truth, predictions, len(class_names))
+        delta = [None if a is None else round(a - r, 4) for a, r in zip(accuracy, reference_accuracy)]
+        report['models'][name] = {
+            'path': path,
+            'size_bytes': os.path.getsize(path),
+            'latency_ms': round(measure_latency(TFLiteModel(path, pool_size=1), args.latency_runs), 3),
+            'accuracy': round(float((predictions == truth).mean()), 4),
+            'agreement_with_float32': round(float((predictions == reference).mean()), 4),
+            'class_accuracy': dict(zip(class_names, accuracy)),
+            'class_accuracy_delta': dict(zip(class_names, delta)),
+            # Largest per-class loss against float32, what max_accuracy_drop in the manifest is compared to
+            'accuracy_drop': max([0.0] + [-d for d in delta if d is not None])
+        }
+
+    report_path = os.path.join(output_dir, f'{stem}.variants.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'model':<10}{'size MB':>9}{'ms/image':>10}{'accuracy':>10}{'worst class Δ':>15}")
+    for name, result in report['models'].items():
+        print(f"{name:<10}{result['size_bytes'] / 1e6:>9.2f}{result['latency_ms']:>10.2f}"
+              f"{result['accuracy']:>10.3f}{-result['accuracy_drop'] or 0.0:>15.3f}")
+    print(f"\nPer-class accuracy vs float32 ({label_source}):")
+    for cls in class_names:
+        row = '  '.join(f"{name} {report['models'][name]['class_accuracy_delta'][cls]:+.3f}"
+                        for name in report['models'] if name != 'float32'
+                        and report['models'][name]['class_accuracy_delta'][cls] is not None)
+        print(f"  {cls:<14}{row or 'no samples'}")
+    print(f"\n📄 Report written to {report_path}")
+
+    # ModelManager.load_manifest resolves paths against the manifest's directory
+    manifest_dir = os.path.dirname(os.path.abspath(args.manifest))
+    relative = lambda path: os.path.relpath(os.path.abspath(path), manifest_dir)
+    entry = {
+        'name': stem, 'path': relative(args.model), 'type': 'tflite',
+        'variants': [
+            {'name': name, 'path': relative(variant_path(name)), 'accuracy_drop': report['models'][name]['accuracy_drop']}
+            for name in VARIANTS if name in report['models']
+        ]
+    }
+    print(f"📋 Manifest entry for {args.manifest} (paths relative to {manifest_dir}):\n{json.dumps(entry)}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
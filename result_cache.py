@@ -0,0 +1,210 @@
+"""
+Result cache - content-addressed prediction cache with a memory and an on-disk tier
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data, *identity):
+    """Hash raw content together with the identity of the model that scored it"""
+    digest = hashlib.sha256()
+    for part in identity:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with an optional time-to-live per entry"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """SQLite-backed JSON store that survives restarts"""
+
+    def __init__(self, path, max_entries=100000, ttl_seconds=None):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+        self._pid = os.getpid()
+
+    @property
+    def conn(self):
+        # SQLite connections must not cross fork(); each worker process opens its own
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._connect()
+        return self._conn
+
+    def get(self, key):
+        conn = self.conn
+        with self._lock:
+            row = conn.execute('SELECT value, stored_at FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, stored_at = row
+        if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+            return None
+        return json.loads(value)
+
+    def put(self, key, value):
+        conn = self.conn
+        with self._lock:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time())
+            )
+            self._writes += 1
+            # Prune expired and overflowing rows every so often rather than on every write
+            if self._writes % 1000 == 0:
+                self._prune()
+            conn.commit()
+
+    def _prune(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute('DELETE FROM results WHERE stored_at < ?', (time.time() - self.ttl_seconds,))
+        self._conn.execute(
+            'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def __len__(self):
+        conn = self.conn
+        with self._lock:
+            return conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+class ResultCache:
+    """Memory LRU in front of an optional on-disk tier, with hit/miss counters"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_path=None,
+                 disk_max_entries=100000, disk_ttl_seconds=7 * 24 * 3600):
+        self.memory = LRUCache(max_entries, ttl_seconds)
+        self.disk_path = disk_path or None
+        self._disk_args = (disk_max_entries, disk_ttl_seconds)
+        self._disk = None
+        self._disk_failed = False
+        self._disk_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    @property
+    def disk(self):
+        """The on-disk tier, opened on first use so that creating the cache touches no files"""
+        if self._disk is None and self.disk_path and not self._disk_failed:
+            with self._disk_lock:
+                if self._disk is None and not self._disk_failed:
+                    try:
+                        self._disk = DiskCache(self.disk_path, *self._disk_args)
+                    except Exception as e:
+                        self._disk_failed = True
+                        logger.error(f"Error opening result cache at {self.disk_path}: {str(e)}")
+        return self._disk
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return value
+
+        disk = self.disk
+        if disk is not None:
+            try:
+                value = disk.get(key)
+            except Exception as e:
+                logger.error(f"Error reading result cache: {str(e)}")
+                value = None
+            if value is not None:
+                self.memory.put(key, value)
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def put(self, key, value):
+        """Store a JSON-serializable value in both tiers"""
+        self.memory.put(key, value)
+        disk = self.disk
+        if disk is not None:
+            try:
+                disk.put(key, value)
+            except Exception as e:
+                logger.error(f"Error writing result cache: {str(e)}")
+        self._count('stores')
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return {
+            **counters,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            # None until a lookup or store has opened the database
+            'disk_entries': len(self._disk) if self._disk is not None else None,
+            'disk_path': self.disk_path if not self._disk_failed else None
+        }
@@ -0,0 +1,293 @@
+"""
+RPC server - the ModelManager endpoints over a Unix domain socket
+
+A persistent, pipelined alternative to HTTP for local callers such as the
+Node gateway (server.js). Every frame is a 4-byte big-endian length followed
+by a msgpack payload:
+    request   [id, method, params]
+    response  [id, status, body]
+Any number of requests may be in flight on one connection. Responses carry the
+request id and are sent as soon as each one finishes, so they can arrive out of
+order. status and body are what the matching HTTP route returns.
+
+Methods and params:
+    crop_prediction        the /api/crop-prediction JSON body
+    yield_prediction       the /api/yield-prediction JSON body
+    irrigation_prediction  the /api/predict-irrigation JSON body
+    irrigation_sweep       the /api/predict-irrigation/sweep JSON body
+    irrigation_bulk        {"readings": [...], "recommendations": false}
+    pest_detection         {"image": <bin or base64 str>}
+    pest_detection_batch   {"images": [<bin or base64 str>, ...]}
+    predict                {"model_name": ..., "input_data": ...}
+    models                 nil
+    health                 nil
+Images can be sent as msgpack bin, so no base64 step is needed on either side.
+
+Run with:
+    ML_RPC_SOCKET=/tmp/agri-ml.sock python app.py           # next to the HTTP server
+    python serve.py --rpc-socket /tmp/agri-ml.sock          # in every gunicorn worker
+    python rpc_server.py --socket /tmp/agri-ml.sock         # RPC only
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import msgpack
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Socket path; empty disables the RPC listener
+ML_RPC_SOCKET = os.environ.get('ML_RPC_SOCKET', '')
+# Threads running requests; NumPy, PIL and TFLite release the GIL while they work
+ML_RPC_WORKERS = int(os.environ.get('ML_RPC_WORKERS', min(8, os.cpu_count() or 1)))
+# Requests one connection may have in flight before the server stops reading from it
+ML_RPC_MAX_INFLIGHT = int(os.environ.get('ML_RPC_MAX_INFLIGHT', 64))
+# Largest frame accepted (bytes)
+ML_RPC_MAX_FRAME_BYTES = int(os.environ.get('ML_RPC_MAX_FRAME_BYTES', 32 * 1024 * 1024))
+# Permissions of the socket file (octal)
+ML_RPC_SOCKET_MODE = int(os.environ.get('ML_RPC_SOCKET_MODE', '660'), 8)
+
+HEADER = struct.Struct('>I')
+
+
+def _encode_default(value):
+    # Frozen advice tables, NumPy values and anything else jsonify would have handled
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence) and not isinstance(value, (str, bytes)):
+        return list(value)
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} cannot be sent over RPC')
+
+
+def pack(message):
+    payload = msgpack.packb(message, default=_encode_default, use_bin_type=True)
+    return HEADER.pack(len(payload)) + payload
+
+
+def build_methods(service):
+    """Method name -> handler(params) returning (body, status), bound to the app module that owns the ModelManager"""
+
+    def params_dict(params):
+        return params if isinstance(params, dict) else {}
+
+    def irrigation_bulk(params):
+        params = params_dict(params)
+        try:
+            columns = service.readings_to_columns(params.get('readings'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        return service.irrigation_bulk_response(columns, bool(params.get('recommendations', False)))
+
+    def pest_detection(params):
+        image = params_dict(params).get('image') if not isinstance(params, (bytes, str)) else params
+        return service.pest_detection_response(image or None)
+
+    def health(params):
+        return {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat(),
+            'loaded_models': list(service.model_manager.models.keys())
+        }, 200
+
+    return {
+        'crop_prediction': service.crop_prediction_response,
+        'yield_prediction': service.yield_prediction_response,
+        'irrigation_prediction': service.irrigation_prediction_response,
+        'irrigation_sweep': service.irrigation_sweep_response,
+        'irrigation_bulk': irrigation_bulk,
+        'pest_detection': pest_detection,
+        'pest_detection_batch': lambda params: service.pest_detection_batch_response(params_dict(params).get('images')),
+        'predict': service.predict_response,
+        'models': lambda params: service.models_response(),
+        'health': health
+    }
+
+
+def bind_socket(path, mode=ML_RPC_SOCKET_MODE):
+    """Listening Unix socket at path, replacing a stale socket file left by an earlier run"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, mode)
+    sock.listen(socket.SOMAXCONN)
+    return sock
+
+
+class RPCServer:
+    """Serves msgpack RPC frames from a Unix socket on its own event loop thread"""
+
+    def __init__(self, methods, path=None, sock=None, record_request=None, workers=ML_RPC_WORKERS,
+                 max_inflight=ML_RPC_MAX_INFLIGHT, max_frame_bytes=ML_RPC_MAX_FRAME_BYTES):
+        if sock is None and not path:
+            raise ValueError('RPCServer needs a socket path or a bound socket')
+        self.methods = methods
+        self.path = path
+        # record_request(route, method, status, seconds) from the app's request metrics
+        self.record_request = record_request
+        # A socket bound before fork() is shared by every worker, which all accept from it
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.max_inflight = max(1, max_inflight)
+        self.max_frame_bytes = max_frame_bytes
+        self.executor = None
+        self.loop = None
+        self._started = threading.Event()
+        self._error = None
+
+    def start(self):
+        """Serve in a daemon thread; returns once the socket is accepting, or raises why it could not start"""
+        thread = threading.Thread(target=self.serve_forever, name='rpc-server', daemon=True)
+        thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return thread
+
+    def serve_forever(self):
+        try:
+            if self.sock is None:
+                self.sock = bind_socket(self.path)
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rpc')
+            self.loop = asyncio.new_event_loop()
+            server = self.loop.run_until_complete(asyncio.start_unix_server(self._handle_connection, sock=self.sock))
+            logger.info(f"RPC server listening on {self.sock.getsockname() or self.path}")
+            self._started.set()
+            self.loop.run_forever()
+            server.close()
+        except Exception as e:
+            self._error = e
+            logger.error(f"RPC server stopped: {str(e)}")
+        finally:
+            self._started.set()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _handle_connection(self, reader, writer):
+        inflight = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                (length,) = HEADER.unpack(header)
+                if length > self.max_frame_bytes:
+                    # The stream cannot be resynchronized after an oversized frame, so the connection is dropped
+                    writer.write(pack([None, 413, {'error': f'Frame too large (maximum is {self.max_frame_bytes} bytes)'}]))
+                    break
+                payload = await reader.readexactly(length)
+
+                # Stop reading once max_inflight requests are running; the client's writes back up instead
+                await inflight.acquire()
+                task = asyncio.ensure_future(self._dispatch(payload, writer))
+                tasks.add(task)
+                task.add_done_callback(lambda task: (tasks.discard(task), inflight.release()))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _dispatch(self, payload, writer):
+        started = time.perf_counter()
+        request_id, method = None, 'invalid'
+        try:
+            request = msgpack.unpackb(payload, raw=False)
+            if not isinstance(request, (list, tuple)) or len(request) != 3:
+                raise ValueError('Request must be [id, method, params]')
+            request_id, method, params = request
+            handler = self.methods.get(method)
+            if handler is None:
+                body, status = {'error': f'Unknown method: {method}'}, 404
+            else:
+                body, status = await self._run(method, handler, params)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            body, status = {'error': f'Invalid request: {e}'}, 400
+        except Exception as e:
+            logger.error(f"Error in RPC {method}: {str(e)}")
+            body, status = {'error': str(e), 'success': False}, 500
+
+        try:
+            frame = pack([request_id, status, body])
+        except (TypeError, ValueError) as e:
+            logger.error(f"Could not encode RPC {method} response: {str(e)}")
+            frame = pack([request_id, 500, {'error': str(e), 'success': False}])
+        # One write per frame keeps pipelined responses from interleaving
+        writer.write(frame)
+        if self.record_request is not None:
+            route = f'rpc:{method}' if method in self.methods else 'rpc:invalid'
+            self.record_request(route, 'RPC', status, time.perf_counter() - started)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _run(self, method, handler, params):
+        # Stage timings inside the handler are attributed to the RPC method
+        context = contextvars.copy_context()
+        context.run(metrics.current_route.set, f'rpc:{method}')
+        return await self.loop.run_in_executor(self.executor, context.run, handler, params)
+
+
+def start_for(service, path=None, sock=None):
+    """Start an RPC server thread for the app module's endpoints; returns the RPCServer"""
+    server = RPCServer(build_methods(service), path=path, sock=sock, record_request=service.record_request)
+    server.start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the model endpoints over a Unix domain socket')
+    parser.add_argument('--socket', default=ML_RPC_SOCKET or '/tmp/agri-ml.sock')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    import app
+
+    app.init_models(background=False)
+    server = RPCServer(build_methods(app), path=args.socket, record_request=app.record_request)
+    print(f"🔌 Serving model RPC on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 1 if server._error is not None else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,7 +21,11 @@ def start_api():
     """Start the pest detection API"""
     try:
         print("🚀 Starting Pest Detection API...")
-        subprocess.run([sys.executable, "pest_detection_api.py"])
+        if sys.platform == "win32":
+            subprocess.run([sys.executable, "pest_detection_api.py"])
+        else:
+            # Multi-worker gunicorn server; each worker loads the model after the fork
+            subprocess.run([sys.executable, "serve.py", "--service", "pest"])
     except KeyboardInterrupt:
         print("\n⏹️ API stopped by user")
     except Exception as e:
@@ -0,0 +1,201 @@
+"""
+Serve - production entry point for the ML APIs
+
+Runs app.py (pest_detection_api.py with --service pest, or the asyncio
+variant in asgi_app.py with --service async) under gunicorn with a
+pre-fork model: the master loads the fork-safe artifacts once (pickles and
+metadata) and every worker inherits them copy-on-write. Artifacts exported by
+mapped_artifacts.py are shared through the page cache instead, so recycled
+workers reload them without copying.
+TensorFlow models and TFLite interpreters, including the whole --service pest
+model, are loaded in each worker after the fork, since their thread pools
+(including XNNPACK's) do not survive fork(). Workers are recycled after a
+configurable number of requests and drained gracefully on shutdown.
+
+Usage:
+    python serve.py --workers 4 --threads 4 --bind 0.0.0.0:5000
+    python serve.py --service pest --intra-op-threads 2
+    python serve.py --service async --workers 2
+    python serve.py --rpc-socket /tmp/agri-ml.sock   # also serve the model RPC (rpc_server.py)
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+logger = logging.getLogger('serve')
+
+# Model types that are safe to load before forking (no framework thread pools)
+FORK_SAFE_MODEL_TYPES = ('sklearn', 'metadata', 'scaler', 'label_encoder', 'mapped')
+
+# Modules whose thread pools deadlock a forked worker once the master has started them
+FORK_UNSAFE_MODULES = ('tensorflow', 'tflite_runtime', 'ai_edge_litert', 'torch')
+
+
+def default_workers():
+    return int(os.environ.get('WEB_CONCURRENCY', max(1, min(4, os.cpu_count() or 1))))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Multi-worker server for the ML APIs')
+    parser.add_argument('--service', choices=('app', 'pest', 'async'), default=os.environ.get('SERVE_SERVICE', 'app'),
+                        help='app.py (all endpoints), pest_detection_api.py or asgi_app.py (async prediction routes)')
+    parser.add_argument('--bind', default=os.environ.get('SERVE_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='worker processes (WEB_CONCURRENCY)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SERVE_THREADS', 4)),
+                        help='request threads per worker (ignored by --service async); '
+                             'concurrent requests feed the micro-batcher')
+    parser.add_argument('--intra-op-threads', type=int, default=os.environ.get('TF_INTRA_OP_THREADS'),
+                        help='TensorFlow intra-op threads per worker (default: cores / workers)')
+    parser.add_argument('--inter-op-threads', type=int, default=int(os.environ.get('TF_INTER_OP_THREADS', 1)),
+                        help='TensorFlow inter-op threads per worker')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('SERVE_TIMEOUT', 120)),
+                        help='seconds before a silent worker is killed and replaced')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30)),
+                        help='seconds workers get to finish in-flight requests on shutdown or reload')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS', 5000)),
+                        help='recycle a worker after this many requests (0 disables)')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS_JITTER', 500)),
+                        help='random spread so workers are not all recycled at once')
+    parser.add_argument('--no-preload', action='store_true',
+                        help='load everything in each worker instead of once in the master')
+    parser.add_argument('--rpc-socket', default=os.environ.get('ML_RPC_SOCKET') or None,
+                        help='also serve the model endpoints as msgpack RPC on this Unix socket (ML_RPC_SOCKET)')
+    return parser.parse_args(argv)
+
+
+def configure_threads(args):
+    """Split the cores between workers; must run before TensorFlow is imported anywhere"""
+    intra_op = args.intra_op_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(args.inter_op_threads)
+    os.environ.setdefault('OMP_NUM_THREADS', str(intra_op))
+    os.environ.setdefault('TFLITE_NUM_THREADS', str(intra_op))
+    return intra_op
+
+
+def load_pest_model(module):
+    if not module.load_model():
+        raise RuntimeError('Failed to load the pest detection model')
+
+
+def check_fork_safe():
+    """Fail before forking if preloading started a framework whose thread pools would hang the workers"""
+    loaded = [name for name in FORK_UNSAFE_MODULES if name in sys.modules]
+    if loaded:
+        raise RuntimeError(f"Preloading imported {', '.join(loaded)} in the master, which would hang "
+                           f"forked workers; serve with --no-preload")
+
+
+def load_service(service, preload):
+    """Import the Flask app and load models in the current process; returns (module, flask_app)"""
+    if service == 'pest':
+        import pest_detection_api as module
+        # Its model is a TFLite interpreter or a Keras model, so with preloading it loads in post_fork
+        if not preload:
+            load_pest_model(module)
+    else:
+        import app as module
+        if preload:
+            # Only fork-safe artifacts here; everything else loads in the workers after the fork
+            module.init_models(background=False, model_types=FORK_SAFE_MODEL_TYPES)
+        elif service == 'app':
+            module.init_models()
+    if preload:
+        check_fork_safe()
+
+    if service == 'async':
+        # Each worker finishes loading in the ASGI lifespan startup
+        import asgi_app
+        return module, asgi_app.app
+    return module, module.app
+
+
+def build_application(args):
+    from gunicorn.app.base import BaseApplication
+
+    rpc_socket = None
+    if args.rpc_socket:
+        if args.service == 'pest':
+            logger.warning("--rpc-socket is not supported with --service pest; ignoring it")
+        else:
+            # Bound once in the master; every worker accepts RPC connections from the inherited socket
+            import rpc_server
+            rpc_socket = rpc_server.bind_socket(args.rpc_socket)
+
+    class Server(BaseApplication):
+        def __init__(self):
+            self.module = None
+            self.application = None
+            super().__init__()
+
+        def load_config(self):
+            settings = {
+                'bind': args.bind,
+                'workers': args.workers,
+                'worker_class': 'uvicorn.workers.UvicornWorker' if args.service == 'async' else 'gthread',
+                'threads': args.threads,
+                'preload_app': not args.no_preload,
+                'timeout': args.timeout,
+                'graceful_timeout': args.graceful_timeout,
+                'max_requests': args.max_requests,
+                'max_requests_jitter': args.max_requests_jitter,
+                'post_fork': self.post_fork,
+                'post_worker_init': self.post_worker_init,
+                'worker_exit': self.worker_exit,
+                'on_exit': self.on_exit
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if self.application is None:
+                self.module, self.application = load_service(args.service, preload=not args.no_preload)
+            return self.application
+
+        def post_fork(self, server, worker):
+            # Threads, locks and TF state do not survive fork(); rebuild them in the worker.
+            # Without preloading the app is only imported after this hook runs.
+            if args.service in ('app', 'async') and self.module is not None:
+                self.module.model_manager.after_fork()
+                if args.service == 'app':
+                    self.module.init_models()
+            elif args.service == 'pest' and self.module is not None:
+                load_pest_model(self.module)
+
+        def post_worker_init(self, worker):
+            # After the app is loaded in this worker, with or without preloading
+            if rpc_socket is not None:
+                import rpc_server
+                rpc_server.start_for(self.module, sock=rpc_socket)
+        
+        def on_exit(self, server):
+            if rpc_socket is not None and os.path.exists(args.rpc_socket):
+                os.unlink(args.rpc_socket)
+        
+        def worker_exit(self, server, worker):
+            if args.service in ('app', 'async') and self.module is not None:
+                for batcher in list(self.module.model_manager.batchers.values()):
+                    batcher.stop()
+
+    return Server()
+
+
+def main(argv=None):
+    if sys.platform == 'win32':
+        print("❌ gunicorn does not run on Windows; use python app.py instead")
+        return 1
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    intra_op = configure_threads(args)
+    print(f"🚀 Serving {args.service} on {args.bind} with {args.workers} workers x {args.threads} threads "
+          f"(TF intra-op {intra_op}, inter-op {args.inter_op_threads})")
+    build_application(args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
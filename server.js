@@ -6,6 +6,7 @@ import path from "path";
 import { fileURLToPath } from "url";
 import { GoogleGenerativeAI } from "@google/generative-ai";
 import axios from "axios";
+import { MLRpcClient } from "./ml_rpc.js";
 
 dotenv.config();
 
@@ -23,6 +24,38 @@ app.use(express.static(path.join(__dirname, "public")));
 // Initialize Gemini
 const genAI = new GoogleGenerativeAI(process.env.GEMINI_API_KEY);
 
+// ML service over its Unix socket RPC when ML_RPC_SOCKET is set (python serve.py --rpc-socket ...),
+// which skips the HTTP connection and JSON encoding per call; HTTP on port 5000 otherwise
+const ML_API_URL = process.env.ML_API_URL || "http://localhost:5000";
+const mlRpc = process.env.ML_RPC_SOCKET
+  ? new MLRpcClient({
+      socketPath: process.env.ML_RPC_SOCKET,
+      poolSize: Number(process.env.ML_RPC_POOL_SIZE) || 2,
+      timeoutMs: 10000
+    })
+  : null;
+
+// Call an ML endpoint; resolves to the response body, throws on a non-2xx status
+async function callML(method, route, data) {
+  if (mlRpc) {
+    try {
+      const { status, body } = await mlRpc.call(method, data);
+      if (status >= 200 && status < 300) return body;
+      throw Object.assign(new Error(body?.error || `ML RPC ${method} failed with status ${status}`), { status });
+    } catch (err) {
+      // A slow service would only be slower with the same request again over HTTP
+      if (err.status || err.code === "ETIMEDOUT") throw err;
+      // Socket unreachable: fall back to HTTP
+      console.error("ML RPC error, using HTTP:", err.message);
+    }
+  }
+  const response = await axios.post(`${ML_API_URL}${route}`, data, {
+    timeout: 10000,
+    headers: { 'Content-Type': 'application/json' }
+  });
+  return response.data;
+}
+
 // In-memory chat sessions
 const sessions = {};
 
@@ -243,11 +276,7 @@ app.post("/api/crop-advisory", async (req, res) => {
     // Get ML prediction from Flask API
     let mlPrediction = null;
     try {
-      const response = await axios.post('http://localhost:5000/api/crop-prediction', mlData, {
-        timeout: 10000,
-        headers: { 'Content-Type': 'application/json' }
-      });
-      mlPrediction = response.data;
+      mlPrediction = await callML("crop_prediction", "/api/crop-prediction", mlData);
     } catch (mlError) {
       console.error("ML API error:", mlError.message);
     }
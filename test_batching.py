@@ -0,0 +1,102 @@
+"""
+Test batching - MicroBatcher splits queued requests into batches and fans results back out
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    """Doubles its input and remembers the size of every batch it was called with"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return batch * 2
+
+
+def test_queued_callers_share_a_batch_and_get_their_own_rows():
+    started, release = threading.Event(), threading.Event()
+    model = RecordingModel()
+
+    def gated(batch):
+        started.set()
+        release.wait(5)
+        return model(batch)
+
+    batcher = MicroBatcher(gated, max_batch_size=4, max_wait_ms=200)
+    lone = batcher.submit(np.array([[0.0]]))
+    # Everything below queues up while the first request is still running
+    assert started.wait(5)
+    first = batcher.submit(np.array([[1.0], [2.0]]))
+    second = batcher.submit(np.array([[3.0], [4.0]]))
+    third = batcher.submit(np.array([[5.0], [6.0], [7.0]]))
+    release.set()
+
+    np.testing.assert_array_equal(lone.result(timeout=5), [[0.0]])
+    np.testing.assert_array_equal(first.result(timeout=5), [[2.0], [4.0]])
+    np.testing.assert_array_equal(second.result(timeout=5), [[6.0], [8.0]])
+    np.testing.assert_array_equal(third.result(timeout=5), [[10.0], [12.0], [14.0]])
+    # The third request does not fit next to the first two, so it runs on its own
+    assert model.batch_sizes == [1, 4, 3]
+    batcher.stop()
+
+
+def test_lone_request_does_not_wait_for_a_batch():
+    batcher = MicroBatcher(RecordingModel(), max_batch_size=16, max_wait_ms=2000)
+    start = time.monotonic()
+    batcher.predict(np.zeros((1, 1)))
+    assert time.monotonic() - start < 1.0
+    batcher.stop()
+
+
+def test_request_larger_than_batch_size_runs_alone():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=2, max_wait_ms=0)
+    rows = np.arange(5, dtype=np.float64).reshape(5, 1)
+
+    np.testing.assert_array_equal(batcher.predict(rows), rows * 2)
+    assert model.batch_sizes == [5]
+    batcher.stop()
+
+
+def test_model_error_reaches_every_caller_in_the_batch():
+    def failing(batch):
+        raise RuntimeError('model exploded')
+
+    batcher = MicroBatcher(failing, max_batch_size=8, max_wait_ms=200)
+    futures = [batcher.submit(np.zeros((2, 1))) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match='model exploded'):
+            future.result(timeout=5)
+    batcher.stop()
+
+
+def test_batcher_keeps_running_after_an_error():
+    calls = []
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError('first batch fails')
+        return batch + 1
+
+    batcher = MicroBatcher(flaky, max_batch_size=8, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.predict(np.zeros((1, 1)))
+    np.testing.assert_array_equal(batcher.predict(np.zeros((1, 1))), [[1.0]])
+    batcher.stop()
+
+
+def test_submit_after_stop_is_refused():
+    batcher = MicroBatcher(RecordingModel(), max_wait_ms=0)
+    batcher.stop()
+    with pytest.raises(RuntimeError, match='stopped'):
+        batcher.submit(np.zeros((1, 1)))
@@ -0,0 +1,105 @@
+"""
+Test coalescing - identical concurrent calls share one run through SingleFlight and array_key
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from coalescing import SingleFlight, array_key
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start callers threads on flight.run(key, fn); returns the threads and their (result, shared) or exception"""
+    outcomes = [None] * callers
+
+    def call(i):
+        try:
+            outcomes[i] = flight.run(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_identical_keys_share_one_run():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return {'prediction': 'rice'}
+
+    threads, outcomes = run_concurrently(flight, 'same', slow, 5)
+    # Give every caller time to join the flight before the leader finishes
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert all(result == {'prediction': 'rice'} for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False, True, True, True, True]
+    assert len(flight) == 0
+
+
+def test_error_reaches_every_waiting_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError('bad input')
+
+    threads, outcomes = run_concurrently(flight, 'same', failing, 3)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    # A failed flight is not remembered
+    assert flight.run('same', lambda: 'retried') == ('retried', False)
+
+
+def test_sequential_calls_run_again():
+    flight = SingleFlight()
+    calls = []
+    for _ in range(3):
+        flight.run('key', lambda: calls.append(1))
+    assert len(calls) == 3
+
+
+def test_array_key_matches_equal_inputs():
+    identity = ('crop_model', 'sklearn', 'crop_model.pkl', '100-1')
+    a = np.array([[6.5, 40.0, 30.0]])
+    assert array_key(a, *identity) == array_key(a.copy(), *identity)
+    # A non-contiguous view with the same values is the same input
+    wide = np.array([[6.5, 0.0, 40.0, 0.0, 30.0, 0.0]])
+    assert array_key(wide[:, ::2], *identity) == array_key(a, *identity)
+
+
+@pytest.mark.parametrize('other', [
+    np.array([[6.5, 40.0, 31.0]]),
+    np.array([[6.5, 40.0, 30.0]], dtype=np.float32),
+    np.array([6.5, 40.0, 30.0]),
+])
+def test_array_key_separates_different_inputs(other):
+    identity = ('crop_model',)
+    assert array_key(np.array([[6.5, 40.0, 30.0]]), *identity) != array_key(other, *identity)
+
+
+def test_array_key_includes_model_identity():
+    a = np.ones((1, 3))
+    assert array_key(a, 'crop_model', '100-1') != array_key(a, 'crop_model', '100-2')
+
+
+def test_array_key_refuses_object_arrays():
+    assert array_key(np.array([{'soil_ph': 6.5}], dtype=object), 'crop_model') is None
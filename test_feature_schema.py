@@ -0,0 +1,130 @@
+"""
+Test feature schema - request dicts map onto model columns, bad payloads become 400s
+"""
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+import app
+from dense_inference import DenseNetwork
+from feature_schema import FeatureError, FeatureSchema
+from mapped_artifacts import export_artifact
+
+CROP_FEATURES = ['soil_ph', 'nitrogen', {'name': 'rainfall', 'default': 1000},
+                 {'name': 'region', 'categories': ['arid', 'temperate', 'tropical']}]
+
+
+def test_key_order_does_not_matter():
+    schema = FeatureSchema(CROP_FEATURES)
+    a = schema.transform({'soil_ph': 6.5, 'nitrogen': 40, 'rainfall': 800, 'region': 'arid'})
+    b = schema.transform({'region': 'arid', 'rainfall': '800', 'nitrogen': 40.0, 'soil_ph': 6.5})
+    np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(a, [[6.5, 40.0, 800.0, 1.0, 0.0, 0.0]])
+    assert schema.columns == ['soil_ph', 'nitrogen', 'rainfall', 'region=arid', 'region=temperate', 'region=tropical']
+
+
+def test_unused_fields_are_ignored_and_defaults_filled():
+    schema = FeatureSchema(CROP_FEATURES)
+    out = schema.transform([{'soil_ph': 7, 'nitrogen': 1, 'region': 'TROPICAL', 'farmer': 'x'}])
+    np.testing.assert_array_equal(out, [[7.0, 1.0, 1000.0, 0.0, 0.0, 1.0]])
+
+
+def test_ordinal_encoding():
+    schema = FeatureSchema([{'name': 'season', 'categories': ['kharif', 'rabi', 'zaid'], 'encoding': 'ordinal'}])
+    np.testing.assert_array_equal(schema.transform([{'season': 'zaid'}, {'season': 'kharif'}]), [[2.0], [0.0]])
+
+
+@pytest.mark.parametrize('record, message', [
+    ({'nitrogen': 40, 'region': 'arid'}, 'Missing required field: soil_ph'),
+    ({'soil_ph': 'acidic', 'nitrogen': 40, 'region': 'arid'}, 'soil_ph must be a number'),
+    ({'soil_ph': 6.5, 'nitrogen': 40, 'region': 'alpine'}, "Unknown region 'alpine'"),
+])
+def test_bad_records_name_the_field(record, message):
+    with pytest.raises(FeatureError, match=message):
+        FeatureSchema(CROP_FEATURES).transform(record)
+
+
+def test_invalid_schema_is_rejected():
+    with pytest.raises(ValueError):
+        FeatureSchema([{'name': 'region', 'encoding': 'onehot'}])
+    with pytest.raises(ValueError):
+        FeatureSchema([{'name': 'region', 'categories': ['arid'], 'encoding': 'binary'}])
+
+
+@pytest.fixture
+def crop_manager(tmp_path, monkeypatch):
+    """A ModelManager serving crop_model (with a feature schema) and raw_model (without one)"""
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 10, size=(60, 6))
+    labels = np.array(['rice', 'maize'])[(features[:, 0] > 5).astype(int)]
+    path = str(tmp_path / 'model.pkl')
+    joblib.dump(LogisticRegression(max_iter=200).fit(features, labels), path)
+
+    manager = app.ModelManager()
+    manager.register_model('crop_model', path, 'sklearn', features=CROP_FEATURES)
+    manager.register_model('raw_model', path, 'sklearn')
+    monkeypatch.setattr(app, 'model_manager', manager)
+    return manager
+
+
+def test_crop_prediction_accepts_any_key_order(crop_manager):
+    body, status = app.crop_prediction_response({'region': 'arid', 'nitrogen': 4, 'soil_ph': 8})
+    assert status == 200
+    assert body['prediction'] == crop_manager.predict('crop_model', [[8, 4, 1000, 1, 0, 0]])
+
+
+@pytest.mark.parametrize('data', [
+    {'soil_ph': 6.5, 'nitrogen': 40, 'region': 'alpine'},
+    {'nitrogen': 40, 'region': 'arid'},
+    {'samples': [{'soil_ph': 6.5, 'nitrogen': 40, 'region': 'arid'}, {'soil_ph': 'x', 'region': 'arid'}]},
+])
+def test_crop_prediction_rejects_bad_fields(crop_manager, data):
+    body, status = app.crop_prediction_response(data)
+    assert status == 400
+    assert body['error']
+
+
+@pytest.mark.parametrize('data', [{'soil_ph': 6.5}, [{'soil_ph': 6.5}, {'soil_ph': 7.0}]])
+def test_model_without_schema_rejects_named_fields(crop_manager, data):
+    with pytest.raises(FeatureError, match='no feature schema'):
+        crop_manager.predict('raw_model', data)
+    # Arrays in column order still work
+    assert len(crop_manager.predict('raw_model', [[1, 2, 3, 4, 5, 6]])['prediction']) == 1
+
+
+def test_yield_prediction_answers_400_without_schema(crop_manager):
+    crop_manager.register_model('yield_model', crop_manager.model_info['raw_model']['path'], 'sklearn')
+    body, status = app.yield_prediction_response({'soil_ph': 6.5})
+    assert status == 400
+    assert 'no feature schema' in body['error']
+
+
+@pytest.fixture
+def dense_manager(tmp_path):
+    """A ModelManager serving the same small dense network as a mapped artifact, with and without features"""
+    rng = np.random.default_rng(0)
+    network = DenseNetwork([(rng.normal(size=(3, 4)), rng.normal(size=4), 'relu'),
+                            (rng.normal(size=(4, 1)), rng.normal(size=1), 'sigmoid')])
+    directory = str(tmp_path / 'dense')
+    fields = export_artifact(network, 'numpy', directory)
+    manager = app.ModelManager()
+    manager.register_model('dense', directory, 'mapped', **fields)
+    manager.register_model('dense_named', directory, 'mapped', features=['soil_moisture', 'temperature', 'humidity'], **fields)
+    return manager, network
+
+
+def test_non_sklearn_model_takes_dict_values_in_order(dense_manager):
+    manager, network = dense_manager
+    result = manager.predict('dense', {'soil_moisture': 30, 'temperature': 25, 'humidity': 60})
+    np.testing.assert_allclose(result['prediction'], network.predict([[30, 25, 60]]), rtol=1e-6)
+
+
+def test_non_sklearn_model_uses_manifest_features(dense_manager):
+    manager, network = dense_manager
+    result = manager.predict('dense_named', {'humidity': 60, 'temperature': 25, 'soil_moisture': 30, 'note': 'x'})
+    np.testing.assert_allclose(result['prediction'], network.predict([[30, 25, 60]]), rtol=1e-6)
+    assert manager.model_info['dense_named']['features'] == ['soil_moisture', 'temperature', 'humidity']
+    with pytest.raises(FeatureError, match='Missing required field: humidity'):
+        manager.predict('dense_named', {'soil_moisture': 30, 'temperature': 25})
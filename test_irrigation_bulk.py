@@ -0,0 +1,81 @@
+"""
+Test irrigation bulk - CSV, NDJSON and JSON readings become columns validated row by row
+"""
+
+import numpy as np
+import pytest
+
+import app
+
+
+def parse_csv(text):
+    with app.app.test_request_context('/api/predict-irrigation/bulk', method='POST', data=text, content_type='text/csv'):
+        return app.parse_irrigation_readings()
+
+
+def test_csv_columns_in_any_order():
+    columns = parse_csv('rainfall, humidity ,crop_type,temperature,soil_moisture,notes\n'
+                        '0,60,rice,28.5,40,wet\n'
+                        '\n'
+                        '5,55,wheat,20,35,\n')
+    assert columns == {
+        'crop_type': ['rice', 'wheat'], 'soil_moisture': ['40', '35'], 'temperature': ['28.5', '20'],
+        'humidity': ['60', '55'], 'rainfall': ['0', '5']
+    }
+
+
+def test_csv_short_rows_leave_fields_missing():
+    columns = parse_csv('crop_type,soil_moisture,temperature,humidity,rainfall\nrice,40,28\n')
+    assert columns['temperature'] == ['28']
+    assert columns['humidity'] == [None]
+    assert columns['rainfall'] == [None]
+
+
+def test_csv_header_must_name_every_reading():
+    with pytest.raises(ValueError, match='missing columns: humidity, rainfall'):
+        parse_csv('crop_type,soil_moisture,temperature\nrice,40,28\n')
+    with pytest.raises(ValueError, match='missing columns'):
+        parse_csv('')
+
+
+def test_ndjson_lines():
+    body = '{"crop_type": "rice", "soil_moisture": 40}\n\n{"crop_type": "wheat"}\n'
+    with app.app.test_request_context('/', method='POST', data=body, content_type='application/x-ndjson'):
+        columns = app.parse_irrigation_readings()
+    assert columns['crop_type'] == ['rice', 'wheat']
+    assert columns['soil_moisture'] == [40, None]
+
+    with app.app.test_request_context('/', method='POST', data='{"crop_type": "rice"}\n{oops', content_type='application/x-ndjson'):
+        with pytest.raises(ValueError, match='line 2'):
+            app.parse_irrigation_readings()
+
+
+def test_json_reading_shapes():
+    row = {'crop_type': 'rice', 'soil_moisture': 40, 'temperature': 28, 'humidity': 60, 'rainfall': 0}
+    columnar = {name: [value] for name, value in row.items()}
+    assert app.readings_to_columns([row]) == columnar
+    assert app.readings_to_columns({'readings': [row]}) == columnar
+    assert app.readings_to_columns(columnar) == columnar
+    assert app.readings_to_columns(['not a reading'])['crop_type'] == [None]
+
+    with pytest.raises(ValueError, match='same length'):
+        app.readings_to_columns(dict(columnar, rainfall=[0, 1]))
+    with pytest.raises(ValueError, match='Send a JSON array'):
+        app.readings_to_columns(None)
+
+
+def test_bulk_rows_are_validated_independently(crop_encoder):
+    columns = parse_csv('crop_type,soil_moisture,temperature,humidity,rainfall\n'
+                        'rice,40,28,60,0\n'
+                        'wheat,wet,28,60,0\n'
+                        'rice,40,28,160,0\n'
+                        'barley,40,28,60,0\n'
+                        'rice,40\n')
+    features, errors, invalid = app.build_irrigation_features(columns)
+
+    assert invalid.tolist() == [False, True, True, True, True]
+    np.testing.assert_array_equal(features[0], [0, 40, 28, 60, 0])
+    assert errors[1] == 'All numeric parameters must be valid numbers'
+    assert errors[2] == 'Humidity must be between 0 and 100'
+    assert errors[3] == 'Unknown crop type. Please use a valid crop type.'
+    assert errors[4].startswith('All parameters are required')
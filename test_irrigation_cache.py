@@ -0,0 +1,53 @@
+"""
+Test irrigation cache - readings are bucketed by IRRIGATION_CACHE_BUCKETS widths and clamped to range
+"""
+
+import pytest
+
+import app
+
+
+def test_nearby_readings_share_a_bucket(monkeypatch):
+    monkeypatch.setattr(app, 'IRRIGATION_CACHE_BUCKETS', dict(app.IRRIGATION_CACHE_DEFAULT_BUCKETS))
+    a = app.quantize_irrigation_readings([45.2, 28.31, 60.4, 3.04])
+    b = app.quantize_irrigation_readings([44.8, 28.34, 59.6, 2.96])
+    assert a == b
+    assert a[1] == [45.0, 28.3, 60.0, 3.0]
+
+
+def test_bucket_edges(monkeypatch):
+    monkeypatch.setattr(app, 'IRRIGATION_CACHE_BUCKETS', {'soil_moisture': 10})
+    below, _ = app.quantize_irrigation_readings([34.9, 20, 50, 0])
+    above, _ = app.quantize_irrigation_readings([35.1, 20, 50, 0])
+    assert below[0] == 3
+    assert above[0] == 4
+    # Readings exactly on a range limit stay in range
+    assert app.quantize_irrigation_readings([0, -10, 0, 0])[1] == [0, -10, 0, 0]
+    assert app.quantize_irrigation_readings([100, 50, 100, 500])[1] == [100, 50, 100, 500]
+
+
+def test_bucket_values_are_clamped_to_the_valid_range(monkeypatch):
+    monkeypatch.setattr(app, 'IRRIGATION_CACHE_BUCKETS', {'soil_moisture': 30, 'temperature': 40, 'rainfall': 300})
+    _, values = app.quantize_irrigation_readings([99, -9, 50, 480])
+    # 99 -> 90 (fine), -9 rounds to bucket 0 -> 0, 480 -> 600 would be past the 500 limit
+    assert values == [90, 0, 50, 500]
+    _, values = app.quantize_irrigation_readings([50, 49, 50, 0])
+    # 49 rounds to bucket 1 -> 40; temperature upper limit 50 is never exceeded
+    assert values[1] == 40
+    _, values = app.quantize_irrigation_readings([50, -30, 50, 0])
+    assert values[1] == -10
+
+
+def test_zero_width_keeps_exact_readings(monkeypatch):
+    monkeypatch.setattr(app, 'IRRIGATION_CACHE_BUCKETS', {'soil_moisture': 0})
+    assert app.quantize_irrigation_readings([45.123, 20, 50, 1]) == ([45.123, 20, 50, 1], [45.123, 20, 50, 1])
+
+
+def test_bucket_width_spec_is_parsed():
+    assert app.parse_bucket_widths('soil_moisture=2, rainfall=0.5,') == {'soil_moisture': 2.0, 'rainfall': 0.5}
+
+
+@pytest.mark.parametrize('spec', ['soil_moisture', 'soil=1', 'humidity=wide', 'rainfall=-1', 'temperature=nan'])
+def test_invalid_bucket_widths_fall_back_to_defaults(spec, caplog):
+    assert app.parse_bucket_widths(spec) == app.IRRIGATION_CACHE_DEFAULT_BUCKETS
+    assert 'Invalid IRRIGATION_CACHE_BUCKETS entry' in caplog.text
@@ -0,0 +1,99 @@
+"""
+Test irrigation sweep - what-if grids expand into feature rows within the scenario cap
+"""
+
+import numpy as np
+import pytest
+
+import app
+
+
+def test_sweep_range_includes_stop():
+    assert app.parse_sweep_values('humidity', {'start': 40, 'stop': 60, 'step': 5}) == [40, 45, 50, 55, 60]
+    assert app.parse_sweep_values('humidity', {'start': 0, 'stop': 1, 'step': 0.1})[-1] == pytest.approx(1.0)
+    assert app.parse_sweep_values('rainfall', {'start': 0, 'stop': 10, 'num': 3}) == [0, 5, 10]
+    assert app.parse_sweep_values('crop_type', ['rice', 'wheat']) == ['rice', 'wheat']
+
+
+@pytest.mark.parametrize('spec', [
+    {'start': 60, 'stop': 40, 'step': 5},
+    {'start': 0, 'stop': 10, 'step': 0},
+    {'start': 0, 'stop': 10, 'num': 0},
+    {'start': 'low', 'stop': 10},
+    {'stop': 10},
+    [],
+    'wet',
+])
+def test_invalid_sweep_ranges(spec):
+    with pytest.raises(ValueError):
+        app.parse_sweep_values('humidity', spec)
+
+
+def test_sweep_range_over_the_cap(monkeypatch):
+    monkeypatch.setattr(app, 'IRRIGATION_SWEEP_MAX_POINTS', 10)
+    with pytest.raises(ValueError, match='more than 10 values'):
+        app.parse_sweep_values('humidity', {'start': 0, 'stop': 100, 'step': 1})
+
+
+def test_sweep_grid_layout(crop_encoder):
+    features, axes, shape = app.build_sweep_features({
+        'base': {'crop_type': 'rice', 'soil_moisture': 30, 'temperature': 25},
+        'forecast': {'time': ['mon', 'tue', 'wed'], 'humidity': [50, 60, 70], 'rainfall': [0, 5, 10]},
+        'vary': {'soil_moisture': [20, 40], 'crop_type': ['rice', 'wheat']}
+    })
+    assert shape == (3, 2, 2)
+    assert [axis['name'] for axis in axes] == ['forecast', 'soil_moisture', 'crop_type']
+    assert axes[0]['values'] == ['mon', 'tue', 'wed']
+    assert axes[0]['variables'] == ['humidity', 'rainfall']
+
+    grid = features.reshape(shape + (5,))
+    # Columns: crop_type, soil_moisture, temperature, humidity, rainfall
+    np.testing.assert_array_equal(grid[2, 1, 1], [1, 40, 25, 70, 10])
+    np.testing.assert_array_equal(grid[0, 0, 0], [0, 20, 25, 50, 0])
+    assert (grid[..., 2] == 25).all()
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'base': {}}, 'Provide forecast series'),
+    ({'vary': {'wind': [1, 2]}}, "Unknown sweep variable 'wind'"),
+    ({'vary': {'time': [1, 2]}}, "Unknown sweep variable 'time'"),
+    ({'forecast': {'time': ['mon', 'tue']}, 'vary': {'humidity': [50]}}, 'forecast.time labels need at least one forecast series'),
+    ({'forecast': {'humidity': [1, 2]}, 'vary': {'humidity': [3]}}, 'both a forecast series and a vary range'),
+    ({'forecast': {'humidity': [1, 2], 'rainfall': [1]}}, 'same length'),
+    ({'forecast': {'humidity': [1, 2], 'time': ['mon']}}, 'one label per forecast step'),
+    ({'vary': {'humidity': [50]}, 'base': {'crop_type': 'rice'}}, 'base is missing soil_moisture, temperature, rainfall'),
+    ({'vary': {'crop_type': ['rice', 'barley']},
+      'base': {'soil_moisture': 30, 'temperature': 25, 'humidity': 50, 'rainfall': 0}}, 'Unknown crop type: barley'),
+    ({'vary': {'humidity': [50, 150]},
+      'base': {'crop_type': 'rice', 'soil_moisture': 30, 'temperature': 25, 'rainfall': 0}}, 'Humidity must be between'),
+])
+def test_invalid_sweeps(crop_encoder, data, message):
+    with pytest.raises(ValueError, match=message):
+        app.build_sweep_features(data)
+
+
+def test_sweep_cap_counts_without_overflow(crop_encoder):
+    # Each axis is within the cap, but their product is past the int64 range
+    full = {'start': 0, 'stop': 100, 'num': app.IRRIGATION_SWEEP_MAX_POINTS}
+    with pytest.raises(ValueError, match='scenarios'):
+        app.build_sweep_features({'base': {'crop_type': 'rice'}, 'vary': {
+            'soil_moisture': full, 'temperature': {'start': -10, 'stop': 50, 'num': app.IRRIGATION_SWEEP_MAX_POINTS},
+            'humidity': full, 'rainfall': full
+        }})
+
+
+def test_sweep_probabilities_keep_their_precision(crop_encoder, monkeypatch):
+    path = crop_encoder.model_info['irrigation_label_encoder']['path']
+    crop_encoder.register_model('irrigation_model', path, 'label_encoder')
+    crop_encoder.register_model('irrigation_scaler', path, 'label_encoder')
+    # The models answer in float32
+    monkeypatch.setattr(app, 'score_irrigation', lambda features: np.linspace(0.0003, 0.9, len(features), dtype=np.float32))
+
+    body, status = app.irrigation_sweep_response({
+        'base': {'crop_type': 'rice', 'soil_moisture': 30, 'temperature': 25, 'rainfall': 0},
+        'vary': {'humidity': [40, 50, 60]},
+        'precision': 4
+    })
+    assert status == 200
+    assert body['probabilities'] == [0.0003, 0.4502, 0.9]
+    assert '"probabilities":[0.0003,0.4502,0.9]' in app.app.json.dumps(body, separators=(',', ':'))
@@ -0,0 +1,116 @@
+"""
+Test result cache - LRU and SQLite tiers, eviction and invalidation by model identity
+"""
+
+import os
+
+import joblib
+
+import app
+import result_cache
+from result_cache import DiskCache, LRUCache, ResultCache, content_key
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(max_entries=4, ttl_seconds=10)
+    cache.put('a', 1)
+    now[0] += 5
+    assert cache.get('a') == 1
+    now[0] += 11
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_disk_cache_survives_reopening(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    DiskCache(path).put('key', {'pest': 'beetle', 'confidence': 0.9})
+    assert DiskCache(path).get('key') == {'pest': 'beetle', 'confidence': 0.9}
+
+
+def test_disk_cache_prunes_to_max_entries(tmp_path):
+    cache = DiskCache(str(tmp_path / 'results.sqlite3'), max_entries=10)
+    # Pruning runs every 1000 writes
+    for i in range(1000):
+        cache.put(f'key-{i}', i)
+    assert len(cache) == 10
+    assert cache.get('key-999') == 999
+    assert cache.get('key-0') is None
+
+
+def test_disk_cache_ignores_expired_rows(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    cache = DiskCache(str(tmp_path / 'results.sqlite3'), ttl_seconds=60)
+    cache.put('key', 1)
+    now[0] += 61
+    assert cache.get('key') is None
+
+
+def test_result_cache_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    ResultCache(disk_path=path).put('key', {'pest': 'aphid'})
+
+    cache = ResultCache(disk_path=path)
+    assert cache.get('key') == {'pest': 'aphid'}
+    assert cache.get('key') == {'pest': 'aphid'}
+    assert cache.get('other') is None
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_result_cache_opens_database_on_first_use(tmp_path):
+    path = tmp_path / 'cache' / 'results.sqlite3'
+    cache = ResultCache(disk_path=str(path))
+    assert not path.parent.exists()
+    assert cache.stats()['disk_entries'] is None
+
+    cache.put('key', 1)
+    assert path.exists()
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_result_cache_falls_back_to_memory_when_disk_fails(tmp_path):
+    blocker = tmp_path / 'not_a_directory'
+    blocker.write_text('')
+    cache = ResultCache(disk_path=str(blocker / 'results.sqlite3'))
+    cache.put('key', 1)
+    assert cache.get('key') == 1
+    assert cache.disk is None
+
+
+def test_content_key_changes_with_identity():
+    data = b'image bytes'
+    assert content_key(data, 'pest_model', '100-1') == content_key(data, 'pest_model', '100-1')
+    assert content_key(data, 'pest_model', '100-1') != content_key(data, 'pest_model', '100-2')
+    assert content_key(data, 'pest_model') != content_key(b'other bytes', 'pest_model')
+
+
+def test_replacing_a_model_invalidates_its_cached_results(tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    joblib.dump({'version': 1}, path)
+    manager = app.ModelManager()
+    manager.register_model('model', path, 'metadata')
+    cache = ResultCache()
+    cache.put(content_key(b'input', *manager.model_identity('model')), 'old result')
+
+    joblib.dump({'version': 2, 'padding': 'x' * 100}, path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    manager.register_model('model', path, 'metadata')
+
+    assert cache.get(content_key(b'input', *manager.model_identity('model'))) is None
@@ -0,0 +1,176 @@
+"""
+TFLite backend - serves .tflite models from a pool of preallocated interpreters
+"""
+
+import logging
+import os
+import queue
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of interpreters kept in the pool (one per concurrently serving thread; app.py keeps one for micro-batched models)
+TFLITE_POOL_SIZE = int(os.environ.get('TFLITE_POOL_SIZE', min(4, os.cpu_count() or 1)))
+# Threads used by each interpreter for a single invoke
+TFLITE_NUM_THREADS = int(os.environ.get('TFLITE_NUM_THREADS', 1))
+
+
+def load_interpreter_class():
+    """Return the lightest available TFLite Interpreter class"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """Keras-like predict() on top of a pool of TFLite interpreters"""
+
+    def __init__(self, model_path, pool_size=TFLITE_POOL_SIZE, num_threads=TFLITE_NUM_THREADS):
+        self.model_path = model_path
+        self.pool_size = max(1, int(pool_size))
+        self.num_threads = max(1, int(num_threads))
+        self._interpreter_class = load_interpreter_class()
+        self._pool = queue.LifoQueue()
+
+        # Each pool entry is [interpreter, current input shape]
+        for _ in range(self.pool_size):
+            self._pool.put(self._create_interpreter())
+
+        slot = self._pool.get()
+        try:
+            input_details = slot[0].get_input_details()[0]
+            output_details = slot[0].get_output_details()[0]
+        finally:
+            self._pool.put(slot)
+
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.input_dtype = input_details['dtype']
+        self.input_shape = tuple(int(d) for d in input_details['shape_signature'])
+        self.output_shape = tuple(int(d) for d in output_details['shape_signature'])
+
+        # Rough per-interpreter footprint: every tensor at the allocated (batch 1) shape
+        self._tensor_bytes = sum(
+            int(np.prod(t['shape'])) * np.dtype(t['dtype']).itemsize
+            for t in slot[0].get_tensor_details()
+        )
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the pool: the model file plus each interpreter's tensors"""
+        return os.path.getsize(self.model_path) + self.pool_size * self._tensor_bytes
+
+    def _create_interpreter(self):
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+        interpreter.allocate_tensors()
+        return [interpreter, tuple(interpreter.get_input_details()[0]['shape'])]
+
+    def warm_up(self, batch_size=1):
+        """Invoke every pooled interpreter once with synthetic input so no request pays first-run setup"""
+        shape = (batch_size,) + self.input_shape[1:]
+        batch = np.zeros(shape, dtype=self.input_dtype)
+        slots = [self._pool.get() for _ in range(self.pool_size)]
+        try:
+            for slot in slots:
+                interpreter = slot[0]
+                if slot[1] != shape:
+                    interpreter.resize_tensor_input(self.input_index, shape)
+                    interpreter.allocate_tensors()
+                    slot[1] = shape
+                interpreter.set_tensor(self.input_index, batch)
+                interpreter.invoke()
+        finally:
+            for slot in slots:
+                self._pool.put(slot)
+
+    def predict(self, batch, verbose=0):
+        """Run a batch through one pooled interpreter and return the output array"""
+        batch = np.asarray(batch, dtype=self.input_dtype)
+        if batch.ndim == len(self.input_shape) - 1:
+            batch = batch[np.newaxis, ...]
+
+        slot = self._pool.get()
+        try:
+            interpreter = slot[0]
+
+            # Only reallocate when the batch shape changes, otherwise reuse the existing tensors
+            if slot[1] != batch.shape:
+                interpreter.resize_tensor_input(self.input_index, batch.shape)
+                interpreter.allocate_tensors()
+                slot[1] = batch.shape
+
+            interpreter.set_tensor(self.input_index, batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(self.output_index)
+        finally:
+            self._pool.put(slot)
+
+
+def measure_latency(model, runs=20):
+    """Median milliseconds for one single-image predict() after warm-up"""
+    batch = np.zeros((1,) + model.input_shape[1:], dtype=model.input_dtype)
+    model.warm_up()
+    timings = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        model.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def select_variant(candidates, latency_budget_ms=0, memory_budget_bytes=0, max_accuracy_drop=None,
+                   pool_size=TFLITE_POOL_SIZE, runs=20):
+    """
+    Pick the first candidate ({'name', 'path', optional 'accuracy_drop'}, in
+    order of preference) that meets the budgets on this machine. Each one is
+    timed with a single interpreter; when none fits, the fastest one that
+    loads is used. Returns (chosen candidate or None, one report per candidate).
+    """
+    reports = []
+    chosen = fastest = None
+    for candidate in candidates:
+        report = {'name': candidate['name'], 'path': candidate['path'], 'accuracy_drop': candidate.get('accuracy_drop')}
+        reports.append(report)
+        if not os.path.exists(candidate['path']):
+            report['status'] = 'missing'
+            continue
+        if max_accuracy_drop is not None and (candidate.get('accuracy_drop') or 0) > max_accuracy_drop:
+            report['status'] = 'over accuracy drop limit'
+            continue
+
+        try:
+            probe = TFLiteModel(candidate['path'], pool_size=1)
+            report['memory_bytes'] = probe.nbytes + (pool_size - 1) * probe._tensor_bytes
+            report['latency_ms'] = round(measure_latency(probe, runs), 3)
+        except Exception as e:
+            report['status'] = f'failed: {e}'
+            continue
+
+        if fastest is None or report['latency_ms'] < fastest[1]['latency_ms']:
+            fastest = (candidate, report)
+        if memory_budget_bytes and report['memory_bytes'] > memory_budget_bytes:
+            report['status'] = 'over memory budget'
+        elif latency_budget_ms and report['latency_ms'] > latency_budget_ms:
+            report['status'] = 'over latency budget'
+        else:
+            report['status'] = 'selected'
+            chosen = candidate
+            break
+
+    if chosen is None and fastest is not None:
+        chosen, report = fastest
+        report['status'] = 'selected (fastest, no variant fits the budget)'
+        logger.warning(f"No variant of {chosen['path']} fits the budget; using the fastest, {chosen['name']} "
+                       f"({report['latency_ms']:.1f} ms)")
+    return chosen, reports